@@ -46,13 +46,33 @@ __url__ = 'https://github.com/santigl/NBAStats'
 
 from . import config
 from . import plugin
+from . import nbastats
+from . import playbyplay
+from . import playersearch
+from . import scorediff
+from . import seasonstore
 from imp import reload
 # In case we're being reloaded.
 reload(config)
 reload(plugin)
 # Add more reloads here if you add third-party modules and want them to be
 # reloaded when this plugin is reloaded.  Don't forget to import them as well!
+reload(playbyplay)
+reload(playersearch)
+reload(scorediff)
 reload(nbastats)
+reload(seasonstore)
+
+# Modules imported when first needed are reloaded only if they were
+# imported (analytics and playoffodds require NumPy, and the others would
+# load the HTTP libraries at startup):
+import sys
+for name in ('analytics', 'mirrors', 'playoffodds', 'profiling', 'service',
+             'sharedcache'):
+    module = sys.modules.get('{}.{}'.format(__name__, name))
+    if module is not None:
+        reload(module)
+del name, module
 
 if world.testing:
     from . import test
@@ -0,0 +1,303 @@
+###
+# Vectorized per-player statistics over the locally stored box scores.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import json
+import math
+import os
+import struct
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional: the plugin falls back to plain SQL queries
+    # over the season store when it is not installed.
+    numpy = None
+
+try:
+    from .seasonstore import MIN_GAMES_FRACTION
+except ImportError: # Running as a script
+    from seasonstore import MIN_GAMES_FRACTION
+
+
+# On-disk format of a StatMatrix (see StatMatrix.save()):
+#   magic | header length (uint64 LE) | JSON header | arrays
+# Every array is stored little-endian and starts at a 64-byte boundary,
+# in this order: values (float32), game_index (int32), games_played (int32).
+_ARCHIVE_MAGIC = b'NBASTAT\x01'
+_ARCHIVE_PREAMBLE = struct.Struct('<8sQ')
+_ARCHIVE_ALIGNMENT = 64
+
+
+def isAvailable():
+    return numpy is not None
+
+
+def _align(offset):
+    return -(-offset // _ARCHIVE_ALIGNMENT) * _ARCHIVE_ALIGNMENT
+
+
+class StatMatrix():
+    """Columnar (players x games x stat columns) view of a season.
+
+    Each player's games are stored left-aligned and in chronological
+    order; slots after a player's last game are NaN.
+    """
+
+    def __init__(self, person_ids, team_ids, game_ids, columns,
+                 values, game_index, games_played, version=None):
+        self.person_ids = person_ids    # Row -> person id
+        self.team_ids = team_ids        # Row -> (latest) team id
+        self.game_ids = game_ids        # game_index value -> game id
+        self.columns = tuple(columns)
+
+        self.values = values            # float32 (players, games, columns)
+        self.game_index = game_index    # int32 (players, games), -1 = none
+        self.games_played = games_played # int32 (players,)
+
+        # Version of the data the matrix was built from (the number of
+        # stored games, see SeasonStore.gameCount()).
+        self.version = version
+
+        self._rows = {p: i for (i, p) in enumerate(person_ids)}
+        self._column_numbers = {c: i for (i, c) in enumerate(self.columns)}
+
+    @classmethod
+    def fromStore(cls, store):
+        """Build the matrix from a seasonstore.SeasonStore."""
+        if numpy is None:
+            raise RuntimeError('NumPy is required for player analytics')
+
+        version = store.gameCount()
+        columns = store.columns()
+        rows = store.playerGameRows()
+
+        if not rows:
+            shape = (0, 0, len(columns))
+            return cls([], [], [], columns,
+                       numpy.empty(shape, dtype=numpy.float32),
+                       numpy.empty(shape[:2], dtype=numpy.int32),
+                       numpy.empty(0, dtype=numpy.int32), version)
+
+        (person_column, team_column, game_column, _) = \
+            [numpy.array(c) for c in list(zip(*rows))[:4]]
+        stats = numpy.array([r[4:] for r in rows], dtype=numpy.float32)
+
+        # Rows come sorted by player, so each player is a contiguous run:
+        (person_ids, first_rows, player_of_row, games_played) = \
+            numpy.unique(person_column, return_index=True,
+                         return_inverse=True, return_counts=True)
+        slot_of_row = numpy.arange(len(rows)) - first_rows[player_of_row]
+
+        (game_ids, game_of_row) = numpy.unique(game_column,
+                                               return_inverse=True)
+
+        shape = (len(person_ids), int(games_played.max()), len(columns))
+        values = numpy.full(shape, numpy.nan, dtype=numpy.float32)
+        values[player_of_row, slot_of_row] = stats
+
+        game_index = numpy.full(shape[:2], -1, dtype=numpy.int32)
+        game_index[player_of_row, slot_of_row] = game_of_row
+
+        last_rows = first_rows + games_played - 1
+        return cls(person_ids.tolist(), team_column[last_rows].tolist(),
+                   game_ids.tolist(), columns, values, game_index,
+                   games_played.astype(numpy.int32), version)
+
+############################
+# Binary archive
+############################
+    def save(self, path):
+        """Write the matrix to a file that can be mapped with open().
+
+        The file is written next to its destination (under a unique
+        name, so concurrent writers do not mix) and then renamed, so
+        processes that have the previous version mapped keep reading a
+        consistent copy.
+        """
+        header = json.dumps({'version': self.version,
+                             'columns': self.columns,
+                             'shape': self.values.shape,
+                             'person_ids': self.person_ids,
+                             'team_ids': self.team_ids,
+                             'game_ids': self.game_ids}).encode('utf-8')
+
+        arrays = (self.values.astype('<f4'),
+                  self.game_index.astype('<i4'),
+                  self.games_played.astype('<i4'))
+
+        (directory, filename) = os.path.split(os.path.abspath(path))
+        (descriptor, temporary_path) = tempfile.mkstemp(
+            prefix=filename + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(_ARCHIVE_PREAMBLE.pack(_ARCHIVE_MAGIC, len(header)))
+                f.write(header)
+
+                for array in arrays:
+                    f.write(b'\0' * (_align(f.tell()) - f.tell()))
+                    f.write(numpy.ascontiguousarray(array).tobytes())
+
+            os.chmod(temporary_path, 0o644) # mkstemp() makes it private
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    @classmethod
+    def open(cls, path):
+        """Map a file written by save(). The arrays are read-only
+        views of the file, so nothing is copied and processes that
+        open the same file share its pages.
+        """
+        if numpy is None:
+            raise RuntimeError('NumPy is required for player analytics')
+
+        with open(path, 'rb') as f:
+            (magic, header_length) = _ARCHIVE_PREAMBLE.unpack(
+                f.read(_ARCHIVE_PREAMBLE.size))
+            if magic != _ARCHIVE_MAGIC:
+                raise ValueError('{} is not a stats archive'.format(path))
+            header = json.loads(f.read(header_length).decode('utf-8'))
+
+        shape = tuple(header['shape'])
+        offset = _ARCHIVE_PREAMBLE.size + header_length
+
+        arrays = []
+        for (dtype, array_shape) in (('<f4', shape), ('<i4', shape[:2]),
+                                     ('<i4', shape[:1])):
+            offset = _align(offset)
+            if 0 in array_shape: # mmap cannot map empty regions
+                array = numpy.empty(array_shape, dtype=dtype)
+            else:
+                array = numpy.memmap(path, dtype=dtype, mode='r',
+                                     offset=offset, shape=array_shape)
+            arrays.append(array)
+            offset += int(numpy.prod(array_shape)) * 4
+
+        return cls(header['person_ids'], header['team_ids'],
+                   header['game_ids'], header['columns'], *arrays,
+                   version=header['version'])
+
+    def __len__(self):
+        return len(self.person_ids)
+
+    def column(self, name):
+        """(players, games) array with the values of a stat column."""
+        try:
+            return self.values[:, :, self._column_numbers[name]]
+        except KeyError:
+            raise ValueError('Invalid stat category')
+
+############################
+# Per-player aggregates (one value per row)
+############################
+    def averages(self, name):
+        """Per-game averages of every player."""
+        totals = numpy.nansum(self.column(name), axis=1)
+        return totals / numpy.maximum(self.games_played, 1)
+
+    def lastGamesAverages(self, name, games):
+        """Averages over each player's last <games> games."""
+        return self._windowTotals(name, games) \
+               / numpy.maximum(self.windowGames(games), 1)
+
+    def per36(self, name, last_games=None):
+        """Per-36-minutes rates of every player (over their last
+        <last_games> games if given).
+        """
+        totals = self._windowTotals(name, last_games)
+        minutes = self._windowTotals('minutes', last_games)
+
+        return totals * 36 / numpy.maximum(minutes, 1)
+
+    def windowGames(self, last_games=None):
+        """Games of every player among their last <last_games>."""
+        if last_games is None:
+            return self.games_played
+        return numpy.minimum(self.games_played, last_games)
+
+    def _windowTotals(self, name, last_games=None):
+        column = self.column(name)
+        if last_games is not None:
+            slots = numpy.arange(self.values.shape[1])[numpy.newaxis, :]
+            first_slot = (self.games_played - last_games)[:, numpy.newaxis]
+            column = numpy.where(slots >= first_slot, column, 0)
+        return numpy.nansum(column, axis=1)
+
+    def playerAverages(self, person_id):
+        """Dictionary with all the per-game averages of a player."""
+        row = self._rows[person_id]
+        games = max(int(self.games_played[row]), 1)
+
+        averages = numpy.nansum(self.values[row], axis=0) / games
+        result = dict(zip(self.columns, averages.tolist()))
+        result['games'] = int(self.games_played[row])
+        return result
+
+############################
+# Rankings
+############################
+    def top(self, scores, count=5, min_games=1):
+        """Return a list of (person_id, score, games played) with the
+        <count> best scores among the players with at least
+        <min_games> games.
+        """
+        scores = numpy.where(self.games_played >= min_games, scores,
+                             -numpy.inf)
+        count = min(count, int(numpy.isfinite(scores).sum()))
+        if count == 0:
+            return []
+
+        # Unordered top <count>, then sort just those:
+        best = numpy.argpartition(-scores, count - 1)[:count]
+        best = best[numpy.argsort(-scores[best], kind='stable')]
+
+        return [(self.person_ids[i], float(scores[i]),
+                 int(self.games_played[i])) for i in best]
+
+    # Players are only ranked by per-36 rates with at least this many
+    # minutes per game:
+    MIN_PER36_MINUTES = 15
+
+    def leaders(self, name, count=5, last_games=None, per_36=False,
+                min_games=None):
+        """League leaders in a stat column, by per-game average or
+        per-36 rate, over the season or each player's last
+        <last_games> games.
+
+        Only the players with at least <min_games> games (by default,
+        MIN_GAMES_FRACTION of the most played by anyone) in those
+        games are ranked, and with per_36, only those who played
+        MIN_PER36_MINUTES per game.
+        """
+        games = self.windowGames(last_games)
+        if min_games is None:
+            most = int(games.max()) if len(games) else 0
+            min_games = max(math.ceil(MIN_GAMES_FRACTION * most), 1)
+        qualified = games >= min_games
+
+        if per_36:
+            scores = self.per36(name, last_games)
+            minutes = self._windowTotals('minutes', last_games)
+            qualified &= minutes >= self.MIN_PER36_MINUTES * games
+        else:
+            scores = self._windowTotals(name, last_games) \
+                     / numpy.maximum(games, 1)
+
+        return self.top(numpy.where(qualified, scores, -numpy.inf), count)
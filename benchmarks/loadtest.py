@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+###
+# Load test for the NBAStats plugin: many simulated users sending
+# commands at the same time, against a local stub of data.nba.net.
+#
+# Every command runs in its own thread, as Limnoria does for threaded
+# plugins. Reports throughput, reply latency percentiles (per command
+# and overall), the requests the stub got and the peak thread count.
+#
+#   python3 benchmarks/loadtest.py [--users N] [--commands N]
+#                                  [--latency S] [--errors P] [--json]
+###
+
+import argparse
+import atexit
+import importlib.util
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from collections import defaultdict
+
+import stubserver
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Commands (with their arguments: 'team' is a team in a live game,
+# 'any_team' any team) and how often users send them.
+COMMANDS = (('leaders', ['any_team'], 3),
+            ('record', ['any_team'], 3),
+            ('gameleaders', ['team'], 3),
+            ('oncourt', ['team'], 2),
+            ('fouls', ['team'], 2),
+            ('standings', [], 2),
+            ('playoffs', [], 1))
+
+
+def loadPlugin(api_server):
+    """Import the plugin package (as NBAStats) and return a plugin
+    instance whose getter queries api_server. The bot's directories
+    are set to a temporary one.
+    """
+    import supybot.conf as conf
+
+    directory = tempfile.mkdtemp(prefix='nbastats-benchmark-')
+    atexit.register(shutil.rmtree, directory, True)
+    for name in ('conf', 'data', 'backup', 'log'):
+        os.mkdir(os.path.join(directory, name))
+        conf.supybot.directories.get(name).setValue(
+            os.path.join(directory, name))
+    conf.supybot.directories.data.tmp.setValue(
+        os.path.join(directory, 'data', 'tmp'))
+    for database in ('users', 'channels', 'networks'):
+        open(os.path.join(directory, 'conf', database + '.conf'), 'w').close()
+
+    spec = importlib.util.spec_from_file_location(
+        'NBAStats', os.path.join(PLUGIN_DIR, '__init__.py'),
+        submodule_search_locations=[PLUGIN_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['NBAStats'] = package
+    spec.loader.exec_module(package)
+
+    plugin = package.plugin.NBAStats(FakeIrc())
+    plugin._stats_getter = package.nbastats.NBAStatsGetter(
+        api_server=api_server)
+    return plugin
+
+
+class FakeIrc():
+    """Collects the replies of a command."""
+
+    network = 'loadtest'
+    nick = 'NBAStats'
+    prefix = 'NBAStats!nbastats@loadtest.example'
+
+    def __init__(self):
+        self.replies = []
+
+    def reply(self, s, **kwargs):
+        self.replies.append(s)
+
+    def error(self, s='', **kwargs):
+        self.replies.append('Error: ' + s)
+
+    def replySuccess(self, s='', **kwargs):
+        self.replies.append(s)
+
+    def isChannel(self, s):
+        return s.startswith('#')
+
+
+class LoadTest():
+    def __init__(self, plugin, live_teams, users, channels, commands,
+                 think_time, seed=0):
+        self._plugin = plugin
+        self._live_teams = live_teams
+        self._users = users
+        self._channels = channels
+        self._commands = commands
+        self._think_time = think_time
+        self._seed = seed
+
+        self.latencies = defaultdict(list) # command -> seconds
+        self.errors = defaultdict(int)     # command -> exceptions
+        self.max_threads = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        users = [threading.Thread(target=self._user, args=(n,))
+                 for n in range(self._users)]
+
+        start = time.perf_counter()
+        for user in users:
+            user.start()
+
+        while any(user.is_alive() for user in users):
+            self._sampleThreads()
+            time.sleep(0.01)
+        return time.perf_counter() - start
+
+    def _sampleThreads(self):
+        with self._lock:
+            self.max_threads = max(self.max_threads, threading.active_count())
+
+    def _user(self, number):
+        import supybot.ircmsgs as ircmsgs
+
+        rng = random.Random('{}-{}'.format(self._seed, number))
+        nick = 'user{}'.format(number)
+        channel = '#channel{}'.format(number % self._channels)
+
+        names = [c for (c, _, _) in COMMANDS]
+        weights = [w for (_, _, w) in COMMANDS]
+        teams = stubserver.ALL_TRICODES
+
+        for _ in range(self._commands):
+            (name, specs, _) = COMMANDS[names.index(
+                rng.choices(names, weights)[0])]
+            args = [rng.choice(self._live_teams) if s == 'team'
+                    else rng.choice(teams) for s in specs]
+
+            msg = ircmsgs.privmsg(channel, ' '.join([name] + args),
+                                  prefix='{0}!{0}@loadtest'.format(nick))
+            self._runCommand(name, msg, args)
+
+            if self._think_time:
+                time.sleep(rng.expovariate(1 / self._think_time))
+
+    def _runCommand(self, name, msg, args):
+        """Run a command in its own thread and wait for its replies."""
+        irc = FakeIrc()
+        failed = []
+
+        def run():
+            try:
+                getattr(self._plugin, name)(irc, msg, list(args))
+            except Exception:
+                failed.append(True)
+
+        start = time.perf_counter()
+        thread = threading.Thread(target=run)
+        thread.start()
+        self._sampleThreads()
+        thread.join()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if failed or not irc.replies \
+               or irc.replies[0].startswith('Error: '):
+                self.errors[name] += 1
+
+
+def percentiles(values):
+    """(p50, p95, p99) of a list of values."""
+    if len(values) < 2:
+        return tuple(values * 3) if values else (0, 0, 0)
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return (cuts[49], cuts[94], cuts[98])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test the NBAStats commands.')
+    parser.add_argument('--users', type=int, default=50,
+                        help='simulated users sending commands at once')
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--commands', type=int, default=20,
+                        help='commands sent by each user')
+    parser.add_argument('--think-time', type=float, default=0,
+                        help='mean seconds between commands of a user')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every upstream response')
+    parser.add_argument('--errors', type=float, default=0,
+                        help='fraction of upstream requests that fail')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    options = parser.parse_args()
+
+    # Every game tipped off at once and is in the third quarter:
+    league = stubserver.League(playoffs=True, stagger=0, seed=options.seed)
+    league.advance(2 * stubserver.PERIOD_SECONDS + 100)
+    server = stubserver.StubServer(latency=options.latency,
+                                   error_rate=options.errors, league=league,
+                                   seed=options.seed).start()
+
+    plugin = loadPlugin(server.url)
+    live_teams = [t[1] for game in league.games(stubserver.ANCHOR_DATE)
+                  for t in game[1:3]]
+
+    test = LoadTest(plugin, live_teams, options.users, options.channels,
+                    options.commands, options.think_time, options.seed)
+    duration = test.run()
+    server.stop()
+
+    all_latencies = [l for ls in test.latencies.values() for l in ls]
+    results = {
+        'commands': len(all_latencies),
+        'errors': sum(test.errors.values()),
+        'seconds': duration,
+        'throughput': len(all_latencies) / duration,
+        'latency': dict(zip(('p50', 'p95', 'p99'),
+                            percentiles(all_latencies))),
+        'per_command': {
+            name: dict(zip(('count', 'errors', 'p50', 'p95', 'p99'),
+                           (len(ls), test.errors[name]) + percentiles(ls)))
+            for (name, ls) in sorted(test.latencies.items())},
+        'upstream_requests': server.totalRequests(),
+        'upstream_by_endpoint': dict(server.requests),
+        'max_threads': test.max_threads,
+    }
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print('{commands} commands in {seconds:.2f}s: {throughput:.1f} commands/s, '
+          '{errors} errors'.format(**results))
+    print('Latency: p50 {p50:.1f} ms, p95 {p95:.1f} ms, '
+          'p99 {p99:.1f} ms'.format(**{k: v * 1000 for (k, v)
+                                       in results['latency'].items()}))
+    for (name, r) in results['per_command'].items():
+        print('  {:12} {:5} runs {:4} errors   p50 {:7.1f}  p95 {:7.1f}  '
+              'p99 {:7.1f} ms'.format(name, r['count'], r['errors'],
+                                      r['p50'] * 1000, r['p95'] * 1000,
+                                      r['p99'] * 1000))
+    print('Upstream requests: {}'.format(results['upstream_requests']))
+    for (endpoint, count) in sorted(server.requests.items()):
+        print('  {:28} {}'.format(endpoint, count))
+    print('Peak threads: {}'.format(results['max_threads']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+###
+# Memory benchmark for the NBAStats plugin: replays a whole game night
+# (ten games, from before the first tip-off until every game is final)
+# through NBAStatsGetter and the plugin's commands and announcements.
+#
+# The scoreboard and the box scores of the live games are fetched at
+# every step of the night, as the subscriptions poller does, and the
+# commands users send during games are run on them. tracemalloc
+# snapshots are taken at intervals. Reports peak and retained memory,
+# the part of the retained memory allocated for the caches and for the
+# parsed indexes, and the transient allocations. Exits with status 1 if
+# the retained memory is over the budget.
+#
+#   python3 benchmarks/memory.py [--step S] [--interval N] [--budget MB]
+#                                [--frames N] [--json]
+###
+
+import argparse
+import gc
+import inspect
+import json
+import multiprocessing
+import os
+import sys
+import tracemalloc
+
+import loadtest
+import stubserver
+
+# Commands run for every team in a live game at each step, and those
+# run for them (and standings) once per snapshot interval.
+LIVE_COMMANDS = ('gameleaders', 'oncourt', 'fouls')
+INTERVAL_COMMANDS = ('leaders', 'record')
+
+_MB = 1024 * 1024
+
+# Whatever is allocated while importing a module (at any depth):
+_IMPORT_FILTERS = (tracemalloc.Filter(False, '<frozen importlib._bootstrap>',
+                                      all_frames=True),
+                   tracemalloc.Filter(False,
+                                      '<frozen importlib._bootstrap_external>',
+                                      all_frames=True))
+
+
+def serveLeague(connection):
+    """Run a stub server in a child process (so that its allocations
+    are not traced), advancing its league's clock on request.
+    """
+    # The night is replayed faster than real time, so the documents
+    # that change during games are never fresh for long:
+    server = stubserver.StubServer(league=stubserver.League(),
+                                   live_max_age=0)
+    server.start()
+    connection.send(server.url)
+
+    for seconds in iter(connection.recv, None):
+        server.league.advance(seconds)
+        connection.send(server.league.clock)
+    server.stop()
+
+
+class Classifier():
+    """Classifies allocations as 'caches' (the HTTP cache, the caches of
+    documents and the parsed documents) or 'indexes' (the structures
+    parsed from them, and the scoreboard differ) by their tracebacks:
+    the most recent frame that is in the code of either decides. The
+    rest are 'other'.
+    """
+
+    def __init__(self, nbastats):
+        self._files = [('caches', os.sep + 'cachecontrol' + os.sep),
+                       ('caches', os.sep + 'msgpack' + os.sep),
+                       ('caches', os.path.join('json', 'decoder.py')),
+                       ('indexes', 'playersearch.py'),
+                       ('indexes', 'playbyplay.py'),
+                       ('indexes', 'scorediff.py')]
+
+        # (category, file name, first line, last line):
+        self._classes = []
+        for (category, classes) in (
+                ('caches', (nbastats.ImmutableJSONCache,
+                            nbastats.ExpiringJSONCache)),
+                ('indexes', (nbastats.TeamIndex, nbastats.PlayerIndex,
+                             nbastats.SeasonSchedule,
+                             nbastats.PlayoffBracket))):
+            for cls in classes:
+                (lines, first) = inspect.getsourcelines(cls)
+                self._classes.append((category, inspect.getsourcefile(cls),
+                                      first, first + len(lines) - 1))
+
+    def category(self, traceback):
+        for frame in reversed(traceback): # Most recent first
+            for (category, part) in self._files:
+                if part in frame.filename:
+                    return category
+            for (category, filename, first, last) in self._classes:
+                if frame.filename == filename \
+                   and first <= frame.lineno <= last:
+                    return category
+        return 'other'
+
+
+def pluginFrame(traceback):
+    """The most recent frame of a traceback in the plugin's code (the
+    call that led to the allocation), or the most recent one if none.
+    """
+    for frame in reversed(traceback):
+        if frame.filename.startswith(loadtest.PLUGIN_DIR + os.sep) \
+           and os.sep + 'benchmarks' + os.sep not in frame.filename:
+            return frame
+    return traceback[-1]
+
+
+def retainedSites(snapshot, baseline):
+    """List of (frame, size, size difference) of the retained
+    allocations, grouped by pluginFrame(), biggest first.
+    """
+    sizes = dict()
+    for trace in snapshot.traces:
+        frame = pluginFrame(trace.traceback)
+        sizes[frame] = sizes.get(frame, 0) + trace.size
+
+    sizes_before = dict()
+    for trace in baseline.traces:
+        frame = pluginFrame(trace.traceback)
+        sizes_before[frame] = sizes_before.get(frame, 0) + trace.size
+
+    return sorted(((frame, size, size - sizes_before.get(frame, 0))
+                   for (frame, size) in sizes.items()),
+                  key=lambda site: -site[1])
+
+
+class GameNight():
+    def __init__(self, plugin, connection, step, interval):
+        self._plugin = plugin
+        self._getter = plugin._stats_getter
+        self._connection = connection
+        self._step = step
+        self._interval = interval
+
+        self.samples = [] # (clock, live games, current, peak) in bytes
+        self.announcements = 0
+        self.replies = 0
+
+        plugin._scoreboard_differ.addListener(self._announce)
+
+    def run(self):
+        """Replay the night. Returns the number of steps."""
+        steps = 0
+        while True:
+            clock = self._advance(self._step if steps else 0)
+            games = self._poll()
+            self._runCommands('scores', [[]])
+
+            live_teams = [[t] for g in games if self._isLive(g)
+                          for t in (g['home_team'], g['away_team'])]
+            for name in LIVE_COMMANDS:
+                self._runCommands(name, live_teams)
+
+            if steps % self._interval == 0:
+                for name in INTERVAL_COMMANDS:
+                    self._runCommands(name, live_teams)
+                self._runCommands('standings', [[]])
+                self._sample(clock, len(live_teams) // 2)
+
+            steps += 1
+            if games and all(g['ended'] for g in games):
+                return steps
+
+    def _advance(self, seconds):
+        self._connection.send(seconds)
+        return self._connection.recv()
+
+    def _isLive(self, game):
+        return game['period']['current'] > 0 and not game['ended']
+
+    def _poll(self):
+        """What the subscriptions poller does for every game."""
+        games = self._getter.scoreboard()
+        self._plugin._scoreboard_differ.updateScoreboard(games)
+        for game in filter(self._isLive, games):
+            box_score = self._getter.boxScore(game['start_date'],
+                                              game['game_id'])
+            self._plugin._scoreboard_differ.updateBoxScore(game['game_id'],
+                                                           box_score)
+        return games
+
+    def _announce(self, events):
+        self.announcements += sum(
+            1 for e in events if self._plugin._eventAnnouncement(e))
+
+    def _runCommands(self, name, arguments):
+        import supybot.ircmsgs as ircmsgs
+
+        for args in arguments:
+            irc = loadtest.FakeIrc()
+            msg = ircmsgs.privmsg('#memory', name,
+                                  prefix='user!user@memory.example')
+            getattr(self._plugin, name)(irc, msg, list(args))
+            if not irc.replies or irc.replies[0].startswith('Error: '):
+                raise RuntimeError('{} {} failed: {}'.format(name, args,
+                                                             irc.replies))
+            self.replies += len(irc.replies)
+
+    def _sample(self, clock, live_games):
+        gc.collect()
+        (current, peak) = tracemalloc.get_traced_memory()
+        self.samples.append((clock, live_games, current, peak))
+        tracemalloc.reset_peak()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the memory used during a game night.')
+    parser.add_argument('--step', type=int, default=300,
+                        help='seconds of game time between polls')
+    parser.add_argument('--interval', type=int, default=4,
+                        help='polls between snapshots')
+    parser.add_argument('--budget', type=float, default=8,
+                        help='maximum retained memory, in MB')
+    parser.add_argument('--top', type=int, default=10,
+                        help='allocation sites listed')
+    parser.add_argument('--frames', type=int, default=16,
+                        help='frames traced per allocation; they must reach '
+                             "the plugin's code to classify it (more frames "
+                             'slow down the night)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    options = parser.parse_args()
+
+    (connection, child_connection) = multiprocessing.Pipe()
+    stub = multiprocessing.Process(target=serveLeague,
+                                   args=(child_connection,), daemon=True)
+    stub.start()
+    url = connection.recv()
+
+    # The imports and the plugin instance are not part of the night:
+    plugin = loadtest.loadPlugin(url)
+    plugin._stats_getter._session()
+    import supybot.ircmsgs
+    gc.collect()
+    tracemalloc.start(options.frames)
+    baseline = tracemalloc.take_snapshot().filter_traces(_IMPORT_FILTERS)
+
+    night = GameNight(plugin, connection, options.step, options.interval)
+    steps = night.run()
+    gc.collect()
+
+    # Whatever was imported lazily during the night is not counted:
+    snapshot = tracemalloc.take_snapshot().filter_traces(_IMPORT_FILTERS)
+    retained = sum(t.size for t in snapshot.traces)
+    peak = max(s[3] for s in night.samples)
+    tracemalloc.stop()
+    connection.send(None)
+    stub.join()
+
+    classifier = Classifier(sys.modules[type(plugin._stats_getter).__module__])
+    categories = {'caches': 0, 'indexes': 0, 'other': 0}
+    for trace in snapshot.traces:
+        categories[classifier.category(trace.traceback)] += trace.size
+    (caches, indexes) = (categories['caches'], categories['indexes'])
+    sites = retainedSites(snapshot, baseline)[:options.top]
+
+    results = {
+        'steps': steps,
+        'replies': night.replies,
+        'announcements': night.announcements,
+        'peak': peak,
+        'retained': retained,
+        'retained_caches': caches,
+        'retained_indexes': indexes,
+        'retained_other': categories['other'],
+        'transient': peak - retained,
+        'budget': int(options.budget * _MB),
+        'samples': [dict(zip(('clock', 'live_games', 'current', 'peak'), s))
+                    for s in night.samples],
+        'top_sites': [{'file': frame.filename, 'line': frame.lineno,
+                       'size': size, 'size_diff': size_diff}
+                      for (frame, size, size_diff) in sites],
+    }
+    over_budget = retained > results['budget']
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return 1 if over_budget else 0
+
+    print('{steps} polls, {replies} replies, {announcements} '
+          'announcements'.format(**results))
+    print('Peak {:.2f} MB, retained {:.2f} MB (budget {:.2f} MB)'.format(
+        peak / _MB, retained / _MB, options.budget))
+    print('  caches     {:8.2f} MB'.format(caches / _MB))
+    print('  indexes    {:8.2f} MB'.format(indexes / _MB))
+    print('  other      {:8.2f} MB'.format(results['retained_other'] / _MB))
+    print('  transient  {:8.2f} MB'.format(results['transient'] / _MB))
+    print('Snapshots (game clock, live games, current, peak since last):')
+    for s in night.samples:
+        print('  {:6}s {:3}   {:8.2f} MB {:8.2f} MB'.format(
+            s[0], s[1], s[2] / _MB, s[3] / _MB))
+    print('Top allocation sites (retained, growth during the night):')
+    for s in results['top_sites']:
+        print('  {:8.2f} MB {:+8.2f} MB  {}:{}'.format(
+            s['size'] / _MB, s['size_diff'] / _MB, s['file'], s['line']))
+
+    if over_budget:
+        print('Retained memory is over the budget')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
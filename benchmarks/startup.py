@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+###
+# Startup-time benchmark for the NBAStats plugin: how long it takes to
+# import nbastats, build an NBAStatsGetter and run a first command.
+#
+# Every sample runs in a fresh interpreter so the import is really cold.
+#
+#   python3 benchmarks/startup.py [--runs N] [--no-network] [--team TTT]
+#                                 [--api-server URL]
+#
+# --api-server points the first command at another server, such as
+# benchmarks/stubserver.py, so that it can be measured offline.
+###
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a child interpreter; prints a JSON dict of timings.
+_SAMPLE = """
+import json, sys, time
+sys.path.insert(0, {plugin_dir!r})
+
+t0 = time.perf_counter()
+import nbastats
+t1 = time.perf_counter()
+getter = nbastats.NBAStatsGetter(api_server={api_server!r})
+t2 = time.perf_counter()
+
+timings = {{'import': t1 - t0, 'init': t2 - t1}}
+if {network!r}:
+    getter.teamRecord({team!r})
+    timings['first_command'] = time.perf_counter() - t2
+
+timings['http_stack_loaded'] = 'requests' in sys.modules
+print(json.dumps(timings))
+"""
+
+
+def sample(network, team, api_server):
+    code = _SAMPLE.format(plugin_dir=PLUGIN_DIR, network=network, team=team,
+                          api_server=api_server)
+    return json.loads(subprocess.check_output([sys.executable, '-c', code]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure NBAStats import, init and first command time.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--no-network', action='store_true',
+                        help='only measure import and __init__')
+    parser.add_argument('--team', default='LAL')
+    parser.add_argument('--api-server', default='https://data.nba.net',
+                        metavar='URL',
+                        help='server of the documents (e.g. a stub server)')
+    options = parser.parse_args()
+
+    samples = [sample(not options.no_network, options.team,
+                      options.api_server)
+               for _ in range(options.runs)]
+
+    for phase in ('import', 'init', 'first_command'):
+        values = [s[phase] for s in samples if phase in s]
+        if not values:
+            continue
+        print('{:<14} median {:8.2f} ms   max {:8.2f} ms'.format(
+            phase, statistics.median(values) * 1000, max(values) * 1000))
+
+    if options.no_network and any(s['http_stack_loaded'] for s in samples):
+        print('warning: requests was imported before the first command')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
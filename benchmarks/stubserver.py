@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+###
+# Local stand-in for data.nba.net, for the benchmarks.
+#
+# Serves a synthetic (but deterministic) league with every document the
+# plugin reads, with configurable latency and error rate, and counts the
+# requests it gets. Today's games progress with a simulated clock, so a
+# whole game night can be replayed.
+#
+#   python3 benchmarks/stubserver.py [--port N] [--latency S] [--errors P]
+###
+
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+SEASON_YEAR = 2016
+ANCHOR_DATE = datetime.date(2017, 3, 1)
+
+_CONFERENCES = {
+    'east': {'atlantic': ('BOS', 'BKN', 'NYK', 'PHI', 'TOR'),
+             'central': ('CHI', 'CLE', 'DET', 'IND', 'MIL'),
+             'southeast': ('ATL', 'CHA', 'MIA', 'ORL', 'WAS')},
+    'west': {'northwest': ('DEN', 'MIN', 'OKC', 'POR', 'UTA'),
+             'pacific': ('GSW', 'LAC', 'LAL', 'PHX', 'SAC'),
+             'southwest': ('DAL', 'HOU', 'MEM', 'NOP', 'SAS')}}
+
+ALL_TRICODES = tuple(sorted(t for divisions in _CONFERENCES.values()
+                            for tricodes in divisions.values()
+                            for t in tricodes))
+
+PLAYERS_PER_TEAM = 15
+PERIOD_SECONDS = 720
+
+_STAT_FIELDS = ('points', 'fgm', 'fga', 'ftm', 'fta', 'tpm', 'tpa', 'offReb',
+                'defReb', 'totReb', 'assists', 'steals', 'blocks',
+                'turnovers', 'pFouls', 'plusMinus')
+
+
+class League():
+    """Synthetic league: 30 teams, their rosters and standings, and
+    the games of every date. Today's games (ANCHOR_DATE) start
+    staggered and advance with the clock (seconds of game time since
+    the first tip-off).
+    """
+
+    def __init__(self, games_per_night=10, seed=0, playoffs=False,
+                 stagger=600):
+        self._games_per_night = games_per_night
+        self._seed = seed
+        self._stagger = stagger # Seconds between tip-offs
+        self.playoffs = playoffs
+        self.clock = 0
+
+        self.teams = []      # (team id, tricode, conference, division)
+        for (conference, divisions) in sorted(_CONFERENCES.items()):
+            for (division, tricodes) in sorted(divisions.items()):
+                for tricode in tricodes:
+                    team_id = str(1610612737 + len(self.teams))
+                    self.teams.append((team_id, tricode, conference,
+                                       division))
+
+        self.players = [] # (person id, first name, last name, team id)
+        for (i, (team_id, tricode, _, _)) in enumerate(self.teams):
+            for j in range(PLAYERS_PER_TEAM):
+                self.players.append((str(200000 + i * 100 + j),
+                                     'First{}{}'.format(tricode, j),
+                                     'Last{}{}'.format(tricode, j), team_id))
+
+        rng = random.Random(seed)
+        self.records = {t[0]: rng.randint(15, 45) for t in self.teams}
+
+    def advance(self, seconds):
+        self.clock += seconds
+
+    def roster(self, team_id):
+        return [p for p in self.players if p[3] == team_id]
+
+    def games(self, date):
+        """Games of a date as (game id, home team, away team, start
+        offset in seconds of today's clock).
+        """
+        rng = random.Random('{}{}'.format(self._seed, date))
+        teams = list(self.teams)
+        rng.shuffle(teams)
+
+        games = []
+        for i in range(self._games_per_night):
+            game_id = '002{:02d}{}{:02d}'.format(date.month, date.day, i)
+            games.append((game_id, teams[2 * i], teams[2 * i + 1],
+                          i * self._stagger))
+        return games
+
+    def gameState(self, date, game):
+        """Return (status num, period, elapsed seconds, is end of
+        period) for a game of a date.
+        """
+        if date < ANCHOR_DATE:
+            return (3, 4, 4 * PERIOD_SECONDS, True)
+        if date > ANCHOR_DATE:
+            return (1, 0, 0, False)
+
+        elapsed = self.clock - game[3]
+        if elapsed <= 0:
+            return (1, 0, 0, False)
+        if elapsed >= 4 * PERIOD_SECONDS + 300: # Plus breaks
+            return (3, 4, 4 * PERIOD_SECONDS, True)
+
+        elapsed = min(elapsed, 4 * PERIOD_SECONDS)
+        period = min(elapsed // PERIOD_SECONDS + 1, 4)
+        end_of_period = elapsed == 4 * PERIOD_SECONDS \
+                        or (elapsed % PERIOD_SECONDS) > PERIOD_SECONDS - 20
+        return (2, period, elapsed, end_of_period)
+
+    def playerLines(self, date, game):
+        """Box score lines of both teams, scaled to the elapsed time."""
+        (_, _, elapsed, _) = self.gameState(date, game)
+        fraction = elapsed / (4 * PERIOD_SECONDS)
+        minute = int(elapsed // 60)
+
+        lines = []
+        for team in (game[1], game[2]):
+            for (n, player) in enumerate(self.roster(team[0])):
+                rng = random.Random('{}{}'.format(game[0], player[0]))
+                totals = {f: rng.randint(0, 12) for f in _STAT_FIELDS}
+                totals['pFouls'] = rng.randint(0, 6)
+                line = {f: str(int(v * fraction)) for (f, v) in totals.items()}
+
+                minutes = int(rng.randint(0, 40) * fraction)
+                line.update({'personId': player[0], 'teamId': team[0],
+                             'min': '{}:00'.format(minutes) if minutes else '',
+                             'isOnCourt': elapsed > 0
+                                          and (n + minute) % 3 == 0
+                                          and n < 15})
+                lines.append(line)
+        return lines
+
+    def scores(self, date, game):
+        lines = self.playerLines(date, game)
+        return [sum(int(l['points']) for l in lines if l['teamId'] == t[0])
+                for t in (game[1], game[2])]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, every
+    # response on a kept-alive connection waits for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.countRequest(self.path)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.error_rate and server.random() < server.error_rate:
+            server.countInjectedError()
+            self._send(503, b'{}', 0)
+            return
+
+        (max_age, path) = (10, self.path)
+        match = re.match(r'/(10s|15m)(/.*)', path)
+        if match:
+            (max_age, path) = (10 if match.group(1) == '10s' else 900,
+                               match.group(2))
+        if max_age == 10 and server.live_max_age is not None:
+            max_age = server.live_max_age
+
+        try:
+            document = server.document(path)
+        except KeyError:
+            self._send(404, b'{}', 0)
+            return
+
+        self._send(200, json.dumps(document).encode('utf-8'), max_age)
+
+    def _send(self, status, body, max_age):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'max-age={}'.format(max_age))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """data.nba.net stand-in serving a League. Use start() and stop(),
+    and url as the getter's api_server.
+    """
+
+    daemon_threads = True
+
+    # Key of self.requests counting the failures that were injected.
+    INJECTED_ERRORS = '(injected errors)'
+
+    def __init__(self, port=0, latency=0, error_rate=0, league=None,
+                 seed=0, live_max_age=None):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        # Overrides the max-age (10 seconds) of the documents that
+        # change during games:
+        self.live_max_age = live_max_age
+        self.league = league or League(seed=seed)
+
+        self.requests = Counter() # Endpoint -> number of requests
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def countRequest(self, path):
+        with self._lock:
+            self.requests[self.endpoint(path)] += 1
+
+    def countInjectedError(self):
+        with self._lock:
+            self.requests[self.INJECTED_ERRORS] += 1
+
+    def endpoint(self, path):
+        """Name of the document a path refers to ('scoreboard',
+        'boxScore'...).
+        """
+        path = re.sub(r'^/(10s|15m)/', '/', path.split('?')[0])
+        if path == '/prod/v1/today.json':
+            return 'today'
+        for (pattern, method) in self._ROUTES:
+            if re.fullmatch(pattern, path):
+                return method.lstrip('_')
+        return path
+
+    def totalRequests(self):
+        with self._lock:
+            return sum(c for (e, c) in self.requests.items()
+                       if e != self.INJECTED_ERRORS)
+
+############################
+# Documents
+############################
+    def document(self, path):
+        if path == '/prod/v1/today.json':
+            return self._today()
+
+        for (pattern, method) in self._ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match:
+                return getattr(self, method)(*match.groups())
+
+        raise KeyError(path)
+
+    _ROUTES = ((r'/prod/v1/(\d{8})/scoreboard\.json', '_scoreboard'),
+               (r'/prod/v1/(\d{8})/(\w+)_boxscore\.json', '_boxScore'),
+               (r'/prod/v1/(\d{8})/(\w+)_pbp_(\d)\.json', '_playByPlay'),
+               (r'/prod/v1/\d{4}/teams\.json', '_teams'),
+               (r'/prod/v1/\d{4}/players\.json', '_players'),
+               (r'/prod/v1/\d{4}/players/(\d+)_profile\.json',
+                '_playerProfile'),
+               (r'/prod/v1/\d{4}/teams/(\d+)/leaders\.json', '_teamLeaders'),
+               (r'/prod/v1/current/standings_all_no_sort_keys\.json',
+                '_standings'),
+               (r'/prod/v1/current/standings_conference\.json',
+                '_conferenceStandings'),
+               (r'/prod/v1/current/standings_division\.json',
+                '_divisionStandings'),
+               (r'/prod/v1/\d{4}/schedule\.json', '_schedule'),
+               (r'/prod/v1/\d{4}/playoffsBracket\.json', '_playoffBracket'))
+
+    def _today(self):
+        anchor = ANCHOR_DATE.strftime('%Y%m%d')
+        links = {
+            'anchorDate': anchor,
+            'todayScoreboard': '/prod/v1/{}/scoreboard.json'.format(anchor),
+            'scoreboard': '/prod/v1/{{gameDate}}/scoreboard.json',
+            'boxscore': '/prod/v1/{{gameDate}}/{{gameId}}_boxscore.json',
+            'pbp': '/prod/v1/{{gameDate}}/{{gameId}}_pbp_{{periodNum}}.json',
+            'teams': '/10s/prod/v1/{}/teams.json'.format(SEASON_YEAR),
+            'leagueRosterPlayers':
+                '/10s/prod/v1/{}/players.json'.format(SEASON_YEAR),
+            'playerProfile':
+                '/10s/prod/v1/{}/players/{{{{personId}}}}_profile.json'.format(
+                    SEASON_YEAR),
+            'teamLeaders':
+                '/10s/prod/v1/{}/teams/{{{{teamUrlCode}}}}/leaders.json'.format(
+                    SEASON_YEAR),
+            'leagueUngroupedStandings':
+                '/10s/prod/v1/current/standings_all_no_sort_keys.json',
+            'leagueConfStandings':
+                '/10s/prod/v1/current/standings_conference.json',
+            'leagueDivStandings':
+                '/10s/prod/v1/current/standings_division.json',
+            'leagueSchedule': '/10s/prod/v1/{}/schedule.json'.format(SEASON_YEAR)}
+        if self.league.playoffs:
+            links['playoffsBracket'] = \
+                '/10s/prod/v1/{}/playoffsBracket.json'.format(SEASON_YEAR)
+
+        return {'anchorDate': anchor, 'seasonScheduleYear': str(SEASON_YEAR),
+                'links': links}
+
+    def _date(self, string):
+        return datetime.datetime.strptime(string, '%Y%m%d').date()
+
+    def _scoreboard(self, date_string):
+        date = self._date(date_string)
+        games = []
+        for game in self.league.games(date):
+            (status, period, elapsed, end) = self.league.gameState(date, game)
+            (home_score, away_score) = self.league.scores(date, game) \
+                                       if status > 1 else ('', '')
+            remaining = PERIOD_SECONDS - elapsed % PERIOD_SECONDS \
+                        if status == 2 and not end else 0
+            games.append({
+                'gameId': game[0], 'statusNum': status,
+                'startDateEastern': date_string,
+                'startTimeEastern': '{}:00 PM ET'.format(7 + game[3] // 3600),
+                'clock': '{}:{:02d}'.format(remaining // 60, remaining % 60)
+                         if remaining else '',
+                'period': {'current': period, 'isEndOfPeriod': end,
+                           'isHalftime': status == 2 and period == 2 and end},
+                'hTeam': {'teamId': game[1][0], 'triCode': game[1][1],
+                          'score': str(home_score)},
+                'vTeam': {'teamId': game[2][0], 'triCode': game[2][1],
+                          'score': str(away_score)},
+                'nugget': {'text': ''}})
+        return {'games': games}
+
+    def _findGame(self, date, game_id):
+        for game in self.league.games(date):
+            if game[0] == game_id:
+                return game
+        raise KeyError(game_id)
+
+    def _boxScore(self, date_string, game_id):
+        date = self._date(date_string)
+        game = self._findGame(date, game_id)
+        lines = self.league.playerLines(date, game)
+
+        stats = {'activePlayers': lines}
+        for (key, team) in (('hTeam', game[1]), ('vTeam', game[2])):
+            team_lines = [l for l in lines if l['teamId'] == team[0]]
+            leaders = dict()
+            for (category, field) in (('points', 'points'),
+                                      ('rebounds', 'totReb'),
+                                      ('assists', 'assists')):
+                best = max(team_lines, key=lambda l: int(l[field]))
+                leaders[category] = {'value': best[field],
+                                     'players': [{'personId':
+                                                  best['personId']}]}
+            stats[key] = {'leaders': leaders}
+
+        return {'basicGameData': {'hTeam': {'teamId': game[1][0],
+                                            'triCode': game[1][1]},
+                                  'vTeam': {'teamId': game[2][0],
+                                            'triCode': game[2][1]}},
+                'stats': stats}
+
+    def _playByPlay(self, date_string, game_id, period):
+        self._findGame(self._date(date_string), game_id)
+        return {'plays': []}
+
+    def _teams(self):
+        return {'league': {'standard': [{'teamId': t[0], 'tricode': t[1],
+                                         'isNBAFranchise': True}
+                                        for t in self.league.teams]}}
+
+    def _players(self):
+        return {'league': {'standard': [{'personId': p[0],
+                                         'firstName': p[1],
+                                         'lastName': p[2],
+                                         'teamId': p[3]}
+                                        for p in self.league.players]}}
+
+    def _playerProfile(self, person_id):
+        players = [p for p in self.league.players if p[0] == person_id]
+        if not players:
+            raise KeyError(person_id)
+
+        rng = random.Random(person_id)
+        averages = {'gamesPlayed': str(rng.randint(20, 60)),
+                    'mpg': '{:.1f}'.format(rng.uniform(8, 38)),
+                    'ppg': '{:.1f}'.format(rng.uniform(2, 30)),
+                    'rpg': '{:.1f}'.format(rng.uniform(1, 12)),
+                    'apg': '{:.1f}'.format(rng.uniform(0, 10)),
+                    'spg': '{:.1f}'.format(rng.uniform(0, 2)),
+                    'bpg': '{:.1f}'.format(rng.uniform(0, 2)),
+                    'fgp': '{:.1f}'.format(rng.uniform(38, 58)),
+                    'tpp': '{:.1f}'.format(rng.uniform(25, 42)),
+                    'ftp': '{:.1f}'.format(rng.uniform(60, 90))}
+        return {'league': {'standard': {'teamId': players[0][3],
+                                        'stats': {'latest': averages}}}}
+
+    def _teamLeaders(self, team_id):
+        roster = self.league.roster(team_id)
+        if not roster:
+            raise KeyError(team_id)
+
+        categories = ('ppg', 'trpg', 'apg', 'fgp', 'ftp', 'tpp', 'bpg', 'spg',
+                      'tpg', 'pfpg')
+        return {'league': {'standard': {
+            c: [{'personId': roster[i][0], 'value': str(10 + i)}]
+            for (i, c) in enumerate(categories)}}}
+
+    def _standingEntries(self):
+        entries = []
+        for (team_id, _, conference, division) in self.league.teams:
+            wins = self.league.records[team_id]
+            entries.append({'teamId': team_id, 'win': str(wins),
+                            'loss': str(60 - wins),
+                            'homeWin': str(wins // 2),
+                            'homeLoss': str((60 - wins) // 2),
+                            'awayWin': str(wins - wins // 2),
+                            'awayLoss': str(60 - wins - (60 - wins) // 2),
+                            'lastTenWin': '5', 'lastTenLoss': '5',
+                            'streak': '2', 'isWinStreak': True,
+                            'winPct': '{:.3f}'.format(wins / 60),
+                            '_conference': conference,
+                            '_division': division})
+
+        entries.sort(key=lambda e: -int(e['win']))
+        for group in ('_conference', '_division'):
+            leaders = dict()
+            ranks = Counter()
+            for e in entries:
+                leaders.setdefault(e[group], int(e['win']))
+                ranks[e[group]] += 1
+                games_behind = str(float(leaders[e[group]] - int(e['win'])))
+                if group == '_conference':
+                    (e['confRank'], e['gamesBehind']) = (str(ranks[e[group]]),
+                                                         games_behind)
+                else:
+                    (e['divRank'], e['divGamesBehind']) = (str(ranks[e[group]]),
+                                                           games_behind)
+        return entries
+
+    def _standings(self):
+        return {'league': {'standard': {'teams': self._standingEntries()}}}
+
+    def _conferenceStandings(self):
+        conferences = {'east': [], 'west': []}
+        for e in self._standingEntries():
+            conferences[e['_conference']].append(e)
+        return {'league': {'standard': {'conference': conferences}}}
+
+    def _divisionStandings(self):
+        conferences = {c: {d: [] for d in divisions}
+                       for (c, divisions) in _CONFERENCES.items()}
+        for e in self._standingEntries():
+            conferences[e['_conference']][e['_division']].append(e)
+        return {'league': {'standard': {'conference': conferences}}}
+
+    def _schedule(self):
+        games = []
+        start = datetime.date(SEASON_YEAR, 10, 25)
+        for day in range(0, 170, 2):
+            date = start + datetime.timedelta(days=day)
+            for game in self.league.games(date):
+                ended = date < ANCHOR_DATE
+                games.append({'gameId': game[0], 'seasonStageId': 2,
+                              'startDateEastern': date.strftime('%Y%m%d'),
+                              'statusNum': 3 if ended else 1,
+                              'hTeam': {'teamId': game[1][0],
+                                        'score': '100' if ended else ''},
+                              'vTeam': {'teamId': game[2][0],
+                                        'score': '90' if ended else ''}})
+        return {'league': {'standard': games}}
+
+    def _playoffBracket(self):
+        series = []
+        for (conference, divisions) in sorted(_CONFERENCES.items()):
+            team_ids = sorted((t for t in self.league.teams
+                               if t[2] == conference),
+                              key=lambda t: -self.league.records[t[0]])
+            for i in range(4):
+                (top, bottom) = (team_ids[i], team_ids[7 - i])
+                series.append({'roundNum': '1', 'confName': conference,
+                               'isScheduleAvailable': True,
+                               'isSeriesCompleted': False,
+                               'topRow': {'teamId': top[0],
+                                          'seedNum': str(i + 1), 'wins': '2',
+                                          'isSeriesWinner': False},
+                               'bottomRow': {'teamId': bottom[0],
+                                             'seedNum': str(8 - i),
+                                             'wins': '1',
+                                             'isSeriesWinner': False}})
+        return {'series': series}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local data.nba.net stub.')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every response')
+    parser.add_argument('--errors', type=float, default=0,
+                        help='fraction of requests answered with a 503')
+    parser.add_argument('--playoffs', action='store_true')
+    options = parser.parse_args()
+
+    server = StubServer(options.port, options.latency, options.errors,
+                        League(playoffs=options.playoffs))
+    print('Serving on', server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,59 @@ NBAStats = conf.registerPlugin('NBAStats')
 # This is where your configuration variables (if any) should go.  For example:
 # conf.registerGlobalValue(NBAStats, 'someConfigVariableName',
 #     registry.Boolean(False, _("""Help for someConfigVariableName.""")))
+conf.registerGlobalValue(NBAStats, 'warmUp',
+    registry.Boolean(False, _("""Determines whether the bot prefetches the
+    teams, roster and standings in the background when the plugin is
+    loaded, so that the first commands are answered faster.""")))
+conf.registerGlobalValue(NBAStats, 'seasonStore',
+    registry.String('NBAStats.sqlite', _("""Name of the SQLite database
+    (in the bot's data directory) where the box scores of the season's
+    games are stored.""")))
+conf.registerGlobalValue(NBAStats, 'statArchive',
+    registry.String('NBAStats.stats', _("""Name of the binary file (in the
+    bot's data directory) where the season's stats are kept for the
+    analytics commands. It is memory-mapped, so bots on the same host
+    can share it.""")))
+conf.registerGlobalValue(NBAStats, 'oddsSimulations',
+    registry.PositiveInteger(200000, _("""Number of simulations of the rest
+    of the season used to compute the playoff odds.""")))
+conf.registerGlobalValue(NBAStats, 'oddsProcesses',
+    registry.NonNegativeInteger(0, _("""Number of processes used to run the
+    playoff odds simulations (0 runs them in the bot's process).""")))
+conf.registerChannelValue(NBAStats, 'subscriptions',
+    registry.SpaceSeparatedListOfStrings([], _("""Teams (tri-codes, or 'all'
+    for every game) whose tip-offs, ends of quarters, final scores and
+    players in foul trouble are announced in the channel.""")))
+conf.registerGlobalValue(NBAStats, 'pollInterval',
+    registry.PositiveInteger(30, _("""Number of seconds between checks of
+    the scoreboard for the announcements to subscribed channels.""")))
+conf.registerGlobalValue(NBAStats, 'sharedCache',
+    registry.String('', _("""Cache shared with other bots on the same host,
+    so that each document is only fetched from NBA.com by one of them:
+    'sqlite:<file>' (relative to the data directory, or
+    'sqlite:///<absolute path>') or 'redis://<host>[:<port>][/<db>]'.
+    Empty keeps the cache in the bot's memory. Requires a restart.""")))
+conf.registerGlobalValue(NBAStats, 'serviceURL',
+    registry.String('', _("""URL of an NBAStats service (started with
+    'python -m nbastats serve') to get the stats from, instead of querying
+    NBA.com directly. Requires a restart.""")))
+conf.registerGlobalValue(NBAStats, 'apiServers',
+    registry.SpaceSeparatedListOfStrings(['https://data.nba.net'], _("""Base
+    URLs of the servers the documents are fetched from (data.nba.net and
+    its mirrors, e.g. a local caching proxy), in order of preference.
+    Servers that fail are skipped for a while. Requires a restart.""")))
+conf.registerGlobalValue(NBAStats, 'hedgePercentile',
+    registry.Probability(0.95, _("""Percentile of a server's recent
+    latencies after which, if it has not answered yet, the request is
+    also sent to the next server in apiServers (the first response is
+    used). Requires a restart.""")))
+conf.registerGlobalValue(NBAStats, 'statsTimeout',
+    registry.PositiveFloat(5.0, _("""Number of seconds the playerstats and
+    compare commands wait for the players' profiles; the players whose
+    profiles are not fetched by then are shown as not available.""")))
+conf.registerGlobalValue(NBAStats, 'stripFormattingToFit',
+    registry.Boolean(True, _("""Determines whether long replies are sent
+    without colours and bold when that makes them fit in fewer lines.""")))
 
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
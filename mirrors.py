@@ -0,0 +1,289 @@
+###
+# Mirrors of data.nba.net, with failover and hedged requests.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import math
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from requests.adapters import HTTPAdapter
+
+
+class Mirror():
+    """A server of the documents, and the health and latencies of its
+    responses.
+    """
+
+    # Latencies kept for the percentiles:
+    HISTORY = 100
+
+    # Seconds a mirror is skipped after a failure, doubled with every
+    # consecutive one:
+    BACKOFF = 5
+    MAX_BACKOFF = 300
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0 # Requests sent because another mirror was slow
+
+        self._latencies = deque(maxlen=self.HISTORY) # Seconds
+        self._consecutive_failures = 0
+        self._down_until = 0 # time.monotonic()
+        self._lock = threading.Lock()
+
+    def downFor(self, now=None):
+        """Seconds until the mirror is tried first again (0 if it is
+        healthy).
+        """
+        now = time.monotonic() if now is None else now
+        return max(self._down_until - now, 0)
+
+    def recordSuccess(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(seconds)
+            self._consecutive_failures = 0
+            self._down_until = 0
+
+    def recordFailure(self):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self._consecutive_failures += 1
+            backoff = min(self.BACKOFF * 2 ** (self._consecutive_failures - 1),
+                          self.MAX_BACKOFF)
+            self._down_until = time.monotonic() + backoff
+
+    def latencyPercentile(self, percentile):
+        """Latency (seconds until the response headers) that the given
+        fraction of the recent successful requests took at most, or
+        None if there are none.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        rank = max(math.ceil(percentile * len(latencies)), 1)
+        return latencies[rank - 1]
+
+    def samples(self):
+        return len(self._latencies)
+
+
+class MirrorSet():
+    """The mirrors of the documents, in order of preference. URLs are
+    built with the first one's base URL (so that is what the HTTP cache
+    is keyed by) and rewritten for the mirror actually queried.
+    """
+
+    # The hedge delay is INITIAL_HEDGE_DELAY until a mirror has
+    # MIN_SAMPLES latencies, and never less than MIN_HEDGE_DELAY:
+    MIN_SAMPLES = 10
+    INITIAL_HEDGE_DELAY = 1.0
+    MIN_HEDGE_DELAY = 0.05
+
+    def __init__(self, urls, hedge_percentile=0.95):
+        if not urls:
+            raise ValueError('At least one mirror is needed')
+        self.mirrors = [Mirror(url) for url in urls]
+        self.hedge_percentile = hedge_percentile
+
+    @property
+    def canonical_url(self):
+        return self.mirrors[0].url
+
+    def ordered(self):
+        """The healthy mirrors in order of preference, then the ones
+        that are down, those that come back the soonest first.
+        """
+        now = time.monotonic()
+        healthy = [m for m in self.mirrors if not m.downFor(now)]
+        down = sorted((m for m in self.mirrors if m.downFor(now)),
+                      key=lambda m: m.downFor(now))
+        return healthy + down
+
+    def hedgeDelay(self, mirror):
+        """Seconds to wait for a mirror before sending the request to
+        the next one too.
+        """
+        if mirror.samples() < self.MIN_SAMPLES:
+            return self.INITIAL_HEDGE_DELAY
+        return max(mirror.latencyPercentile(self.hedge_percentile),
+                   self.MIN_HEDGE_DELAY)
+
+    def rewrite(self, url, mirror):
+        """A canonical URL, on the given mirror."""
+        if url.startswith(self.canonical_url):
+            return mirror.url + url[len(self.canonical_url):]
+        return url
+
+
+class MirroringAdapter(HTTPAdapter):
+    """Transport adapter sending every request to the mirrors of a
+    MirrorSet: to the first healthy one and, if it has not answered
+    within its hedge delay, to the next one as well (and so on). The
+    first response wins. Mirrors that fail (errors or 5xx responses) are
+    skipped for a while, and the request goes to the next one at once.
+    If they all fail, the last error is raised (requests.HTTPError for a
+    5xx response).
+
+    Requests keep their canonical URL, only the connections are made to
+    the mirrors; caching adapters mixed in with mirroring() cache by it.
+    """
+
+    def __init__(self, *args, mirrors=None, timeout=10, max_workers=32,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mirrors = mirrors
+        self.timeout = timeout # Default of every attempt, in seconds
+
+        self._target = threading.local() # .mirror, of the current attempt
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix='NBAStats mirror')
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        kwargs = {'stream': stream, 'verify': verify, 'cert': cert,
+                  'proxies': proxies,
+                  'timeout': self.timeout if timeout is None else timeout}
+
+        candidates = self.mirrors.ordered()
+        pending = dict() # Future -> Mirror
+        failure = None   # Last 5xx response or exception
+
+        while candidates or pending:
+            delay = None
+            if candidates:
+                mirror = candidates.pop(0)
+                if not candidates and not pending:
+                    # Nothing to hedge with: no need for another thread.
+                    future = self._attemptInline(mirror, request, kwargs)
+                else:
+                    if pending:
+                        mirror.hedges += 1
+                    future = self._pool.submit(self._attempt, mirror,
+                                               request.copy(), kwargs)
+                pending[future] = mirror
+                if candidates:
+                    delay = self.mirrors.hedgeDelay(mirror)
+
+            (done, _) = wait(pending, timeout=delay,
+                             return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    failure = self._replaceFailure(failure, e)
+                    continue
+
+                if self._failed(response):
+                    failure = self._replaceFailure(failure, response)
+                    continue
+
+                self._discard(pending)
+                self._replaceFailure(failure, None)
+                return response
+
+        if isinstance(failure, Exception):
+            raise failure
+        failure.raise_for_status() # Every mirror answered with a 5xx
+
+    def _attempt(self, mirror, request, kwargs):
+        self._target.mirror = mirror
+        start = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            mirror.recordFailure()
+            raise
+        finally:
+            self._target.mirror = None
+
+        if self._failed(response):
+            mirror.recordFailure()
+        else:
+            mirror.recordSuccess(time.monotonic() - start)
+        return response
+
+    def _attemptInline(self, mirror, request, kwargs):
+        future = Future()
+        try:
+            future.set_result(self._attempt(mirror, request, kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _failed(self, response):
+        return response.status_code >= 500
+
+    def _replaceFailure(self, failure, new_failure):
+        if failure is not None and not isinstance(failure, Exception):
+            failure.close()
+        return new_failure
+
+    def _discard(self, pending):
+        """Close the responses of the attempts that lost."""
+        def close(future):
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+        for future in pending:
+            future.add_done_callback(close)
+
+    def _mirrorRequest(self, request):
+        mirror = getattr(self._target, 'mirror', None)
+        if mirror is None or mirror.url == self.mirrors.canonical_url:
+            return request
+        request = request.copy()
+        request.url = self.mirrors.rewrite(request.url, mirror)
+        return request
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None,
+                                        cert=None):
+        return super().get_connection_with_tls_context(
+            self._mirrorRequest(request), verify, proxies=proxies, cert=cert)
+
+    def get_connection(self, url, proxies=None): # requests < 2.32
+        mirror = getattr(self._target, 'mirror', None)
+        if mirror is not None:
+            url = self.mirrors.rewrite(url, mirror)
+        return super().get_connection(url, proxies)
+
+    def request_url(self, request, proxies):
+        return super().request_url(self._mirrorRequest(request), proxies)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        super().close()
+
+
+def mirroring(adapter_class):
+    """Subclass of a (caching) adapter class that sends its requests
+    through a MirroringAdapter. Takes the same arguments, plus mirrors.
+    """
+    return type('Mirroring' + adapter_class.__name__,
+                (adapter_class, MirroringAdapter), {})
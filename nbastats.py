@@ -18,38 +18,361 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ###
 
-import cachecontrol
-from cachecontrol import CacheControlAdapter
-from cachecontrol.heuristics import LastModified
+import bisect
+import datetime
+import logging
+import threading
+import time
+
+from array import array
 
 from collections import defaultdict
 from collections import namedtuple
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from types import MappingProxyType
 
 PlayerName  = namedtuple('PlayerName', 'first_name, last_name')
+PlayerMatch = namedtuple('PlayerMatch', 'person_id, name, team, score')
+PlayerSeasonStats = namedtuple('PlayerSeasonStats',
+                               'person_id, team, games, minutes, points,'
+                               'rebounds, assists, steals, blocks,'
+                               'fg_percentage, tp_percentage, ft_percentage')
 Record      = namedtuple('Record', 'wins, loses')
 Streak      = namedtuple('Streak', 'games, is_winning')
 
 PlayerStatistic = namedtuple('PlayerStatistic', 'category, player_name, value')
 LeaderStatistic = namedtuple('LeaderStatistic', 'category, players, value')
 
+MirrorHealth = namedtuple('MirrorHealth', 'url, down_for, requests, failures,'
+                                          'hedges, p50, p95')
+
+try:
+    from . import playbyplay
+    from . import playersearch
+except ImportError: # Running as a script
+    import playbyplay
+    import playersearch
+
+# Default server of the documents:
+API_SERVER = 'https://data.nba.net'
+
+class ImmutableJSONCache():
+    """Size-bounded LRU store for documents that never change once
+    published (past scoreboards and box scores). Entries do not
+    expire; they are only evicted when the cache is full.
+
+    The size of a document is approximated by the length of its JSON
+    text (the parsed objects take a few times more).
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = dict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = self._approximateSize(value)
+        if size > self._max_bytes:
+            return
+
+        with self._lock:
+            self._total_bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while self._total_bytes > self._max_bytes:
+                (evicted, _) = self._entries.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(evicted)
+
+    def _approximateSize(self, value):
+        import json
+        return len(json.dumps(value, separators=(',', ':')))
+
+    def __len__(self):
+        return len(self._entries)
+
+class ExpiringJSONCache():
+    """Size-bounded LRU store for documents that are reused for a
+    fixed time, given per entry, whatever their HTTP headers say.
+    """
+
+    def __init__(self, max_entries=1024):
+        self._max_entries = max_entries
+        self._entries = OrderedDict() # Key -> (expiration time, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+ScheduledGame = namedtuple('ScheduledGame',
+                           'game_id, date, home_team, away_team,'
+                           'home_score, away_score, is_regular_season, ended')
+
+class SeasonSchedule():
+    """Index of the season's games (regular season and playoffs) by
+    team and date.
+
+    Each team's games are kept in date order in compact arrays, with
+    prefix sums for home games, away games and back-to-backs, so every
+    query is a binary search plus O(1) arithmetic.
+    """
+
+    def __init__(self, games):
+        """games: list of ScheduledGame."""
+        self._games = sorted(games, key=lambda g: (g.date, g.game_id))
+        self._dates = [g.date for g in self._games]
+        self._teams = dict()
+
+        rows = defaultdict(list)
+        for (i, game) in enumerate(self._games):
+            rows[game.home_team].append((i, True))
+            rows[game.away_team].append((i, False))
+
+        for (team, team_rows) in rows.items():
+            self._teams[team] = self._buildTeamIndex(team_rows)
+
+    def _buildTeamIndex(self, team_rows):
+        dates = array('l')
+        games = array('l')
+        home_games = array('l', [0])
+        away_games = array('l', [0])
+        back_to_backs = array('l', [0])
+
+        for (i, is_home) in team_rows:
+            game = self._games[i]
+            date = self._ordinal(game.date)
+            regular_season = game.is_regular_season
+            is_back_to_back = len(dates) > 0 and date - dates[-1] == 1
+
+            home_games.append(home_games[-1] + (regular_season and is_home))
+            away_games.append(away_games[-1]
+                              + (regular_season and not is_home))
+            back_to_backs.append(back_to_backs[-1] + is_back_to_back)
+            dates.append(date)
+            games.append(i)
+
+        return (dates, games, home_games, away_games, back_to_backs)
+
+    def _ordinal(self, date):
+        return datetime.datetime.strptime(date, '%Y%m%d').toordinal()
+
+    def _position(self, team, date):
+        """Index of the team's first game on or after a date."""
+        dates = self._teams[team][0]
+        return bisect.bisect_left(dates, self._ordinal(date))
+
+    def teamGames(self, team, start=0, stop=None):
+        games = self._teams[team][1]
+        return [self._games[i] for i in games[start:stop]]
+
+    def nextGames(self, team, date, count=1):
+        """The team's first <count> games on or after a date."""
+        position = self._position(team, date)
+        return self.teamGames(team, position, position + count)
+
+    def lastGames(self, team, date, count=5):
+        """The team's last <count> completed games before a date."""
+        position = self._position(team, date)
+        games = self.teamGames(team, max(position - count, 0), position)
+        return [g for g in games if g.ended]
+
+    def remainingGames(self, team, date):
+        """Return a tuple (home games, away games, back-to-backs)
+        with the counts of the team's regular season games (and
+        back-to-backs) from a date on.
+        """
+        (_, _, home_games, away_games, back_to_backs) = self._teams[team]
+        position = self._position(team, date)
+
+        return (home_games[-1] - home_games[position],
+                away_games[-1] - away_games[position],
+                back_to_backs[-1] - back_to_backs[min(position + 1,
+                                                      len(back_to_backs)
+                                                      - 1)])
+
+    def backToBacks(self, team, date):
+        """List of (first game, second game) back-to-backs for a team
+        from a date on.
+        """
+        (dates, _, _, _, _) = self._teams[team]
+        position = self._position(team, date)
+        games = self.teamGames(team, position)
+
+        return [(games[i - 1], games[i]) for i in range(1, len(games))
+                if dates[position + i] - dates[position + i - 1] == 1]
+
+    def regularSeasonGamesFrom(self, date):
+        """Every regular season game from a date on."""
+        position = bisect.bisect_left(self._dates, date)
+        return [g for g in self._games[position:] if g.is_regular_season]
+
+PlayoffOdds = namedtuple('PlayoffOdds', 'team, playoffs, seeds')
+
 PlayoffMatchUp = namedtuple('PlayoffMatchUp',
                             'top_team, top_seed, top_wins, top_is_winner,'
                             'bottom_team, bottom_seed, bottom_wins,'
                             'bottom_is_winner, is_completed')
 
-import json
-import requests
+class PlayoffBracket():
+    """Parsed snapshot of the playoffs bracket: the match-ups of
+    each round, indexed by round number and conference.
+    """
+
+    def __init__(self, rounds, current_round):
+        self._rounds = rounds # round -> conference -> [PlayoffMatchUp]
+        self.current_round = current_round
+
+    def rounds(self):
+        return sorted(self._rounds)
+
+    def matchUps(self, round_number):
+        """Return a dictionary (conference -> list of PlayoffMatchUp)
+        for a round. It is empty if the round is not determined yet.
+        """
+        return self._rounds.get(round_number, dict())
+
+    def conferenceMatchUps(self, round_number, conference):
+        return self.matchUps(round_number).get(conference.lower(), [])
+
+class TeamIndex():
+    """Immutable snapshot of the franchises' (tricode <-> team id)
+    mappings. Both directions come from the same team list, and a
+    snapshot is never modified: refreshing replaces it as a whole.
+    """
+
+    def __init__(self, teams):
+        """teams is an iterable of (tricode, team id)."""
+        teams = tuple(teams)
+        self.tricodes_to_ids = MappingProxyType(dict(teams))
+        self.ids_to_tricodes = MappingProxyType({team_id: tricode
+                                                 for (tricode, team_id)
+                                                 in teams})
+
+class PlayerIndex():
+    """Immutable snapshot of the roster: person id -> PlayerName and
+    person id -> team id ('' for free agents).
+    """
+
+    def __init__(self, names, teams):
+        """names and teams are dictionaries that are not copied; they
+        must not be modified afterwards.
+        """
+        self.names = MappingProxyType(names)
+        self.teams = MappingProxyType(teams)
+        self._search_index = None
+
+    def updated(self, players):
+        """Return the index for a new version of the roster, given as
+        (person id, first name, last name, team id) tuples: this same
+        index if nothing changed, otherwise a copy with the players
+        that were added, removed, renamed or traded changed. The names
+        of the others are reused.
+        """
+        (names, teams) = (self.names, self.teams)
+        (changed_names, changed_teams) = (dict(), dict())
+        person_ids = set()
+        for (person_id, first_name, last_name, team_id) in players:
+            person_ids.add(person_id)
+            if names.get(person_id) != (first_name, last_name):
+                changed_names[person_id] = PlayerName(first_name, last_name)
+            if teams.get(person_id) != team_id:
+                changed_teams[person_id] = team_id
+        removed = names.keys() - person_ids
+
+        if not changed_names and not changed_teams and not removed:
+            return self
+
+        (updated_names, updated_teams) = (dict(names), dict(teams))
+        for person_id in removed:
+            del updated_names[person_id]
+            del updated_teams[person_id]
+        updated_names.update(changed_names)
+        updated_teams.update(changed_teams)
+        return PlayerIndex(updated_names, updated_teams)
+
+    def search(self, query, limit=5):
+        """Return up to limit (person id, score) tuples for the players
+        whose names best match query; see PlayerSearchIndex.
+        """
+        # Built when first needed, once per version of the roster:
+        search_index = self._search_index
+        if search_index is None:
+            search_index = playersearch.PlayerSearchIndex(self.names)
+            self._search_index = search_index
+        return search_index.search(query, limit)
 
 class NBAStatsGetter():
     """Get stats from NBA.com's JSON API."""
 
-    def __init__(self):
-        self._API_SERVER = "https://data.nba.net"
-
-        self._cache_control_adapter = CacheControlAdapter(heuristic=LastModified())
-        self._requests_session = requests.Session()
-        self._requests_session.mount('http://', CacheControlAdapter())
-        self._requests_session.mount('https://', CacheControlAdapter())
+    def __init__(self, shared_cache=None, api_server=API_SERVER,
+                 hedge_percentile=0.95, log=None):
+        # The plugin passes its logger:
+        self._log = log or logging.getLogger(__name__)
+
+        # api_server can also be a list of mirrors, in order of
+        # preference. URLs are built with the first one, see mirrors.py.
+        if isinstance(api_server, str):
+            api_server = [api_server]
+        self._api_servers = [s.rstrip('/') for s in api_server]
+        self._API_SERVER = self._api_servers[0]
+        self._hedge_percentile = hedge_percentile
+        self._mirror_set = None # mirrors.MirrorSet, created with the session
+
+        # The HTTP stack (requests + CacheControl) is only imported and
+        # set up on the first request, see _session().
+        self._requests_session = None
+        self._session_lock = threading.Lock()
+
+        # Optional sharedcache.SharedCache for the HTTP responses and
+        # immutable documents of every process on the host.
+        self._shared_cache = shared_cache
+
+        # (URL, refresh) -> Future for the requests currently being made.
+        self._in_flight = dict()
+        self._in_flight_lock = threading.Lock()
+
+        # Documents for days that are over are kept until the cache is
+        # full (see ImmutableJSONCache):
+        self._immutable_cache = ImmutableJSONCache()
+
+        # Documents of the endpoints in _ENDPOINT_TTLS are reused for
+        # that many seconds:
+        self._expiring_cache = ExpiringJSONCache()
+
+        # Pool for the fetches of playerSeasonStats(), created when
+        # first needed; it bounds them across concurrent commands.
+        self._fetch_pool = None
+        self._fetch_pool_lock = threading.Lock()
 
         self._TEAM_TRICODES = frozenset(('CHA', 'ATL', 'IND', 'MEM', 'DET',
                                          'UTA', 'CHI', 'TOR', 'CLE', 'OKC',
@@ -68,14 +391,50 @@ class NBAStatsGetter():
         self._DIVISIONS = {'west': self._WESTERN_DIVISIONS,
                            'east': self._EASTERN_DIVISIONS}
 
-        # Cached dictionaries. Saving these copies avoids having to
-        # re-parse JSONs when they are returned from the HTTP cache.
-        self._person_ids = None
-        self._team_ids_to_tricodes = None
-        self._team_tricodes_to_ids = None
+        # Reference data. The indexes are immutable snapshots: a
+        # refresh swaps in a new one, readers take no lock.
+        self._team_index = None   # TeamIndex
+        self._player_index = None # PlayerIndex
+        self._player_refresh_lock = threading.Lock()
+        self._last_player_refresh = None # time.monotonic()
+        self._playoff_bracket = None
+        self._playoff_odds = None
+        self._season_schedule = None # (anchor date, SeasonSchedule)
+
+        # Game id -> playbyplay.GameTracker for today's games.
+        self._play_by_play_trackers = dict()
+        self._play_by_play_lock = threading.Lock()
 
 ############################
 ############################
+    def warmUp(self):
+        """Prefetch the reference data (today.json, teams, roster and
+        standings) in a background thread and return that thread.
+
+        Commands issued while this is running wait for the in-flight
+        requests instead of making their own.
+        """
+        thread = threading.Thread(target=self._warmUp,
+                                  name='NBAStats warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def _warmUp(self):
+        try:
+            # Every other link is read from today.json, get it first:
+            self._todayJSON()
+
+            tasks = (self._teamIndex,
+                     self._playerIndex,
+                     lambda: self._getJSON(self._standingsURL()),
+                     lambda: self._getJSON(self._conferenceStandingsURL()))
+
+            with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+                for future in [pool.submit(task) for task in tasks]:
+                    future.result()
+        except Exception as e:
+            self._log.warning('Warm-up failed: %s', e)
+
     def teams(self):
         return self._TEAM_TRICODES
 
@@ -95,6 +454,23 @@ class NBAStatsGetter():
     def conferences(self):
         return self._CONFERENCES
 
+    def seasonYear(self):
+        """Return the year in which the current season started."""
+        return int(self._todayJSON()['seasonScheduleYear'])
+
+    def mirrorHealth(self):
+        """Return a list of MirrorHealth of the API servers, in order of
+        preference: seconds until it is tried first again after
+        failing (0 if healthy), requests, failures, requests sent to it
+        because the previous one was slow, and the p50 and p95 of its
+        latencies (seconds, or None).
+        """
+        self._session()
+        return [MirrorHealth(m.url, m.downFor(), m.requests, m.failures,
+                             m.hedges, m.latencyPercentile(0.5),
+                             m.latencyPercentile(0.95))
+                for m in self._mirror_set.mirrors]
+
     def teamLeaders(self, team):
         """Return a list with tuples (stat. category, player_id,
         value of the stat) representing the current team leaders
@@ -179,6 +555,48 @@ class NBAStatsGetter():
         return fouls
 
 
+    def gamePlayByPlay(self, team):
+        """Return the playbyplay.GameTracker of a game in progress
+        involving the given team, updated with the plays made since
+        the last call.
+
+        (If there is no game in progress with the given team,
+        throws a ValueError.)
+        """
+        team = self._parseTeamTricode(team)
+
+        team_id = self._teamID(team)
+        game = self._findGameInProgress(team_id)
+
+        if game is None:
+            raise ValueError('{} is not currently playing'.format(team))
+
+        tracker = self._playByPlayTracker(game)
+        tracker.update(game['period']['current'],
+                       lambda period: self._fetchPlayByPlay(game['start_date'],
+                                                            game['game_id'],
+                                                            period))
+        return tracker
+
+    def _playByPlayTracker(self, game):
+        with self._play_by_play_lock:
+            trackers = self._play_by_play_trackers
+
+            if game['game_id'] not in trackers:
+                # Dropping the trackers of other days' games:
+                today = frozenset(g['game_id'] for g in self._todayGames())
+                for game_id in list(trackers):
+                    if game_id not in today:
+                        del trackers[game_id]
+
+                team_names = {game['home_team_id']: game['home_team'],
+                              game['away_team_id']: game['away_team']}
+                trackers[game['game_id']] = playbyplay.GameTracker(
+                    game['game_id'], game['home_team_id'],
+                    game['away_team_id'], team_names)
+
+            return trackers[game['game_id']]
+
     def gameTextNugget(self, team):
         """Find the 'text nugget' (a string containing the description
         of a highlight of the game) for a game that involves the
@@ -195,6 +613,88 @@ class NBAStatsGetter():
 
         return game['text_nugget']
 
+    def playerSeasonStats(self, person_ids, timeout=None):
+        """Return an ordered dictionary (person ID -> PlayerSeasonStats)
+        with the season averages of several players (a list of person
+        IDs), whose profiles are fetched concurrently.
+
+        After timeout seconds, the players whose profiles are not
+        fetched yet (or that failed) are left out; their fetches go on
+        and are cached for later.
+        """
+        pool = self._fetchPool()
+        futures = OrderedDict((person_id,
+                               pool.submit(self._fetchPlayerProfile,
+                                           person_id))
+                              for person_id in person_ids)
+        wait(futures.values(), timeout=timeout)
+
+        stats = OrderedDict()
+        for (person_id, future) in futures.items():
+            if future.done() and future.exception() is None:
+                stats[person_id] = self._extractPlayerSeasonStats(
+                    person_id, future.result())
+        return stats
+
+    def scoreboard(self, date=None):
+        """Return the list of games scheduled for a date (today if
+        None). Dates can be given as datetime.date objects or as
+        'YYYYMMDD'/'YYYY-MM-DD' strings, and 'today' and 'yesterday'
+        are also accepted.
+        """
+        if date is None:
+            return self._todayGames()
+
+        date = self._parseDate(date)
+        json = self._getJSON(self._scoreboardURL(date),
+                             immutable=self._isPastDate(date))
+        return self._extractGamesFromScoreboard(json)
+
+    def scoreboards(self, start_date, end_date, max_workers=4):
+        """Return an ordered dictionary (date -> list of games) for
+        every date in [start_date, end_date]. At most max_workers
+        scoreboards are fetched at the same time.
+        """
+        dates = self.dateRange(start_date, end_date)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return OrderedDict(zip(dates, pool.map(self.scoreboard, dates)))
+
+    def dateRange(self, start_date, end_date):
+        """Return the list of 'YYYYMMDD' dates between two dates
+        (inclusive).
+        """
+        return self._dateRange(self._parseDate(start_date),
+                               self._parseDate(end_date))
+
+    def boxScore(self, date, game_id):
+        """Return the box score document of a game played
+        (or being played) on the given date.
+        """
+        date = self._parseDate(date)
+        return self._fetchGameBoxScore(date, game_id)
+
+    def dateGameLeaders(self, team, date):
+        """Get the game leaders of the game that a team played on a
+        given date.
+        """
+        team = self._parseTeamTricode(team)
+        date = self._parseDate(date)
+
+        team_id = self._teamID(team)
+        for game in self.scoreboard(date):
+            if team_id in (game['home_team_id'], game['away_team_id']):
+                break
+        else:
+            raise ValueError('{} did not play on {}'.format(team, date))
+
+        box_score = self.boxScore(date, game['game_id'])
+        leaders = self._extractLeadersFromBoxScore(box_score)
+
+        leaders['final'] = game['ended']
+
+        return leaders
+
     def conferenceStandings(self):
         """Find and return the standings for each conference.
         Returns a list of dictionaries in ranking order.
@@ -222,45 +722,183 @@ class NBAStatsGetter():
         """Return the number of the current playoff round (the first
         round with games yet to be played).
         """
-        if not self._playoffBracketEndPointExists():
+        bracket = self.playoffBracket()
+        if bracket is None:
             return None
 
-        bracket_json = self._getJSON(self._playoffBracketURL())
-        return self._currentPlayoffRound(bracket_json)
+        return bracket.current_round
 
     def playoffMatchUps(self, round_number=None):
         """Find and return the match-ups for a given round in the
         playoffs. If round_number is None, returns the match-ups for
         the current round in progress.
         """
-        bracket_json = self._getJSON(self._playoffBracketURL())
+        bracket = self.playoffBracket()
+        if bracket is None:
+            return dict()
 
         if round_number is None:
-            round_number = self._currentPlayoffRound(bracket_json)
+            round_number = bracket.current_round
+
+        return bracket.matchUps(round_number)
+
+    def seasonSchedule(self):
+        """Return the SeasonSchedule index. The schedule is fetched and
+        indexed once per day.
+        """
+        today = self._todayAnchorDate()
+
+        cached = self._season_schedule
+        if cached is not None and cached[0] == today:
+            return cached[1]
+
+        schedule_json = self._getJSON(self._scheduleURL())
+        schedule = SeasonSchedule(self._extractScheduledGames(schedule_json))
+
+        self._season_schedule = (today, schedule)
+        return schedule
+
+    def nextGames(self, team, count=1):
+        """Return a list with the team's next <count> games (as
+        ScheduledGame tuples), including a game in progress.
+        """
+        team = self._parseTeamTricode(team)
+
+        # The index is from this morning; today's game may be over:
+        games = self.seasonSchedule().nextGames(team, self._todayAnchorDate(),
+                                                count + 1)
+        ended_today = self._gamesEndedToday()
+        games = [g for g in games if g.game_id not in ended_today]
+        return games[:count]
+
+    def lastResults(self, team, count=5):
+        """Return a list with the team's last <count> completed games
+        (as ScheduledGame tuples), most recent last.
+        """
+        team = self._parseTeamTricode(team)
+        today = self._todayAnchorDate()
+
+        games = self.seasonSchedule().lastGames(team, today, count)
+
+        # Adding today's game if it is already over:
+        for game in self._todayGames():
+            if game['ended'] and team in (game['home_team'], game['away_team']):
+                games.append(self._scheduledGameFromScoreboard(game))
+
+        return games[-count:]
+
+    def remainingSchedule(self, team):
+        """Return a dictionary with the number of home and away regular
+        season games left for a team, and its back-to-backs (a list of
+        pairs of ScheduledGame).
+        """
+        team = self._parseTeamTricode(team)
+        schedule = self.seasonSchedule()
+        today = self._todayAnchorDate()
+
+        (home, away, _) = schedule.remainingGames(team, today)
+        for game in self._todayGames():
+            if game['ended'] and game['home_team'] == team:
+                home -= 1
+            elif game['ended'] and game['away_team'] == team:
+                away -= 1
+
+        ended_today = self._gamesEndedToday()
+        back_to_backs = [pair for pair in schedule.backToBacks(team, today)
+                         if pair[0].game_id not in ended_today]
+
+        return {'home': home, 'away': away, 'back_to_backs': back_to_backs}
+
+    def playoffOdds(self, simulations=200000, processes=0, time_budget=1.0):
+        """Estimate the playoff chances of every team by simulating
+        the rest of the regular season (requires NumPy).
+
+        Returns a dictionary (conference -> list of PlayoffOdds), with
+        the probability of making the playoffs and of finishing with
+        each seed, sorted by playoff probability. Results are reused
+        until the standings change.
+        """
+        # Imported here, NumPy takes a while to load:
+        try:
+            from . import playoffodds
+        except ImportError:
+            import playoffodds
+
+        standings_json = self._getJSON(self._conferenceStandingsURL())
+        records = self._extractConferenceRecords(standings_json)
+
+        key = (tuple(records), simulations)
+        if self._playoff_odds is not None and self._playoff_odds[0] == key:
+            return self._playoff_odds[1]
+
+        (team_ids, conferences, wins, losses) = zip(*records)
+        team_numbers = {team_id: i for (i, team_id) in enumerate(team_ids)}
+
+        games = self._remainingRegularSeasonGames()
+        home_teams = [team_numbers[home] for (home, _) in games]
+        away_teams = [team_numbers[away] for (_, away) in games]
+
+        (seed_counts, runs) = playoffodds.simulate(wins, losses, conferences,
+                                                   home_teams, away_teams,
+                                                   simulations, processes,
+                                                   time_budget)
+        probabilities = seed_counts / runs
+
+        tricodes = self._teamIDtoTricodeDict()
+        odds = defaultdict(list)
+        for (i, team_id) in enumerate(team_ids):
+            seeds = tuple(probabilities[i].tolist())
+            odds[conferences[i]].append(PlayoffOdds(tricodes[team_id],
+                                                    sum(seeds[:8]), seeds))
+
+        for conference_odds in odds.values():
+            conference_odds.sort(key=lambda o: (-o.playoffs, -o.seeds[0]))
+
+        odds = dict(odds)
+        self._playoff_odds = (key, odds)
+        return odds
+
+    def playoffBracket(self):
+        """Return a PlayoffBracket with the state of the playoffs, or
+        None if they are not in progress. The bracket is only parsed
+        again when the document changes.
+        """
+        if not self._playoffBracketEndPointExists():
+            return None
+
+        (json, from_cache) = self._getJSON(self._playoffBracketURL(),
+                                           return_cache_status=True)
 
-        return self._parsePlayoffBracket(bracket_json, round_number)
+        bracket = self._playoff_bracket
+        if from_cache and bracket is not None:
+            return bracket
 
-    def _parsePlayoffBracket(self, json, round_number):
-        return self._extractPlayoffMatchUps(json, round_number)
+        bracket = self._extractPlayoffBracket(json)
+        self._playoff_bracket = bracket
+        return bracket
 
-    def _extractPlayoffMatchUps(self, json, round_number):
-        match_ups = defaultdict(list)
+    def _extractPlayoffBracket(self, json):
+        # Resolving the tricodes once for the whole bracket:
+        tricodes = self._teamIDtoTricodeDict()
 
+        rounds = defaultdict(lambda: defaultdict(list))
         for entry in json['series']:
-            if entry['isScheduleAvailable'] \
-               and int(entry['roundNum']) == round_number:
+            if entry['isScheduleAvailable']:
+                round_number = int(entry['roundNum'])
                 conference = entry['confName'].lower()
-                match_ups[conference].append(self._extractPlayoffMatchUp(entry))
+                match_up = self._extractPlayoffMatchUp(entry, tricodes)
+                rounds[round_number][conference].append(match_up)
 
-        return match_ups
+        rounds = {r: dict(conferences) for (r, conferences) in rounds.items()}
+        return PlayoffBracket(rounds, self._currentPlayoffRound(json))
 
-    def _extractPlayoffMatchUp(self, json):
-        top_team_name = self._teamTricode(json['topRow']['teamId'])
+    def _extractPlayoffMatchUp(self, json, tricodes):
+        top_team_name = tricodes[json['topRow']['teamId']]
         top_team_seed = int(json['topRow']['seedNum'])
         top_team_wins = int(json['topRow']['wins'])
         top_team_is_winner = json['topRow']['isSeriesWinner']
 
-        bottom_team_name = self._teamTricode(json['bottomRow']['teamId'])
+        bottom_team_name = tricodes[json['bottomRow']['teamId']]
         bottom_team_seed = int(json['bottomRow']['seedNum'])
         bottom_team_wins = int(json['bottomRow']['wins'])
         bottom_team_is_winner = json['bottomRow']['isSeriesWinner']
@@ -366,6 +1004,21 @@ class NBAStatsGetter():
         return players_fouls
 
 
+    def _extractPlayerSeasonStats(self, person_id, json):
+        player = json['league']['standard']
+        averages = player['stats']['latest']
+
+        def value(key):
+            return float(averages[key]) if averages.get(key) else 0.0
+
+        return PlayerSeasonStats(person_id,
+                                 self._teamIDtoTricodeDict().get(
+                                     player.get('teamId')),
+                                 int(averages.get('gamesPlayed') or 0),
+                                 value('mpg'), value('ppg'), value('rpg'),
+                                 value('apg'), value('spg'), value('bpg'),
+                                 value('fgp'), value('tpp'), value('ftp'))
+
     def _extractGameLeadersStats(self, json):
         leaders = []
         for category in ['points', 'rebounds', 'assists']:
@@ -459,13 +1112,22 @@ class NBAStatsGetter():
                          'away_team': g['vTeam']['triCode'],
                          'away_team_id': g['vTeam']['teamId'],
                          'start_date': g['startDateEastern'],
+                         'start_time': g['startTimeEastern'],
                          'period': g['period'],
+                         'clock': g['clock'],
+                         'status_num': g['statusNum'],
+                         'home_score': self._parseScore(g['hTeam']['score']),
+                         'away_score': self._parseScore(g['vTeam']['score']),
                          'ended': (g['statusNum'] == 3),
                          'text_nugget': g['nugget']['text']
                         }
             games.append(game_info)
         return games
 
+    def _parseScore(self, score):
+        """Scores of games that did not start are empty strings."""
+        return int(score) if score else 0
+
     def _extractConferenceStandings(self, json):
         """Extract the standings for each conference."""
         json = json['league']['standard']['conference']
@@ -480,6 +1142,62 @@ class NBAStatsGetter():
                 standings[conference].append(team_standing)
         return standings
 
+    def _extractConferenceRecords(self, json):
+        """List of (team id, conference, wins, losses) tuples from
+        the conference standings.
+        """
+        json = json['league']['standard']['conference']
+
+        return [(team['teamId'], conference, int(team['win']),
+                 int(team['loss']))
+                for conference in sorted(json) for team in json[conference]]
+
+    def _remainingRegularSeasonGames(self):
+        """List of (home team id, away team id) for the regular season
+        games that have not been completed yet.
+        """
+        team_ids = self._tricodeToTeamIDdict()
+        games = self.seasonSchedule().regularSeasonGamesFrom(
+            self._todayAnchorDate())
+
+        ended_today = self._gamesEndedToday()
+        return [(team_ids[g.home_team], team_ids[g.away_team]) for g in games
+                if g.game_id not in ended_today]
+
+    def _extractScheduledGames(self, json):
+        """Extract the regular season and playoff games of the
+        league's schedule as ScheduledGame tuples.
+        """
+        tricodes = self._teamIDtoTricodeDict()
+
+        games = []
+        for g in json['league']['standard']:
+            home_team = tricodes.get(g['hTeam']['teamId'])
+            away_team = tricodes.get(g['vTeam']['teamId'])
+
+            # Skipping preseason, the All-Star game and non-NBA teams:
+            if g['seasonStageId'] not in (2, 4) \
+               or home_team is None or away_team is None:
+                continue
+
+            games.append(ScheduledGame(g['gameId'], g['startDateEastern'],
+                                       home_team, away_team,
+                                       self._parseScore(g['hTeam']['score']),
+                                       self._parseScore(g['vTeam']['score']),
+                                       g['seasonStageId'] == 2,
+                                       g['statusNum'] == 3))
+        return games
+
+    def _scheduledGameFromScoreboard(self, game):
+        return ScheduledGame(game['game_id'], game['start_date'],
+                             game['home_team'], game['away_team'],
+                             game['home_score'], game['away_score'],
+                             None, game['ended'])
+
+    def _gamesEndedToday(self):
+        return frozenset(g['game_id'] for g in self._todayGames()
+                         if g['ended'])
+
     def _extractDivisionStandings(self, json):
         """Extract the standings for divisions in each conference."""
         json = json['league']['standard']['conference']
@@ -502,79 +1220,125 @@ class NBAStatsGetter():
 # Conversion to/from IDs
 ############################
     def playerFullName(self, person_id):
-        """Given a person ID, return the corresponding full name."""
-        names = self._fetchPersonIDdict()
-        return names[person_id]
+        """Given a person ID, return the corresponding full name.
+
+        A player missing from the roster (signed today, for instance)
+        makes it be refreshed; if they are still missing, their name
+        is '#<person ID>'.
+        """
+        name = self._playerIndex().names.get(person_id)
+        if name is None:
+            name = self._refreshedPlayerIndex().names.get(person_id)
+        if name is None:
+            return PlayerName('#{}'.format(person_id), '')
+        return name
+
+    def searchPlayers(self, name, limit=5):
+        """Return up to limit PlayerMatch for the players whose names
+        best match name (partial, unaccented or misspelled), best
+        first.
+        """
+        index = self._playerIndex()
+        tricodes = self._teamIDtoTricodeDict()
+        return [PlayerMatch(person_id, index.names[person_id],
+                            tricodes.get(index.teams.get(person_id)), score)
+                for (person_id, score) in index.search(name, limit)]
 
     def _teamID(self, team_tricode):
         """Given a tricode, return the team id corresponding to
         that team.
         """
-        team_ids = self._tricodeToTeamIDdict()
-        return team_ids[team_tricode]
+        return self._teamIndex().tricodes_to_ids[team_tricode]
 
     def _teamTricode(self, team_id):
         """Given a team id, return the tricode corresponding to
         that team.
         """
-        team_tricodes = self._teamIDtoTricodeDict()
-        return team_tricodes[team_id]
+        return self._teamIndex().ids_to_tricodes[team_id]
 
-    def _updateTeamDictionaries(self):
-        """Fetch (TeamId -> Tricode) and (Tricode -> TeamId)
-        dictionaries, but just if it is necessary (checks cache first).
+    def _teamIndex(self):
+        """Return the current TeamIndex, but build a new one if the
+        team list was refetched (checks cache first).
         """
         (json, from_cache) = self._getJSON(self._teamListURL(),
                                            return_cache_status=True)
 
         # We have a parsed valid copy, return that:
-        if from_cache and self._team_tricodes_to_ids is not None \
-           and self._team_ids_to_tricodes is not None:
-            return self._team_tricodes_to_ids
+        index = self._team_index
+        if from_cache and index is not None:
+            return index
 
-        # (Re-)creating dictionaries from JSON:
-        tricode_to_ids = dict()
-        ids_to_tricodes = dict()
-
-        for team in json['league']['standard']:
-            if team['isNBAFranchise']:
-                tricode_to_ids[team['tricode']] = team['teamId']
-                ids_to_tricodes[team['teamId']] = team['tricode']
-
-        self._team_tricodes_to_ids = tricode_to_ids
-        self._team_ids_to_tricodes = ids_to_tricodes
+        index = TeamIndex((team['tricode'], team['teamId'])
+                          for team in json['league']['standard']
+                          if team['isNBAFranchise'])
+        self._team_index = index
+        return index
 
     def _tricodeToTeamIDdict(self):
-        """Return a dictionary containing teams'
+        """Return a (read-only) dictionary containing teams'
         (tricode -> id) mappings.
         """
-        self._updateTeamDictionaries()
-        return self._team_tricodes_to_ids
+        return self._teamIndex().tricodes_to_ids
 
     def _teamIDtoTricodeDict(self):
-        """Return a dictionary containing teams'
+        """Return a (read-only) dictionary containing teams'
         (id -> tricode) mappings.
         """
-        self._updateTeamDictionaries()
-        return self._team_ids_to_tricodes
+        return self._teamIndex().ids_to_tricodes
 
-    def _fetchPersonIDdict(self):
-        """PersonID -> (FirstName, LastName)"""
+    def _playerIndex(self):
+        """Return the current PlayerIndex, but update it if the roster
+        was refetched (checks cache first).
+        """
         (json, from_cache) = self._getJSON(self._playerListURL(),
                                            return_cache_status=True)
 
-        # We have an parsed valid copy, return that:
-        if from_cache and self._person_ids is not None:
-            return self._person_ids
+        # We have a parsed valid copy, return that:
+        index = self._player_index
+        if from_cache and index is not None:
+            return index
+
+        return self._updatePlayerIndex(json)
 
-        # (Re-)creating dictionary from JSON:
-        person_ids = dict()
-        for player in json['league']['standard']:
-            person_ids[player['personId']] = PlayerName(player['firstName'],
-                                                        player['lastName'])
+    # Seconds between refreshes of the roster caused by unknown players:
+    _PLAYER_REFRESH_INTERVAL = 120
 
-        self._person_ids = person_ids
-        return person_ids
+    def _refreshedPlayerIndex(self):
+        """Refetch the roster (bypassing the cache) and return the
+        updated PlayerIndex. Concurrent callers wait for the same
+        refresh, and there is at most one every
+        _PLAYER_REFRESH_INTERVAL seconds; in between, or if it fails,
+        the current index is returned.
+        """
+        with self._player_refresh_lock:
+            now = time.monotonic()
+            last_refresh = self._last_player_refresh
+            if last_refresh is not None \
+               and now - last_refresh < self._PLAYER_REFRESH_INTERVAL:
+                return self._player_index
+            self._last_player_refresh = now
+
+            try:
+                json = self._getJSON(self._playerListURL(), refresh=True)
+            except Exception as e:
+                self._log.warning('Roster refresh failed: %s', e)
+                return self._player_index
+            return self._updatePlayerIndex(json)
+
+    def _updatePlayerIndex(self, json):
+        """Apply a roster document to the current PlayerIndex, swap
+        the result in and return it.
+        """
+        players = ((p['personId'], p['firstName'], p['lastName'],
+                    p.get('teamId', '')) for p in json['league']['standard'])
+
+        index = self._player_index
+        if index is None:
+            index = PlayerIndex(dict(), dict())
+        index = index.updated(players)
+
+        self._player_index = index
+        return index
 
 ############################
 # API URLS
@@ -583,8 +1347,13 @@ class NBAStatsGetter():
     def _todayEntryPointURL(self):
         return self._addBaseURL('/15m/prod/v1/today.json')
 
-    def _scoreboardURL(self):
-        return self._addBaseURL(self._todayJSONLink('todayScoreboard'))
+    def _scoreboardURL(self, date=None):
+        if date is None:
+            return self._addBaseURL(self._todayJSONLink('todayScoreboard'))
+
+        json_path = self._doubleBracketToSingle(self._todayJSONLink('scoreboard'))
+        json_path = json_path.format(gameDate=date)
+        return self._addBaseURL(json_path)
 
     # Non time-critical (cache for 15 minutes):
     def _playerListURL(self):
@@ -602,6 +1371,13 @@ class NBAStatsGetter():
         path = self._15MinMaxAgeLink(team_leaders_URL)
         return self._addBaseURL(path)
 
+    def _playerProfileURL(self, person_id):
+        profile_URL = self._todayJSONLink('playerProfile')
+        profile_URL = self._doubleBracketToSingle(profile_URL)
+        profile_URL = profile_URL.format(personId=person_id)
+        path = self._15MinMaxAgeLink(profile_URL)
+        return self._addBaseURL(path)
+
     def _standingsURL(self):
         path = self._15MinMaxAgeLink(self._todayJSONLink('leagueUngroupedStandings'))
         return self._addBaseURL(path)
@@ -611,6 +1387,12 @@ class NBAStatsGetter():
         json_path = json_path.format(gameDate=starting_date, gameId=game_id)
         return self._addBaseURL(json_path)
 
+    def _playByPlayURL(self, starting_date, game_id, period):
+        json_path = self._doubleBracketToSingle(self._todayJSONLink('pbp'))
+        json_path = json_path.format(gameDate=starting_date, gameId=game_id,
+                                     periodNum=period)
+        return self._addBaseURL(json_path)
+
     def _conferenceStandingsURL(self):
         path = self._15MinMaxAgeLink(self._todayJSONLink('leagueConfStandings'))
         return self._addBaseURL(path)
@@ -619,6 +1401,10 @@ class NBAStatsGetter():
         path = self._15MinMaxAgeLink(self._todayJSONLink('leagueDivStandings'))
         return self._addBaseURL(path)
 
+    def _scheduleURL(self):
+        path = self._15MinMaxAgeLink(self._todayJSONLink('leagueSchedule'))
+        return self._addBaseURL(path)
+
     def _playoffBracketEndPointExists(self):
         return ('playoffsBracket' in self._todayJSON()['links'])
 
@@ -636,8 +1422,50 @@ class NBAStatsGetter():
         return self._todayJSON()['anchorDate']
 
 ############################
+# Dates
+############################
+    def _parseDate(self, date):
+        """Normalize a date to the 'YYYYMMDD' format used by the API.
+        Throws a ValueError if the date is not valid.
+        """
+        if isinstance(date, (datetime.date, datetime.datetime)):
+            return date.strftime('%Y%m%d')
+
+        date = date.strip().lower()
+        if date == 'today':
+            return self._todayAnchorDate()
+        if date == 'yesterday':
+            today = self._dateFromString(self._todayAnchorDate())
+            return (today - datetime.timedelta(days=1)).strftime('%Y%m%d')
+
+        date = date.replace('-', '')
+        self._dateFromString(date) # Validates the date.
+        return date
+
+    def _dateFromString(self, date):
+        try:
+            return datetime.datetime.strptime(date, '%Y%m%d').date()
+        except ValueError:
+            raise ValueError('Invalid date: {}'.format(date))
+
+    def _dateRange(self, start_date, end_date):
+        """List of 'YYYYMMDD' dates in [start_date, end_date]."""
+        start = self._dateFromString(start_date)
+        end = self._dateFromString(end_date)
+
+        return [(start + datetime.timedelta(days=d)).strftime('%Y%m%d')
+                for d in range((end - start).days + 1)]
+
+    def _isPastDate(self, date):
+        """Whether all the games of a date are over (anything before
+        today's anchor date).
+        """
+        return date < self._todayAnchorDate()
+
 ############################
-    def _getJSON(self, url, return_cache_status=False):
+############################
+    def _getJSON(self, url, return_cache_status=False, immutable=False,
+                 refresh=False):
         """Get the JSON content of a given URL.
         If the return_cache_status is set to True, returns a tuple:
         (cache_status, json content).
@@ -645,29 +1473,154 @@ class NBAStatsGetter():
         Cache_status indicates whether the content was stored in the
         cache, and thus whether local copy of its interpretation is
         still valid.
+
+        Immutable documents are kept in memory and never revalidated.
+        With refresh, the document is requested even if the cached
+        copy is still fresh.
+        """
+        json = self._immutableDocument(url) if immutable else None
+
+        if json is not None:
+            from_cache = True
+        else:
+            (json, from_cache) = self._fetchJSON(url, refresh)
+            if immutable:
+                self._immutable_cache.set(url, json)
+                if self._shared_cache is not None:
+                    self._shared_cache.setDocument(url, json)
+
+        if return_cache_status:
+            return (json, from_cache)
+        return json
+
+    def _immutableDocument(self, url):
+        """Immutable document from the in-memory cache or, failing
+        that, from the shared cache (or None).
         """
+        json = self._immutable_cache.get(url)
+        if json is None and self._shared_cache is not None:
+            json = self._shared_cache.getDocument(url)
+            if json is not None:
+                self._immutable_cache.set(url, json)
+        return json
+
+    def _fetchJSON(self, url, refresh=False):
+        """Return a tuple (json content, from_cache) for a URL.
+
+        Concurrent requests for the same URL are coalesced: the first
+        caller performs the request and the rest wait for its result.
+        """
+        key = (url, refresh)
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = self._requestJSON(url, refresh)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+        return result
+
+    def _requestJSON(self, url, refresh=False):
         user_agent = 'Mozilla/5.0 \
                       (X11; Ubuntu; Linux x86_64; rv:45.0) \
                       Gecko/20100101 Firefox/45.0'
         header = {'User-Agent': user_agent}
+        if refresh:
+            header['Cache-Control'] = 'no-cache'
 
-        r = self._requests_session.get(url, headers=header)
+        r = self._session().get(url, headers=header)
+        # Error bodies are not documents; they must not be cached:
+        r.raise_for_status()
         json = r.json()
 
         if not r.from_cache:
-            print(url, r.status_code)
+            self._log.debug('%s %s', url, r.status_code)
 
-        if return_cache_status:
-            return (json, r.from_cache)
-        return json
+        return (json, r.from_cache)
+
+    def _session(self):
+        """Return the cached requests session, creating it (and
+        importing the HTTP libraries) the first time it is needed.
+        """
+        session = self._requests_session
+        if session is not None:
+            return session
+
+        with self._session_lock:
+            if self._requests_session is None:
+                import requests
+                from cachecontrol import CacheControlAdapter
+                try:
+                    from . import mirrors
+                except ImportError: # Running as a script
+                    import mirrors
+
+                # The cache is above the mirrors: it is keyed by the
+                # canonical URLs, whichever mirror answered.
+                self._mirror_set = mirrors.MirrorSet(self._api_servers,
+                                                     self._hedge_percentile)
+                if self._shared_cache is None:
+                    adapter = mirrors.mirroring(CacheControlAdapter)(
+                        mirrors=self._mirror_set)
+                else:
+                    try:
+                        from .sharedcache import LockingCacheControlAdapter
+                    except ImportError: # Running as a script
+                        from sharedcache import LockingCacheControlAdapter
+                    adapter = mirrors.mirroring(LockingCacheControlAdapter)(
+                        self._shared_cache, mirrors=self._mirror_set)
+
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._requests_session = session
+
+        return self._requests_session
 
 ############################
 ############################
     def _fetchGameBoxScore(self, start_date, game_id):
         game_url = self._scoreBoxURL(start_date, game_id)
-        json = self._getJSON(game_url)
+        json = self._getJSON(game_url, immutable=self._isPastDate(start_date))
         return json
 
+    def _fetchPlayByPlay(self, start_date, game_id, period):
+        url = self._playByPlayURL(start_date, game_id, period)
+        return self._getJSON(url, immutable=self._isPastDate(start_date))
+
+    # Seconds the documents of some endpoints are reused for:
+    _ENDPOINT_TTLS = {'playerProfile': 15 * 60}
+
+    def _fetchPlayerProfile(self, person_id):
+        url = self._playerProfileURL(person_id)
+        json = self._expiring_cache.get(url)
+        if json is None:
+            json = self._getJSON(url)
+            self._expiring_cache.set(url, json,
+                                     self._ENDPOINT_TTLS['playerProfile'])
+        return json
+
+    def _fetchPool(self):
+        with self._fetch_pool_lock:
+            if self._fetch_pool is None:
+                self._fetch_pool = ThreadPoolExecutor(
+                    max_workers=8, thread_name_prefix='NBAStats fetch')
+            return self._fetch_pool
+
     def _fetchTeamLeaders(self, team_id):
         url = self._teamLeadersURL(team_id)
         json = self._getJSON(url)
@@ -699,17 +1652,268 @@ class NBAStatsGetter():
     def _15MinMaxAgeLink(self, link):
         return link.replace('10s', '15m')
 
-def test():
-    n = NBAStatsGetter()
-    print('LAL record:', n.teamRecord('LAL'))
-    print('-'*60)
-    print('Standings:', n.conferenceStandings())
-    print('-'*60)
-    print('LAL leaders:', n.teamLeaders('LAL'))
-    print('-'*60)
-    # print(n.gameLeaders('LAL'))
-    # print(n.gamePlayersOnCourt('HOU'))
-    print(n.gamePlayersFouls('HOU'))
+############################
+# Serialization of results
+############################
+_RESULT_TUPLES = {t.__name__: t for t in (PlayerName, PlayerMatch,
+                                          PlayerSeasonStats, Record,
+                                          Streak, PlayerStatistic,
+                                          LeaderStatistic, MirrorHealth,
+                                          ScheduledGame, PlayoffOdds,
+                                          PlayoffMatchUp)}
+
+def encodeResult(value):
+    """Convert the result of an NBAStatsGetter method to a value that
+    can be dumped as JSON, and that decodeResult() turns back into the
+    original (namedtuples, tuples, sets, non-string keys and playoff
+    brackets included).
+    """
+    if isinstance(value, PlayoffBracket):
+        return {'__bracket__': encodeResult(value._rounds),
+                'current_round': value.current_round}
+    if isinstance(value, tuple):
+        name = type(value).__name__ if type(value).__name__ in _RESULT_TUPLES \
+               else None
+        return {'__tuple__': name, 'items': [encodeResult(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {'__set__': [encodeResult(v) for v in value]}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith('__') for k in value):
+            return {k: encodeResult(v) for (k, v) in value.items()}
+        return {'__dict__': [[encodeResult(k), encodeResult(v)]
+                             for (k, v) in value.items()]}
+    if isinstance(value, list):
+        return [encodeResult(v) for v in value]
+    return value
+
+def decodeResult(value):
+    """Inverse of encodeResult()."""
+    if isinstance(value, list):
+        return [decodeResult(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+
+    if '__tuple__' in value:
+        items = [decodeResult(v) for v in value['items']]
+        if value['__tuple__'] is None:
+            return tuple(items)
+        return _RESULT_TUPLES[value['__tuple__']](*items)
+    if '__set__' in value:
+        return frozenset(decodeResult(v) for v in value['__set__'])
+    if '__dict__' in value:
+        return {decodeResult(k): decodeResult(v) for (k, v) in value['__dict__']}
+    if '__bracket__' in value:
+        return PlayoffBracket(decodeResult(value['__bracket__']),
+                              value['current_round'])
+    return {k: decodeResult(v) for (k, v) in value.items()}
+
+def plainResult(value):
+    """Like encodeResult(), but with namedtuples as dictionaries and
+    without type information, for consumers that are not Python.
+    """
+    if isinstance(value, PlayoffBracket):
+        return {'current_round': value.current_round,
+                'rounds': plainResult(value._rounds)}
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        return {k: plainResult(v) for (k, v) in value._asdict().items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(plainResult(v) for v in value)
+    if isinstance(value, dict):
+        return {str(k): plainResult(v) for (k, v) in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plainResult(v) for v in value]
+    return value
+
+# Types of the parameters whose default (None) does not tell it:
+_ARGUMENT_TYPES = {'person_ids': list, 'timeout': float}
+
+_TRUE_STRINGS = frozenset(('1', 'true', 'yes', 'on'))
+_FALSE_STRINGS = frozenset(('0', 'false', 'no', 'off'))
+
+def convertArgument(parameter, value):
+    """Convert a string argument (of a query or a service request) to
+    the type of the parameter's default if it is a bool, an int or a
+    float, or to the type in _ARGUMENT_TYPES (lists are comma-separated).
+    Raises ValueError if it is not one.
+    """
+    argument_type = _ARGUMENT_TYPES.get(parameter.name)
+    if argument_type is list:
+        return value.split(',')
+    if argument_type is float:
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError('Not a number {}: {}'.format(parameter.name,
+                                                          value))
+
+    default = parameter.default
+    # bool first, it is a subclass of int:
+    if isinstance(default, bool):
+        if value.lower() in _TRUE_STRINGS:
+            return True
+        if value.lower() in _FALSE_STRINGS:
+            return False
+        raise ValueError('Not a boolean {}: {}'.format(parameter.name, value))
+
+    if not isinstance(default, (int, float)):
+        return value
+    try:
+        return type(default)(value)
+    except ValueError:
+        raise ValueError('Not {} {}: {}'.format(
+            'an integer' if isinstance(default, int) else 'a number',
+            parameter.name, value))
+
+############################
+# Command line
+############################
+# Short names for the queries of the 'query' command:
+QUERY_ALIASES = {'record': 'teamRecord',
+                 'leaders': 'teamLeaders',
+                 'standings': 'conferenceStandings',
+                 'division': 'divisionStandings',
+                 'bracket': 'playoffBracket',
+                 'odds': 'playoffOdds',
+                 'scores': 'scoreboard',
+                 'range': 'scoreboards',
+                 'next': 'nextGames',
+                 'last': 'lastResults',
+                 'remaining': 'remainingSchedule',
+                 'player': 'searchPlayers',
+                 'profile': 'playerSeasonStats'}
+
+def parseQuery(query):
+    """Parse '<method or alias>[:<argument>...]' into a list of
+    (query, method name, arguments) tuples. A comma-separated first
+    argument ('record:LAL,BOS') is expanded into one query per value.
+    """
+    (name, *arguments) = query.split(':')
+    method_name = QUERY_ALIASES.get(name, name)
+
+    if method_name.startswith('_') \
+       or not callable(getattr(NBAStatsGetter, method_name, None)):
+        raise ValueError('Unknown query: {}'.format(name))
+
+    if not arguments or ',' not in arguments[0]:
+        return [(query, method_name, arguments)]
+
+    return [(':'.join([name, first] + arguments[1:]), method_name,
+             [first] + arguments[1:]) for first in arguments[0].split(',')]
+
+def runQuery(stats_getter, method_name, arguments):
+    """Call a getter method with string arguments (see
+    convertArgument()). Returns a dictionary with the result or the
+    error, and the time it took.
+    """
+    import inspect
+    method = getattr(stats_getter, method_name)
+    parameters = list(inspect.signature(method).parameters.values())
+
+    start = time.monotonic()
+    try:
+        arguments = [convertArgument(p, a)
+                     for (p, a) in zip(parameters, arguments)]
+        output = {'result': plainResult(method(*arguments))}
+    except Exception as e:
+        output = {'error': '{}: {}'.format(type(e).__name__, e)}
+
+    output['seconds'] = round(time.monotonic() - start, 4)
+    return output
+
+def runQueries(stats_getter, queries, max_workers=8):
+    """Run the queries concurrently on one getter (and thus one cache),
+    yielding one dictionary per query, in order.
+    """
+    parsed = [q for query in queries for q in parseQuery(query)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(runQuery, stats_getter, method_name, arguments)
+                   for (_, method_name, arguments) in parsed]
+
+        for ((query, method_name, arguments), future) in zip(parsed, futures):
+            output = {'query': query, 'method': method_name,
+                      'arguments': arguments}
+            output.update(future.result())
+            yield output
+
+def main(argv=None):
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description='NBA.com stats.')
+    commands = parser.add_subparsers(dest='command')
+
+    query_parser = commands.add_parser(
+        'query', help='run queries and print their results as JSON Lines',
+        description='Queries are <method or alias>[:<argument>...], e.g. '
+                    'record:LAL,BOS leaders:GSW standings bracket '
+                    'range:2017-03-01:2017-03-07. Aliases: {}.'.format(
+                        ', '.join(sorted(QUERY_ALIASES))))
+    query_parser.add_argument('queries', nargs='*', metavar='query')
+    query_parser.add_argument('-f', '--file', type=argparse.FileType('r'),
+                              help="read queries from a file ('-' for "
+                                   "standard input), one per line")
+    query_parser.add_argument('-j', '--workers', type=int, default=8,
+                              help='queries run at the same time')
+    query_parser.add_argument('--shared-cache', metavar='URL',
+                              help='see sharedcache.fromURL()')
+    query_parser.add_argument('--api-server', action='append', metavar='URL',
+                              help='server of the documents (repeat for '
+                                   'mirrors, in order of preference)')
+
+    serve_parser = commands.add_parser('serve', help='serve the stats over '
+                                                     'HTTP (see service.py)')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--poll-interval', type=int, default=30,
+                              help='seconds between scoreboard checks')
+    serve_parser.add_argument('--max-age', type=int, default=60,
+                              help='seconds a response is reused for')
+    serve_parser.add_argument('--shared-cache', metavar='URL',
+                              help='see sharedcache.fromURL()')
+    serve_parser.add_argument('--api-server', action='append', metavar='URL',
+                              help='server of the documents (repeat for '
+                                   'mirrors, in order of preference)')
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == 'serve':
+        import service
+        service.serve(arguments.host, arguments.port,
+                      arguments.poll_interval, arguments.max_age,
+                      arguments.shared_cache, arguments.api_server)
+        return 0
+
+    if arguments.command != 'query':
+        parser.print_help()
+        return 2
+
+    queries = list(arguments.queries)
+    if arguments.file is not None:
+        queries.extend(line.strip() for line in arguments.file
+                       if line.strip() and not line.startswith('#'))
+
+    cache = None
+    if arguments.shared_cache is not None:
+        import sharedcache
+        cache = sharedcache.fromURL(arguments.shared_cache)
+
+    start = time.monotonic()
+    (total, failed) = (0, 0)
+    try:
+        getter = NBAStatsGetter(cache, arguments.api_server or API_SERVER)
+        outputs = runQueries(getter, queries, arguments.workers)
+        for output in outputs:
+            total += 1
+            failed += 'error' in output
+            print(json.dumps(output), flush=True)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print('{} queries, {} failed, {:.2f}s'.format(
+        total, failed, time.monotonic() - start), file=sys.stderr)
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    test()
\ No newline at end of file
+    raise SystemExit(main())
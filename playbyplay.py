@@ -0,0 +1,168 @@
+###
+# Incremental tracking of the play-by-play of games in progress.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import threading
+
+from collections import Counter
+from collections import deque
+from collections import namedtuple
+
+Play = namedtuple('Play', 'period, clock, team_id, person_id, description,'
+                          'home_score, away_score')
+
+# kind is one of 'run', 'lead_change' or 'fouled_out'.
+PlayEvent = namedtuple('PlayEvent', 'kind, play, team_id, value')
+
+# Scoring runs are reported when they reach this many points.
+RUN_THRESHOLD = 8
+
+FOUL_LIMIT = 6
+
+# eventMsgType of fouls in the play-by-play feed.
+_FOUL_EVENT = '6'
+
+
+class GameTracker():
+    """Follows the play-by-play of a game.
+
+    Every update only processes the plays that were not seen before,
+    keeping the latest ones in a bounded buffer and detecting scoring
+    runs, lead changes and players that foul out as they happen.
+    """
+
+    def __init__(self, game_id, home_team_id, away_team_id,
+                 team_names=None, max_plays=50, max_events=20):
+        self.game_id = game_id
+        self._home_team_id = home_team_id
+        self._away_team_id = away_team_id
+
+        # Team id -> name (tricode), for display.
+        self.team_names = team_names or dict()
+
+        self._period = 1        # Period being read,
+        self._seen_plays = 0    # and number of its plays processed.
+
+        self._plays = deque(maxlen=max_plays)
+        self._events = deque(maxlen=max_events)
+
+        self._home_score = 0
+        self._away_score = 0
+        self._leader = None     # Team id of the last team to lead.
+        self.lead_changes = 0
+
+        self._run_team = None
+        self.run_points = 0     # Points of the current unanswered run.
+
+        self._fouls = Counter() # person id -> personal fouls
+
+        self._lock = threading.Lock()
+
+    def update(self, current_period, fetch_period):
+        """Process the new plays up to current_period. fetch_period(n)
+        must return the play-by-play document of period n.
+
+        Returns the list of PlayEvent detected in the new plays.
+        """
+        with self._lock:
+            new_events = []
+
+            for period in range(self._period, current_period + 1):
+                plays = fetch_period(period)['plays']
+
+                for play in plays[self._seen_plays:]:
+                    new_events.extend(self._processPlay(period, play))
+
+                if period < current_period:
+                    (self._period, self._seen_plays) = (period + 1, 0)
+                else:
+                    self._seen_plays = len(plays)
+
+            self._events.extend(new_events)
+            return new_events
+
+    def lastPlays(self, count=5):
+        with self._lock:
+            return list(self._plays)[-count:]
+
+    def lastEvents(self, count=5):
+        with self._lock:
+            return list(self._events)[-count:]
+
+    def currentRun(self):
+        """Return (team id, points) for the current scoring run."""
+        with self._lock:
+            return (self._run_team, self.run_points)
+
+    def _processPlay(self, period, json):
+        home_score = int(json['hTeamScore'] or 0)
+        away_score = int(json['vTeamScore'] or 0)
+
+        play = Play(period, json['clock'], json['teamId'], json['personId'],
+                    json['description'], home_score, away_score)
+        self._plays.append(play)
+
+        events = []
+        if json['isScoreChange']:
+            events.extend(self._processScore(play))
+
+        if json['eventMsgType'] == _FOUL_EVENT and play.person_id \
+           and 'technical' not in play.description.lower():
+            self._fouls[play.person_id] += 1
+            if self._fouls[play.person_id] == FOUL_LIMIT:
+                events.append(PlayEvent('fouled_out', play, play.team_id,
+                                        play.person_id))
+
+        return events
+
+    def _processScore(self, play):
+        events = []
+
+        home_points = play.home_score - self._home_score
+        away_points = play.away_score - self._away_score
+        (self._home_score, self._away_score) = (play.home_score,
+                                                play.away_score)
+
+        if home_points > 0:
+            scoring_team = self._home_team_id
+        elif away_points > 0:
+            scoring_team = self._away_team_id
+        else: # Score corrections
+            return events
+
+        points = max(home_points, away_points)
+        if scoring_team == self._run_team:
+            previous_run = self.run_points
+            self.run_points += points
+        else:
+            (self._run_team, self.run_points, previous_run) = (scoring_team,
+                                                                points, 0)
+
+        if previous_run < RUN_THRESHOLD <= self.run_points:
+            events.append(PlayEvent('run', play, scoring_team,
+                                    self.run_points))
+
+        if play.home_score != play.away_score:
+            leader = (self._home_team_id if play.home_score > play.away_score
+                      else self._away_team_id)
+            if self._leader is not None and leader != self._leader:
+                self.lead_changes += 1
+                events.append(PlayEvent('lead_change', play, leader,
+                                        self.lead_changes))
+            self._leader = leader
+
+        return events
@@ -0,0 +1,146 @@
+###
+# Search of players by name.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import bisect
+import re
+import unicodedata
+
+from collections import Counter
+from collections import defaultdict
+
+_LAST_CHARACTER = chr(0x10ffff)
+
+
+def normalize(name):
+    """Lowercase a name and remove its accents ('Nenê' -> 'nene') and
+    punctuation ("D'Angelo" -> 'dangelo'). Hyphens separate words.
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    name = re.sub(r'[^\w\s]', '', name.casefold().replace('-', ' '))
+    return ' '.join(name.split())
+
+
+def trigrams(name):
+    """Trigrams of the words of a name, padded so that the beginnings
+    of the words weigh more.
+    """
+    result = set()
+    for word in name.split():
+        padded = '  {} '.format(word)
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class PlayerSearchIndex():
+    """Finds players by name: whole or partial words in any order
+    ('leb jam'), accents optional. When no name has words starting with
+    the ones searched, the names with the most trigrams in common are
+    returned instead, so misspellings ('jmaes harden') are found too.
+    """
+
+    # Fraction of the trigrams of a search that a name must contain to
+    # be a fuzzy match:
+    MIN_FUZZY_CONTAINMENT = 0.5
+
+    def __init__(self, names):
+        """names is a mapping (person id -> (first name, last name))."""
+        self._names = dict()                   # Person id -> normalized
+        self._trigram_ids = defaultdict(list)  # Trigram -> [person id]
+        self._trigram_counts = dict()          # Person id -> trigrams
+
+        words = []
+        for (person_id, (first_name, last_name)) in names.items():
+            name = normalize('{} {}'.format(first_name, last_name))
+            self._names[person_id] = name
+            words.extend((word, person_id) for word in set(name.split()))
+
+            name_trigrams = trigrams(name)
+            self._trigram_counts[person_id] = len(name_trigrams)
+            for trigram in name_trigrams:
+                self._trigram_ids[trigram].append(person_id)
+
+        # Sorted, so the words with a given prefix are contiguous:
+        words.sort()
+        self._words = [word for (word, _) in words]
+        self._word_ids = [person_id for (_, person_id) in words]
+
+    def __len__(self):
+        return len(self._names)
+
+    def search(self, query, limit=5):
+        """Return up to limit (person id, score) tuples, best matches
+        first. The score is 1 for an exact match and less than 1
+        otherwise.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        matches = self._prefixMatches(query) or self._fuzzyMatches(query)
+        ranked = sorted(matches.items(),
+                        key=lambda m: (-m[1], self._names[m[0]]))
+        return ranked[:limit]
+
+    def _prefixMatches(self, query):
+        """Players with a word starting with every word of the query,
+        scored by how much of their names the query covers.
+        """
+        candidates = None
+        for word in query.split():
+            start = bisect.bisect_left(self._words, word)
+            stop = bisect.bisect_left(self._words, word + _LAST_CHARACTER,
+                                      start)
+            person_ids = set(self._word_ids[start:stop])
+
+            candidates = person_ids if candidates is None \
+                         else candidates & person_ids
+            if not candidates:
+                return dict()
+
+        return {p: self._prefixScore(query, self._names[p])
+                for p in candidates}
+
+    def _prefixScore(self, query, name):
+        if query == name:
+            return 1.0
+
+        # Whole words count more than prefixes ('love' ranks Kevin Love
+        # over Jordan Loveridge):
+        name_words = name.split()
+        whole_words = sum(1 for w in query.split() if w in name_words)
+        return (0.5 * min(len(query) / len(name), 1)
+                + 0.45 * whole_words / len(name_words))
+
+    def _fuzzyMatches(self, query):
+        query_trigrams = trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigram_ids.get(trigram, ()))
+
+        matches = dict()
+        for (person_id, count) in shared.items():
+            containment = count / len(query_trigrams)
+            if containment < self.MIN_FUZZY_CONTAINMENT:
+                continue
+            union = len(query_trigrams) + self._trigram_counts[person_id] \
+                    - count
+            # Below any exact match:
+            matches[person_id] = 0.9 * (0.7 * containment
+                                        + 0.3 * count / union)
+        return matches
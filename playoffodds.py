@@ -0,0 +1,161 @@
+###
+# Monte Carlo simulation of the rest of the regular season to estimate
+# playoff and seeding probabilities.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of seasons simulated at once. Bounds the size of the
+# (seasons x remaining games) arrays.
+CHUNK_SIZE = 20000
+
+# Games added to every record to regress win percentages to .500.
+REGRESSION_GAMES = 10
+
+# Log-odds advantage of the home team.
+HOME_ADVANTAGE = 0.3
+
+
+def isAvailable():
+    return numpy is not None
+
+
+def winProbabilities(wins, losses, home_teams, away_teams):
+    """Probability of the home team winning each game, from the
+    (regressed) win percentages of both teams using log5 plus home
+    advantage.
+    """
+    wins = numpy.asarray(wins, dtype=numpy.float64)
+    losses = numpy.asarray(losses, dtype=numpy.float64)
+
+    strength = (wins + REGRESSION_GAMES / 2) / (wins + losses
+                                                + REGRESSION_GAMES)
+    log_odds = numpy.log(strength / (1 - strength))
+
+    game_log_odds = (log_odds[home_teams] - log_odds[away_teams]
+                     + HOME_ADVANTAGE)
+    return 1 / (1 + numpy.exp(-game_log_odds))
+
+
+def simulate(wins, losses, conferences, home_teams, away_teams,
+             simulations=200000, processes=0, time_budget=None, seed=None):
+    """Simulate the remaining games <simulations> times.
+
+    wins, losses and conferences have one entry per team; home_teams
+    and away_teams are the indexes of the teams in each remaining
+    game. Seeds are assigned within each conference by wins, with
+    ties broken at random.
+
+    If time_budget (seconds) is given, stops early when it runs out
+    (after at least one batch). With processes > 0 the batches run in
+    a process pool.
+
+    Returns a tuple (seed_counts, simulations run), where
+    seed_counts[team][seed - 1] is the number of simulations in which
+    the team finished with that seed.
+    """
+    if numpy is None:
+        raise RuntimeError('NumPy is required for playoff odds')
+
+    conferences = numpy.asarray(conferences)
+    home_teams = numpy.asarray(home_teams, dtype=numpy.intp)
+    away_teams = numpy.asarray(away_teams, dtype=numpy.intp)
+
+    p_home = winProbabilities(wins, losses, home_teams, away_teams)
+    members = [numpy.flatnonzero(conferences == c)
+               for c in numpy.unique(conferences)]
+
+    chunks = [min(CHUNK_SIZE, simulations - start)
+              for start in range(0, simulations, CHUNK_SIZE)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(numpy.asarray(wins), p_home, home_teams, away_teams, members,
+              size, chunk_seed) for (size, chunk_seed) in zip(chunks, seeds)]
+
+    deadline = None if time_budget is None \
+               else time.monotonic() + time_budget
+
+    if processes:
+        results = _runInPool(tasks, processes, deadline)
+    else:
+        results = []
+        for task in tasks:
+            results.append(_simulateChunk(task))
+            if deadline is not None and time.monotonic() > deadline:
+                break
+
+    seed_counts = sum(counts for (counts, _) in results)
+    return (seed_counts, sum(size for (_, size) in results))
+
+
+def _runInPool(tasks, processes, deadline):
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_simulateChunk, task) for task in tasks]
+
+        timeout = None if deadline is None \
+                  else max(deadline - time.monotonic(), 0)
+        (done, not_done) = wait(futures, timeout=timeout)
+
+        if not done: # Always return at least one batch.
+            (done, not_done) = wait(futures, return_when=FIRST_COMPLETED)
+        for future in not_done:
+            future.cancel()
+
+        return [future.result() for future in done]
+
+
+def _simulateChunk(task):
+    (wins, p_home, home_teams, away_teams, members, size, seed) = task
+    rng = numpy.random.default_rng(seed)
+    teams = len(wins)
+
+    home_won = rng.random((size, len(p_home)), dtype=numpy.float32) < p_home
+
+    # Final wins = current wins + games won. With one-hot (games x teams)
+    # matrices H and A for the home and away teams, the games won are
+    # home_won @ H + (1 - home_won) @ A = home_won @ (H - A) + sum(A).
+    games = numpy.arange(len(p_home))
+    home_minus_away = numpy.zeros((len(p_home), teams), dtype=numpy.float32)
+    numpy.add.at(home_minus_away, (games, home_teams), 1)
+    numpy.add.at(home_minus_away, (games, away_teams), -1)
+
+    away_games = numpy.bincount(away_teams, minlength=teams)
+    final_wins = (home_won.astype(numpy.float32) @ home_minus_away
+                  + (wins + away_games).astype(numpy.float32))
+
+    # Random tie-breaks (the real tie-breaking rules are not modelled):
+    scores = final_wins + rng.random((size, teams), dtype=numpy.float32) * 0.5
+
+    max_seed = max(len(m) for m in members)
+    seed_counts = numpy.zeros(teams * max_seed, dtype=numpy.int64)
+    for conference in members:
+        order = numpy.argsort(-scores[:, conference], axis=1)
+        ranks = numpy.argsort(order, axis=1) # Inverse permutation.
+
+        cells = conference[numpy.newaxis, :] * max_seed + ranks
+        seed_counts += numpy.bincount(cells.ravel(),
+                                      minlength=teams * max_seed)
+
+    return (seed_counts.reshape(teams, max_seed), size)
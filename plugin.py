@@ -17,11 +17,21 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ###
 
+import datetime
+import os
+import threading
+
+from collections import OrderedDict
+
+import supybot.conf as conf
 import supybot.utils as utils
 from supybot.commands import *
 import supybot.plugins as plugins
+import supybot.ircmsgs as ircmsgs
 import supybot.ircutils as ircutils
 import supybot.callbacks as callbacks
+import supybot.schedule as schedule
+import supybot.world as world
 try:
     from supybot.i18n import PluginInternationalization
     _ = PluginInternationalization('NBAStats')
@@ -31,6 +41,8 @@ except ImportError:
     _ = lambda x: x
 
 from . import nbastats
+from . import scorediff
+from . import seasonstore
 
 class NBAStats(callbacks.Plugin):
     """Get stats from NBA.com"""
@@ -40,9 +52,52 @@ class NBAStats(callbacks.Plugin):
         self.__parent = super(NBAStats, self)
         self.__parent.__init__(irc)
 
-        self._stats_getter = nbastats.NBAStatsGetter()
+        self._shared_cache = self._sharedCache()
+        getter_arguments = (self._shared_cache,
+                            self.registryValue('apiServers')
+                            or nbastats.API_SERVER,
+                            self.registryValue('hedgePercentile'), self.log)
+        if self.registryValue('serviceURL'):
+            from . import service
+            # The methods that the service does not serve run locally:
+            self._stats_getter = service.StatsServiceClient(
+                self.registryValue('serviceURL'), 10, *getter_arguments)
+        else:
+            self._stats_getter = nbastats.NBAStatsGetter(*getter_arguments)
         self._irc = irc
 
+        self._season_store = None
+        self._stat_matrix = None
+        self._stat_matrix_lock = threading.Lock() # Held while rebuilding
+
+        if self.registryValue('warmUp'):
+            self._stats_getter.warmUp()
+
+        # Changes between the scoreboards seen by the subscriptions'
+        # poller are announced as they are detected:
+        self._scoreboard_differ = scorediff.ScoreboardDiffer()
+        self._scoreboard_differ.addListener(self._announceEvents)
+        self._poll_lock = threading.Lock()
+
+        # Command name -> profiling.CommandProfile, see profile:
+        self._profiles = dict()
+        self._profiles_lock = threading.Lock()
+
+        schedule.addPeriodicEvent(self._poll,
+                                  self.registryValue('pollInterval'),
+                                  name=self._POLL_EVENT, now=False)
+
+    _POLL_EVENT = 'NBAStats_subscriptions'
+
+    def die(self):
+        schedule.removePeriodicEvent(self._POLL_EVENT)
+
+        if self._season_store is not None:
+            self._season_store.close()
+        if self._shared_cache is not None:
+            self._shared_cache.close()
+        self.__parent.die()
+
 ############################
 # Public commands
 ############################
@@ -144,6 +199,38 @@ class NBAStats(callbacks.Plugin):
 
     oncourt = wrap(onCourt, [('text')])
 
+    def plays(self, irc, msg, args, team, count):
+        """<TTT> [<count>]
+
+        Get the last plays (3 by default) of a game in progress,
+        along with its lead changes, current scoring run and the
+        latest runs and players fouled out."""
+        team = team.upper()
+        if not self._validateTeamIsPlaying(team):
+            return
+
+        tracker = self._stats_getter.gamePlayByPlay(team)
+
+        plays = ['{} {}'.format(self._bold(self._formatPlayTime(p)),
+                                p.description)
+                 for p in tracker.lastPlays(count or 3)]
+
+        summary = ['Lead changes: {}'.format(tracker.lead_changes)]
+
+        (run_team, run_points) = tracker.currentRun()
+        if run_team is not None:
+            summary.append('Run: {} {}-0'.format(
+                tracker.team_names.get(run_team, run_team), run_points))
+
+        for event in tracker.lastEvents(3):
+            summary.append(self._playEventToString(tracker, event))
+
+        irc.reply('{}: {} | {}'.format(self._bold('{} Plays'.format(team)),
+                                       ' | '.join(plays) or 'No plays yet',
+                                       self._orange(', '.join(summary))))
+
+    plays = wrap(plays, ['something', optional('positiveInt')])
+
     def getFouls(self, irc, msg, args, team):
         """<TTT> (team tri-code)
 
@@ -164,6 +251,55 @@ class NBAStats(callbacks.Plugin):
 
     fouls = wrap(getFouls, [('text')])
 
+    def subscribe(self, irc, msg, args, channel, teams):
+        """[<channel>] <TTT|all> [<TTT> ...]
+
+        Announce in the channel the tip-offs, ends of quarters, final
+        scores and players with 5 or 6 fouls of the given teams' games
+        (or of all games)."""
+        teams = self._parseSubscriptionTeams(irc, teams)
+        if teams is None:
+            return
+
+        subscriptions = set(self.registryValue('subscriptions', channel,
+                                               irc.network))
+        self.setRegistryValue('subscriptions', sorted(subscriptions | teams),
+                              channel, irc.network)
+        irc.replySuccess()
+
+    subscribe = wrap(subscribe, ['op', many('something')])
+
+    def unsubscribe(self, irc, msg, args, channel, teams):
+        """[<channel>] <TTT|all> [<TTT> ...]
+
+        Stop the announcements of the given teams' games (or of all
+        games) in the channel."""
+        teams = self._parseSubscriptionTeams(irc, teams)
+        if teams is None:
+            return
+
+        subscriptions = set(self.registryValue('subscriptions', channel,
+                                               irc.network))
+        self.setRegistryValue('subscriptions', sorted(subscriptions - teams),
+                              channel, irc.network)
+        irc.replySuccess()
+
+    unsubscribe = wrap(unsubscribe, ['op', many('something')])
+
+    def subscriptions(self, irc, msg, args, channel):
+        """[<channel>]
+
+        List the teams whose games are announced in the channel."""
+        subscriptions = self.registryValue('subscriptions', channel,
+                                           irc.network)
+        if not subscriptions:
+            irc.reply('There are no subscriptions in {}.'.format(channel))
+            return
+
+        irc.reply(', '.join(subscriptions))
+
+    subscriptions = wrap(subscriptions, ['channel'])
+
     def standings(self, irc, msg, args, category):
         """[<conference/division>]
 
@@ -179,13 +315,18 @@ class NBAStats(callbacks.Plugin):
             display_west = conference is None or conference == 'west'
             display_east = conference is None or conference == 'east'
 
+            segments = []
             if display_east:
                 standings_east = self._printableStandings(standings['east'])
-                irc.reply('{}: {}'.format(self._bold('EAST'), standings_east))
+                segments.append('{}: {}'.format(self._bold('EAST'),
+                                                standings_east))
 
             if display_west:
                 standings_west = self._printableStandings(standings['west'])
-                irc.reply('{}: {}'.format(self._bold('WEST'), standings_west))
+                segments.append('{}: {}'.format(self._bold('WEST'),
+                                                standings_west))
+
+            self._replyPacked(irc, msg, segments)
             return
 
         # Argument is a division:
@@ -210,9 +351,9 @@ class NBAStats(callbacks.Plugin):
         Get the playoff bracket for a given round (1-4). If none is
         specified returns the current round.
         """
-        current_round = self._stats_getter.currentPlayoffRound()
+        bracket = self._stats_getter.playoffBracket()
 
-        if current_round is None:
+        if bracket is None:
             irc.error('Playoffs are not in progress.')
             return
 
@@ -222,21 +363,332 @@ class NBAStats(callbacks.Plugin):
             return
 
         if round_number is None:
-            round_number = current_round
+            round_number = bracket.current_round
 
-        round_games = self._stats_getter.playoffMatchUps(round_number)
+        round_games = bracket.matchUps(round_number)
 
         if not round_games:
             irc.reply('Round {} is not yet determined.'.format(round_number))
             return
 
+        segments = []
         for conference, match_ups in round_games.items():
             title = self._printablePlayoffRoundTitle(round_number, conference)
-            irc.reply('{}: {}'.format(self._bold(title),
-                                      self._printablePlayoffBracket(match_ups)))
+            segments.append('{}: {}'.format(
+                self._bold(title), self._printablePlayoffBracket(match_ups)))
+
+        self._replyPacked(irc, msg, segments, separator=' || ')
 
     playoffs = wrap(playoffs, [optional('int')])
 
+    def odds(self, irc, msg, args, conference):
+        """[<conference>]
+
+        Get each team's chances of making the playoffs (and its most
+        likely seed), from simulations of the rest of the season."""
+        if conference is not None \
+           and conference.lower() not in self._stats_getter.conferences():
+            irc.error('Valid conferences are: east, west.')
+            return
+
+        try:
+            odds = self._stats_getter.playoffOdds(
+                self.registryValue('oddsSimulations'),
+                self.registryValue('oddsProcesses'))
+        except RuntimeError as e:
+            irc.error(str(e))
+            return
+
+        segments = []
+        for (name, conference_odds) in sorted(odds.items()):
+            if conference is not None and name != conference.lower():
+                continue
+            segments.append('{}: {}'.format(self._bold(name.upper()),
+                                            self._printablePlayoffOdds(
+                                                conference_odds)))
+
+        self._replyPacked(irc, msg, segments, separator=' || ')
+
+    odds = wrap(odds, [optional('something')])
+
+    def nextGames(self, irc, msg, args, team, count):
+        """<TTT> [<count>]
+
+        Get the team's next games."""
+        team = team.upper()
+        if not self._validateTeamIsValid(team):
+            return
+
+        games = self._stats_getter.nextGames(team, count or 1)
+        if not games:
+            irc.reply('{} has no games left this season.'.format(team))
+            return
+
+        title = self._bold('{} Next'.format(team))
+        irc.reply('{}: {}'.format(title, ' | '.join(
+            self._scheduledGameToString(g, team) for g in games)))
+
+    next = wrap(nextGames, ['something', optional('positiveInt')])
+
+    def lastResults(self, irc, msg, args, team, count):
+        """<TTT> [<count>]
+
+        Get the results of the team's last games (5 by default)."""
+        team = team.upper()
+        if not self._validateTeamIsValid(team):
+            return
+
+        games = self._stats_getter.lastResults(team, count or 5)
+        if not games:
+            irc.reply('{} has not played yet.'.format(team))
+            return
+
+        title = self._bold('{} Last {}'.format(team, len(games)))
+        irc.reply('{}: {}'.format(title, ' | '.join(
+            self._scheduledGameResultToString(g, team) for g in games)))
+
+    last = wrap(lastResults, ['something', optional('positiveInt')])
+
+    def remaining(self, irc, msg, args, team):
+        """<TTT> (team tri-code)
+
+        Get the number of home and away games the team has left in the
+        regular season, and its remaining back-to-backs."""
+        team = team.upper()
+        if not self._validateTeamIsValid(team):
+            return
+
+        schedule = self._stats_getter.remainingSchedule(team)
+
+        back_to_backs = ', '.join(
+            '{}/{}'.format(self._formatScheduleDate(first.date),
+                           self._formatScheduleDate(second.date))
+            for (first, second) in schedule['back_to_backs'])
+
+        irc.reply('{} {} Home | {} Away | {} Back-to-backs{}'.format(
+            self._bold('{} ~'.format(team)), schedule['home'],
+            schedule['away'], len(schedule['back_to_backs']),
+            ' ({})'.format(back_to_backs) if back_to_backs else ''))
+
+    remaining = wrap(remaining, ['something'])
+
+    def results(self, irc, msg, args, date):
+        """[<date>]
+
+        Get the scores of the games played on a date (YYYY-MM-DD,
+        'today' or 'yesterday'). Defaults to yesterday."""
+        try:
+            games = self._stats_getter.scoreboard(date or 'yesterday')
+        except ValueError as e:
+            irc.error(str(e))
+            return
+
+        if not games:
+            irc.reply('There were no games on that date.')
+            return
+
+        irc.reply(' | '.join(self._gameResultToString(g) for g in games))
+
+    results = wrap(results, [optional('something')])
+
+    def scores(self, irc, msg, args):
+        """takes no arguments
+
+        Get the score and status of every game of today."""
+        games = self._stats_getter.scoreboard()
+
+        if not games:
+            irc.reply('There are no games today.')
+            return
+
+        self._replyPacked(irc, msg,
+                          [self._gameStatusToString(g) for g in games])
+
+    scores = wrap(scores)
+
+    def boxScore(self, irc, msg, args, team, date):
+        """<TTT> [<date>]
+
+        Get the game leaders of the game a team played on a date
+        (YYYY-MM-DD, 'today' or 'yesterday'). Defaults to yesterday."""
+        team = team.upper()
+        if not self._validateTeamIsValid(team):
+            return
+
+        try:
+            leaders = self._stats_getter.dateGameLeaders(team,
+                                                         date or 'yesterday')
+        except ValueError as e:
+            irc.error(str(e))
+            return
+
+        home_team_name = self._orange(leaders['home']['team_name'])
+        away_team_name = self._blue(leaders['away']['team_name'])
+
+        final_flag = self._red('(Final) ') if leaders['final'] else ''
+
+        title = self._bold("{} @ {} Leaders {}~  ".format(away_team_name,
+                                                          home_team_name,
+                                                          final_flag))
+
+        irc.reply(title + self._printableTeamLeaders(leaders))
+
+    boxscore = wrap(boxScore, ['something', optional('something')])
+
+    def player(self, irc, msg, args, name):
+        """<name>
+
+        Find players by name. Partial names ('leb jam'), names without
+        accents and small misspellings are accepted."""
+        matches = self._stats_getter.searchPlayers(name)
+        if not matches:
+            irc.error('I could not find a player with that name.')
+            return
+
+        players = []
+        for match in matches:
+            full_name = self._playerLongName(match.name)
+            if match.team:
+                full_name = '{} ({})'.format(full_name, match.team)
+            players.append(full_name)
+
+        players[0] = self._bold(players[0])
+        irc.reply(', '.join(players))
+
+    player = wrap(player, ['text'])
+
+    def playerStats(self, irc, msg, args, name):
+        """<name>
+
+        Get a player's averages for this season."""
+        self._replyPlayerStats(irc, msg, [name])
+
+    playerstats = wrap(playerStats, ['text'])
+
+    def compare(self, irc, msg, args, names):
+        """<name>, <name>[, <name>...]
+
+        Compare the averages for this season of several players."""
+        names = [n.strip() for n in names.split(',') if n.strip()]
+        if not 2 <= len(names) <= self._MAX_COMPARED_PLAYERS:
+            irc.error('Give between 2 and {} players, separated by '
+                      'commas.'.format(self._MAX_COMPARED_PLAYERS))
+            return
+
+        self._replyPlayerStats(irc, msg, names)
+
+    compare = wrap(compare, ['text'])
+
+    _MAX_COMPARED_PLAYERS = 8
+
+    def _replyPlayerStats(self, irc, msg, names):
+        """Reply with the season averages of the players that best
+        match some names. The profiles are fetched concurrently; those
+        that take longer than the statsTimeout setting are left out.
+        """
+        players = OrderedDict() # Person ID -> PlayerMatch
+        for name in names:
+            matches = self._stats_getter.searchPlayers(name, 1)
+            if not matches:
+                irc.error('I could not find a player named {}.'.format(name))
+                return
+            players[matches[0].person_id] = matches[0]
+
+        stats = self._stats_getter.playerSeasonStats(
+            list(players), self.registryValue('statsTimeout'))
+        if not stats:
+            irc.error('The players\' stats are not available right now.')
+            return
+
+        segments = []
+        for (person_id, match) in players.items():
+            name = self._bold(self._playerLongName(match.name))
+            if person_id in stats:
+                segments.append('{} {}'.format(
+                    name, self._playerSeasonStatsToString(stats[person_id])))
+            else:
+                segments.append('{} (not available)'.format(name))
+
+        self._replyPacked(irc, msg, segments, separator=' || ')
+
+    def ingest(self, irc, msg, args, start_date):
+        """[<date>]
+
+        Store the box scores of the season's completed games (starting
+        from <date> if given) that are not in the local store yet."""
+        try:
+            (ingested, failed) = self._seasonStore().ingest(start_date)
+        except ValueError as e:
+            irc.error(str(e))
+            return
+
+        if failed:
+            irc.replySuccess('{} games added, {} could not be fetched (run '
+                             'ingest again to retry them).'.format(ingested,
+                                                                   failed))
+        else:
+            irc.replySuccess('{} games added.'.format(ingested))
+
+    ingest = wrap(ingest, ['owner', optional('something')])
+
+    def seasonLeaders(self, irc, msg, args, options, category, count):
+        """[--last <games>] [--per36] <category> [<count>]
+
+        Get the league leaders in per-game averages for a category
+        (pts, reb, ast, stl, blk, tov, 3pm, min, ...) from the
+        locally stored box scores. --last only takes into account
+        each player's last <games> games; --per36 ranks by
+        per-36-minutes rates (both can be combined). Only players with
+        half as many games as the most played by anyone are ranked,
+        and for --per36, only those who played 15 minutes per game."""
+        # Imported here, NumPy takes a while to load:
+        from . import analytics
+
+        options = dict(options)
+        column = self._SEASON_CATEGORIES.get(category.lower(),
+                                             category.lower())
+        store = self._seasonStore()
+
+        if column not in store.columns():
+            irc.error('Valid categories are: {}.'.format(
+                ', '.join(sorted(self._SEASON_CATEGORIES))))
+            return
+
+        if analytics.isAvailable():
+            leaders = self._statMatrix().leaders(column, count or 5,
+                                                 options.get('last'),
+                                                 'per36' in options)
+        elif options:
+            irc.error('--last and --per36 require NumPy.')
+            return
+        else:
+            leaders = store.leaders(column, count or 5)
+
+        if not leaders:
+            irc.error('There are no stored games yet.')
+            return
+
+        items = []
+        for (rank, (person_id, average, games)) in enumerate(leaders, 1):
+            name = self._playerShortName(
+                self._stats_getter.playerFullName(person_id))
+            items.append('{}.{} {:.1f} ({} GP)'.format(rank, self._bold(name),
+                                                      average, games))
+
+        title = self._bold('{} Leaders'.format(category.upper()))
+        irc.reply('{}: {}'.format(title, ', '.join(items)))
+
+    seasonleaders = wrap(seasonLeaders, [getopts({'last': 'positiveInt',
+                                                  'per36': ''}),
+                                         'something',
+                                         optional('positiveInt')])
+
+    _SEASON_CATEGORIES = {'pts': 'points', 'reb': 'rebounds',
+                          'oreb': 'off_rebounds', 'dreb': 'def_rebounds',
+                          'ast': 'assists', 'stl': 'steals', 'blk': 'blocks',
+                          'tov': 'turnovers', 'pf': 'fouls', 'min': 'minutes',
+                          '3pm': 'tpm', '3pa': 'tpa', '+/-': 'plus_minus'}
+
 
 ############################
 ############################
@@ -252,6 +704,67 @@ class NBAStats(callbacks.Plugin):
             return False
         return True
 
+    def _sharedCache(self):
+        url = self.registryValue('sharedCache')
+        if not url:
+            return None
+
+        from . import sharedcache
+        return sharedcache.fromURL(url, conf.supybot.directories.data())
+
+    def _seasonStore(self):
+        if self._season_store is None:
+            filename = self.registryValue('seasonStore')
+            path = conf.supybot.directories.data.dirize(filename)
+            self._season_store = seasonstore.SeasonStore(self._stats_getter,
+                                                         path, self.log)
+        return self._season_store
+
+    def _statMatrix(self):
+        """Return the analytics matrix for the season store. It is
+        read from the memory-mapped archive (shared with other bots
+        on the same host), and only rebuilt if new games were stored
+        since the archive was written.
+        """
+        from . import analytics
+
+        store = self._seasonStore()
+        version = store.gameCount()
+
+        matrix = self._stat_matrix
+        if matrix is not None and matrix.version == version:
+            return matrix
+
+        with self._stat_matrix_lock:
+            matrix = self._stat_matrix
+            if matrix is not None and matrix.version == version:
+                return matrix # Rebuilt while waiting
+
+            path = conf.supybot.directories.data.dirize(
+                self.registryValue('statArchive'))
+            try:
+                matrix = analytics.StatMatrix.open(path)
+            except (OSError, ValueError):
+                matrix = None
+
+            if matrix is None or matrix.version != version:
+                matrix = analytics.StatMatrix.fromStore(store)
+                matrix.save(path)
+
+            self._stat_matrix = matrix
+            return matrix
+
+    def _parseSubscriptionTeams(self, irc, teams):
+        teams = set(t.upper() if t.lower() != 'all' else 'all' for t in teams)
+
+        invalid = [t for t in teams if t != 'all' and not self._isTriCodeValid(t)]
+        if invalid:
+            irc.error('I could not find a team with code {}'.format(
+                ', '.join(invalid)))
+            return None
+
+        return teams
+
     def _validateTeamIsPlaying(self, team):
         if not self._validateTeamIsValid(team):
             return False
@@ -261,6 +774,323 @@ class NBAStats(callbacks.Plugin):
         return True
 
 
+############################
+# Profiling
+############################
+    def profile(self, irc, msg, args, command, runs):
+        """<command> [<runs>]
+
+        Profile the next <runs> (10 by default) runs of <command>. The
+        results are shown by the profiling command, and written to the
+        data directory when all the runs are done."""
+        from . import profiling
+
+        command = command.lower()
+        if not self.isCommandMethod(command):
+            irc.error('{} is not a command of this plugin.'.format(command))
+            return
+
+        with self._profiles_lock:
+            self._profiles[command] = profiling.CommandProfile(command,
+                                                               runs or 10)
+            # Commands only go through the profiler while there is
+            # something to profile:
+            self._callCommand = self._profiledCallCommand
+
+        irc.replySuccess()
+
+    profile = wrap(profile, ['owner', 'something', optional('positiveInt')])
+
+    def profiling(self, irc, msg, args, options, command):
+        """[--internal] [<command>]
+
+        Show the wall times and the functions that took the longest
+        (cumulative time, or time spent in the function itself with
+        --internal) per run of a profiled command. Without a command,
+        list the profiled commands."""
+        with self._profiles_lock:
+            profiles = dict(self._profiles)
+
+        if command is None:
+            if not profiles:
+                irc.reply('No commands are being profiled.')
+                return
+            irc.reply(', '.join('{} ({}/{} runs)'.format(
+                name, len(p.wall_times), p.runs)
+                for (name, p) in sorted(profiles.items())))
+            return
+
+        profile = profiles.get(command.lower())
+        if profile is None or not profile.wall_times:
+            irc.error('There are no runs of {} profiled.'.format(command))
+            return
+
+        wall_times = profile.wall_times
+        segments = ['{} ({}/{} runs): {:.1f} ms mean, {:.1f} ms max'.format(
+            self._bold(profile.command), len(wall_times), profile.runs,
+            1000 * sum(wall_times) / len(wall_times), 1000 * max(wall_times))]
+
+        functions = profile.topFunctions(
+            sort='tottime' if 'internal' in dict(options) else 'cumulative',
+            exclude=[os.path.dirname(callbacks.__file__)])
+        for (function, calls, seconds) in functions:
+            segments.append('{} {:.1f} ms, {:g} calls'.format(
+                function, 1000 * seconds, round(calls, 1)))
+
+        self._replyPacked(irc, msg, segments)
+
+    profiling = wrap(profiling, ['owner', getopts({'internal': ''}),
+                                 optional('something')])
+
+    def _profiledCallCommand(self, command, irc, msg, *args, **kwargs):
+        """Replacement of _callCommand while there are commands being
+        profiled.
+        """
+        profile = self._profiles.get(command[-1])
+        if profile is None or not profile.claim():
+            return self.__parent._callCommand(command, irc, msg,
+                                              *args, **kwargs)
+
+        try:
+            return profile.run(self.__parent._callCommand, command, irc, msg,
+                               *args, **kwargs)
+        finally:
+            if profile.done():
+                self._finishProfile(profile)
+
+    def _finishProfile(self, profile):
+        path = conf.supybot.directories.data.dirize(
+            'NBAStats-profile-{}.prof'.format(profile.command))
+        try:
+            profile.dump(path)
+        except OSError as e:
+            self.log.warning('Could not write %s: %s', path, e)
+
+        with self._profiles_lock:
+            if all(p.done() for p in self._profiles.values()) \
+               and '_callCommand' in vars(self):
+                del self._callCommand
+
+############################
+# Mirrors
+############################
+    def mirrors(self, irc, msg, args):
+        """takes no arguments
+
+        Show the health of the servers the documents are fetched from
+        (see the apiServers setting): whether they are skipped after
+        failing, their requests, failures and hedged requests (sent
+        because the previous server was slow), and their latencies."""
+        segments = []
+        for mirror in self._stats_getter.mirrorHealth():
+            status = 'down for {:.0f}s, '.format(mirror.down_for) \
+                     if mirror.down_for else ''
+            status += '{} requests, {} failures, {} hedged'.format(
+                mirror.requests, mirror.failures, mirror.hedges)
+            if mirror.p50 is not None:
+                status += ', p50 {:.0f} ms, p95 {:.0f} ms'.format(
+                    1000 * mirror.p50, 1000 * mirror.p95)
+            segments.append('{}: {}'.format(self._bold(mirror.url), status))
+
+        self._replyPacked(irc, msg, segments)
+
+    mirrors = wrap(mirrors, ['owner'])
+
+############################
+# Subscriptions
+############################
+    def _poll(self):
+        """Scheduled every pollInterval seconds. The actual work is
+        done in a thread so the bot is never blocked on NBA.com.
+        """
+        if not self._poll_lock.acquire(blocking=False):
+            return # The previous poll is still running.
+
+        thread = threading.Thread(target=self._pollSubscriptions,
+                                  name='NBAStats poll', daemon=True)
+        thread.start()
+
+    def _pollSubscriptions(self):
+        try:
+            subscribers = self._subscribers()
+            if not subscribers:
+                self._scoreboard_differ.reset()
+                return
+
+            games = self._stats_getter.scoreboard()
+            self._scoreboard_differ.updateScoreboard(games)
+
+            # Box scores (for fouls) are only fetched for the live games
+            # somebody is subscribed to:
+            for game in games:
+                if game['period']['current'] == 0 or game['ended'] \
+                   or not self._gameTargets(subscribers, game):
+                    continue
+
+                box_score = self._stats_getter.boxScore(game['start_date'],
+                                                        game['game_id'])
+                self._scoreboard_differ.updateBoxScore(game['game_id'],
+                                                       box_score)
+        except Exception as e:
+            self.log.exception('Error while polling the scoreboard: %s', e)
+        finally:
+            self._poll_lock.release()
+
+    def _subscribers(self):
+        """Return a dictionary (team or 'all' -> set of (irc, channel))
+        for the channels the bot is in.
+        """
+        subscribers = dict()
+        for irc in world.ircs:
+            for channel in irc.state.channels:
+                for team in self.registryValue('subscriptions', channel,
+                                               irc.network):
+                    subscribers.setdefault(team, set()).add((irc, channel))
+        return subscribers
+
+    def _gameTargets(self, subscribers, game):
+        return (subscribers.get('all', set())
+                | subscribers.get(game['home_team'], set())
+                | subscribers.get(game['away_team'], set()))
+
+    def _announceEvents(self, events):
+        """Listener of the scoreboard differ."""
+        subscribers = self._subscribers()
+
+        # Announcements are built once per game, whatever the number
+        # of channels they are sent to:
+        events_by_game = OrderedDict()
+        for event in events:
+            events_by_game.setdefault(event.game_id, []).append(event)
+
+        for game_events in events_by_game.values():
+            targets = self._gameTargets(subscribers, game_events[-1].game)
+            if not targets:
+                continue
+
+            announcements = [a for a in map(self._eventAnnouncement,
+                                            game_events) if a]
+            for announcement in announcements:
+                for (irc, channel) in targets:
+                    irc.queueMsg(ircmsgs.privmsg(channel, announcement))
+
+    def _eventAnnouncement(self, event):
+        """Return the announcement of a scorediff.GameEvent, or None if
+        it is not announced.
+        """
+        game = event.game
+        score = self._gameScoreToString(game)
+
+        if event.kind == scorediff.PERIOD:
+            ((previous_period, _), (period, end_of_period)) = \
+                (event.previous, event.current)
+
+            if previous_period == 0 and period > 0:
+                return '{} {}'.format(self._bold('Tip-off:'), score)
+            if end_of_period and not game['ended']:
+                title = self._endOfPeriodTitle(period)
+                return '{} {}'.format(self._bold(title), score)
+
+        elif event.kind == scorediff.STATUS:
+            if game['ended']:
+                return '{} {}'.format(self._bold('Final:'), score)
+
+        elif event.kind == scorediff.FOULS:
+            if event.previous < 6 <= event.current \
+               or event.previous < 5 <= event.current:
+                teams = {game['home_team_id']: game['home_team'],
+                         game['away_team_id']: game['away_team']}
+                return self._foulTroubleToString(
+                    event.person_id, teams.get(event.team_id, ''),
+                    event.current)
+
+        return None
+
+    def _foulTroubleToString(self, person_id, team, count):
+        name = self._playerShortName(
+            self._stats_getter.playerFullName(person_id))
+
+        if count >= 6:
+            return self._red('{} ({}) has fouled out'.format(name, team))
+        return self._orange('{} ({}) has 5 fouls'.format(name, team))
+
+    def _gameScoreToString(self, game):
+        return '{} {} - {} {}'.format(self._bold(game['away_team']),
+                                      game['away_score'],
+                                      game['home_score'],
+                                      self._bold(game['home_team']))
+
+    def _endOfPeriodTitle(self, period):
+        if period == 2:
+            return 'Halftime:'
+        if period > 4:
+            return 'End of OT{}:'.format(period - 4)
+        return 'End of Q{}:'.format(period)
+
+############################
+# Replies
+############################
+    # Maximum length of a line sent to the server, CR-LF included.
+    _MAX_LINE_BYTES = 512
+
+    def _replyPacked(self, irc, msg, segments, separator=' | '):
+        """Reply with the segments joined by separator, packed into as
+        few lines as fit the server's line limit. Segments that do not
+        fit in a line on their own are wrapped.
+
+        If stripping the formatting (colours, bold) saves lines and the
+        stripFormattingToFit setting is on, the replies are sent
+        without formatting.
+        """
+        max_bytes = self._replyMaxBytes(irc, msg)
+        lines = self._packSegments(segments, separator, max_bytes)
+
+        if len(lines) > 1 and self.registryValue('stripFormattingToFit'):
+            plain_lines = self._packSegments(
+                [ircutils.stripFormatting(s) for s in segments],
+                separator, max_bytes)
+            if len(plain_lines) < len(lines):
+                lines = plain_lines
+
+        for line in lines:
+            irc.reply(line, noLengthCheck=True)
+
+    def _packSegments(self, segments, separator, max_bytes):
+        """Greedily pack the segments into lines of at most max_bytes
+        bytes (UTF-8, formatting codes included).
+        """
+        lines = []
+        for segment in segments:
+            if not lines:
+                lines.append(segment)
+            elif self._byteLength(lines[-1] + separator + segment) \
+                 <= max_bytes:
+                lines[-1] += separator + segment
+            else:
+                lines.append(segment)
+
+            if self._byteLength(lines[-1]) > max_bytes:
+                lines[-1:] = ircutils.wrap(lines[-1], max_bytes)
+
+        return lines
+
+    def _replyMaxBytes(self, irc, msg):
+        """Bytes available for the text of a reply to msg, once the
+        server relays it as ':<nick>!<user>@<host> PRIVMSG <target>
+        :[<nick>: ]<text>' plus CR-LF.
+        """
+        prefix = irc.prefix
+        if '@' not in prefix: # Not known yet; assume the longest host.
+            prefix = '{}!{}@{}'.format(irc.nick, 'u' * 10, 'h' * 63)
+
+        target = msg.args[0] if irc.isChannel(msg.args[0]) else msg.nick
+        overhead = len(':{} PRIVMSG {} :{}: \r\n'.format(prefix, target,
+                                                        msg.nick).encode())
+        return self._MAX_LINE_BYTES - overhead
+
+    def _byteLength(self, s):
+        return len(s.encode('utf-8'))
+
 ############################
 # Formatting helpers
 ############################
@@ -297,6 +1127,131 @@ class NBAStats(callbacks.Plugin):
             leaders.append("{} {}".format(name, stat))
         return ' | '.join(leaders)
 
+    def _scheduledGameToString(self, game, team):
+        """'Fri Mar 10 @ ORL' or 'Sat Mar 11 vs DAL'."""
+        if game.home_team == team:
+            opponent = 'vs {}'.format(game.away_team)
+        else:
+            opponent = '@ {}'.format(game.home_team)
+
+        return '{} {}'.format(self._formatScheduleDate(game.date, True),
+                              self._bold(opponent))
+
+    def _scheduledGameResultToString(self, game, team):
+        """'W 100-90 vs PHX (Mar 6)'."""
+        if game.home_team == team:
+            (score, opponent_score) = (game.home_score, game.away_score)
+            opponent = 'vs {}'.format(game.away_team)
+        else:
+            (score, opponent_score) = (game.away_score, game.home_score)
+            opponent = '@ {}'.format(game.home_team)
+
+        if score > opponent_score:
+            result = self._green('W')
+        else:
+            result = self._red('L')
+
+        return '{} {}-{} {} ({})'.format(result, score, opponent_score,
+                                         opponent,
+                                         self._formatScheduleDate(game.date))
+
+    def _formatScheduleDate(self, date, weekday=False):
+        """'YYYYMMDD' -> 'Mar 10' (or 'Fri Mar 10')."""
+        date = datetime.datetime.strptime(date, '%Y%m%d')
+        day = '{} {}'.format(date.strftime('%b'), date.day)
+        if weekday:
+            return '{} {}'.format(date.strftime('%a'), day)
+        return day
+
+    def _gameResultToString(self, game):
+        """'AWY 99 @ HOM 101', with the winner in bold once the
+        game is over.
+        """
+        away = '{} {}'.format(game['away_team'], game['away_score'])
+        home = '{} {}'.format(game['home_team'], game['home_score'])
+
+        if game['ended']:
+            if game['away_score'] > game['home_score']:
+                away = self._bold(away)
+            else:
+                home = self._bold(home)
+
+        return '{} @ {}'.format(away, home)
+
+    def _printablePlayoffOdds(self, odds):
+        items = []
+        for team_odds in odds:
+            (seed_probability, seed) = max((p, seed) for (seed, p)
+                                           in enumerate(team_odds.seeds, 1))
+
+            probability = self._formatProbability(team_odds.playoffs)
+            if team_odds.playoffs >= 0.5:
+                probability = self._green(probability)
+            else:
+                probability = self._red(probability)
+
+            items.append('{} {} ({}: {})'.format(
+                self._bold(team_odds.team), probability,
+                self._numberToOrdinal(seed),
+                self._formatProbability(seed_probability)))
+
+        return ', '.join(items)
+
+    def _formatProbability(self, p):
+        """Percentage with one decimal; never shows 0% or 100% for
+        events that are merely very (un)likely.
+        """
+        if 0 < p < 0.001:
+            return '<0.1%'
+        if 0.999 < p < 1:
+            return '>99.9%'
+        return self._decimalToPercentage(p)
+
+    def _formatPlayTime(self, play):
+        """'Q3 5:42' (or 'OT1 0:12')."""
+        return '{} {}'.format(self._periodName(play.period), play.clock)
+
+    def _periodName(self, period):
+        return 'OT{}'.format(period - 4) if period > 4 \
+               else 'Q{}'.format(period)
+
+    def _gameStatusToString(self, game):
+        """'AWY 88 @ HOM 92 Q3 4:21', with the start time for games
+        that did not start and 'Final' for those that ended.
+        """
+        period = game['period']
+
+        if period['current'] == 0:
+            return '{} @ {} {}'.format(game['away_team'], game['home_team'],
+                                       game['start_time'])
+
+        if game['ended']:
+            status = 'Final' if period['current'] <= 4 \
+                     else 'Final/{}'.format(self._periodName(period['current']))
+        elif period['isHalftime']:
+            status = 'Halftime'
+        elif period['isEndOfPeriod'] or not game['clock']:
+            status = 'End {}'.format(self._periodName(period['current']))
+        else:
+            status = '{} {}'.format(self._periodName(period['current']),
+                                    game['clock'])
+
+        return '{} {}'.format(self._gameResultToString(game), status)
+
+    def _playEventToString(self, tracker, event):
+        team = tracker.team_names.get(event.team_id, event.team_id)
+        time = self._formatPlayTime(event.play)
+
+        if event.kind == 'run':
+            return '{} {}-0 run ({})'.format(team, event.value, time)
+        if event.kind == 'lead_change':
+            return '{} takes the lead ({})'.format(team, time)
+        if event.kind == 'fouled_out':
+            name = self._playerShortName(
+                self._stats_getter.playerFullName(event.value))
+            return '{} fouled out ({})'.format(name, time)
+        return ''
+
     def _printablePlayoffBracket(self, games):
         if len(games) == 0:
             return 'Is not yet determined'
@@ -444,6 +1399,20 @@ class NBAStats(callbacks.Plugin):
             return 'AST'
         return ""
 
+    def _playerLongName(self, name_tuple):
+        return ' '.join(n for n in name_tuple if n)
+
+    def _playerSeasonStatsToString(self, stats):
+        team = '({}) '.format(stats.team) if stats.team else ''
+        return ('{}{:.1f} PPG, {:.1f} RPG, {:.1f} APG, {:.1f} SPG, '
+                '{:.1f} BPG | {:.1f} FG%, {:.1f} 3P%, {:.1f} FT% | '
+                '{} GP, {:.1f} MPG'.format(team, stats.points, stats.rebounds,
+                                          stats.assists, stats.steals,
+                                          stats.blocks, stats.fg_percentage,
+                                          stats.tp_percentage,
+                                          stats.ft_percentage, stats.games,
+                                          stats.minutes))
+
     def _playerShortName(self, name_tuple):
         """ Given a tuple (FirstName, LastName), return 'I. LastName',
         where 'I' is the first-name's initial.
@@ -0,0 +1,135 @@
+###
+# Profiling of the plugin's commands.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import cProfile
+import os
+import pstats
+import threading
+import time
+
+# Held while a run is profiled: only one profiler can be active at a
+# time (enabling another one raises ValueError on Python 3.12+).
+_profiler_lock = threading.Lock()
+
+
+class CommandProfile():
+    """Profiles the next runs of a command with cProfile, aggregating
+    the statistics and wall times of all of them. Runs can happen in
+    several threads at once, but only one (of any command) is profiled
+    at a time; the others are run as usual and do not count.
+    """
+
+    def __init__(self, command, runs):
+        self.command = command
+        self.runs = runs
+
+        self.wall_times = [] # Seconds, of every finished run
+        self._started = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def claim(self):
+        """Reserve one of the runs. Returns False if all of them were
+        already started.
+        """
+        with self._lock:
+            if self._started >= self.runs:
+                return False
+            self._started += 1
+            return True
+
+    def done(self):
+        with self._lock:
+            return len(self.wall_times) >= self.runs
+
+    def run(self, function, *args, **kwargs):
+        """Call function (in this thread) under the profiler. If
+        another run is being profiled, or another profiler is active,
+        it is called without profiling and the claimed run is given
+        back.
+        """
+        if not _profiler_lock.acquire(blocking=False):
+            return self._runUnprofiled(function, *args, **kwargs)
+
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError: # Another profiling tool is active
+                return self._runUnprofiled(function, *args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                wall_time = time.perf_counter() - start
+                with self._lock:
+                    self.wall_times.append(wall_time)
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+        finally:
+            _profiler_lock.release()
+
+    def _runUnprofiled(self, function, *args, **kwargs):
+        with self._lock:
+            self._started -= 1
+        return function(*args, **kwargs)
+
+    def topFunctions(self, count=5, sort='cumulative', exclude=()):
+        """Return [(function, calls, seconds)] of the count functions
+        that took the longest (per run, by cumulative or internal
+        time), skipping those defined in files under the exclude
+        directories.
+        """
+        with self._lock:
+            if self._stats is None:
+                return []
+
+            self._stats.sort_stats(sort)
+            runs = len(self.wall_times)
+            functions = []
+            for function in self._stats.fcn_list:
+                (filename, line, name) = function
+                if filename.startswith(tuple(exclude)):
+                    continue
+
+                (_, calls, internal, cumulative, _) = \
+                    self._stats.stats[function]
+                seconds = cumulative if sort == 'cumulative' else internal
+                if filename != '~': # Not a built-in
+                    name = '{}:{}({})'.format(self._shortPath(filename),
+                                              line, name)
+                functions.append((name, calls / runs, seconds / runs))
+                if len(functions) == count:
+                    break
+            return functions
+
+    def _shortPath(self, filename):
+        (directory, basename) = os.path.split(filename)
+        if basename == '__init__.py':
+            return os.path.join(os.path.basename(directory), basename)
+        return basename
+
+    def dump(self, path):
+        """Write the statistics to a file, for pstats or snakeviz."""
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(path)
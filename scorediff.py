@@ -0,0 +1,159 @@
+###
+# Change detection between successive scoreboards and box scores.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import threading
+
+from collections import namedtuple
+
+# Event kinds and the values they carry in previous/current:
+SCORE = 'score'                 # (away score, home score)
+PERIOD = 'period'               # (period, is end of period)
+STATUS = 'status'               # statusNum (1: scheduled, 2: live, 3: final)
+SUBSTITUTION = 'substitution'   # frozenset of person ids on the court
+FOULS = 'fouls'                 # personal fouls; person_id is set
+
+# version is the game's version after the change; game is the latest
+# scoreboard entry of the game.
+GameEvent = namedtuple('GameEvent', 'kind, game_id, version, game,'
+                                    'previous, current, person_id, team_id')
+
+
+class ScoreboardDiffer():
+    """Compares each scoreboard (as returned by
+    NBAStatsGetter.scoreboard()) and box score with the previous one
+    of the same game, and emits GameEvent tuples for what changed.
+
+    Every game has a version counter that is incremented whenever one
+    of its events is emitted. Listeners added with addListener() are
+    called with the list of events of every update that has any.
+    """
+
+    def __init__(self):
+        self._games = dict()     # game id -> latest scoreboard entry
+        self._versions = dict()  # game id -> version
+        self._on_court = dict()  # game id -> frozenset of person ids
+        self._fouls = dict()     # game id -> person id -> (team id, fouls)
+
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def addListener(self, listener):
+        self._listeners.append(listener)
+
+    def removeListener(self, listener):
+        self._listeners.remove(listener)
+
+    def version(self, game_id):
+        return self._versions.get(game_id, 0)
+
+    def game(self, game_id):
+        return self._games.get(game_id)
+
+    def reset(self):
+        """Forget every game, so the next updates produce no events."""
+        with self._lock:
+            for game_id in list(self._games):
+                self._forget(game_id)
+
+    def updateScoreboard(self, games):
+        """Process a new scoreboard and return its events. Games that
+        are seen for the first time produce no events; games that are
+        no longer in the scoreboard are forgotten.
+        """
+        with self._lock:
+            events = []
+            current_ids = set()
+
+            for game in games:
+                game_id = game['game_id']
+                current_ids.add(game_id)
+
+                previous = self._games.get(game_id)
+                self._games[game_id] = game
+                if previous is None:
+                    self._versions.setdefault(game_id, 0)
+                    continue
+
+                for (kind, extract) in self._SCOREBOARD_FIELDS:
+                    (before, after) = (extract(previous), extract(game))
+                    if before != after:
+                        events.append(self._event(kind, game, before, after))
+
+            for game_id in set(self._games) - current_ids:
+                self._forget(game_id)
+
+        self._notify(events)
+        return events
+
+    def updateBoxScore(self, game_id, box_score):
+        """Process a new box score of a game in the scoreboard and
+        return its events (substitutions and foul increments).
+        """
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is None:
+                return []
+
+            players = box_score['stats']['activePlayers']
+            on_court = frozenset(p['personId'] for p in players
+                                 if p['isOnCourt'])
+            fouls = {p['personId']: (p['teamId'], int(p['pFouls'] or 0))
+                     for p in players}
+
+            events = []
+
+            previous_on_court = self._on_court.get(game_id)
+            if previous_on_court is not None and previous_on_court != on_court:
+                events.append(self._event(SUBSTITUTION, game,
+                                          previous_on_court, on_court))
+
+            previous_fouls = self._fouls.get(game_id)
+            if previous_fouls is not None:
+                for (person_id, (team_id, count)) in sorted(fouls.items()):
+                    (_, before) = previous_fouls.get(person_id, (team_id, 0))
+                    if count > before:
+                        events.append(self._event(FOULS, game, before, count,
+                                                  person_id, team_id))
+
+            self._on_court[game_id] = on_court
+            self._fouls[game_id] = fouls
+
+        self._notify(events)
+        return events
+
+    _SCOREBOARD_FIELDS = ((SCORE, lambda g: (g['away_score'], g['home_score'])),
+                          (PERIOD, lambda g: (g['period']['current'],
+                                              g['period']['isEndOfPeriod'])),
+                          (STATUS, lambda g: g['status_num']))
+
+    def _event(self, kind, game, previous, current, person_id=None,
+               team_id=None):
+        game_id = game['game_id']
+        self._versions[game_id] += 1
+        return GameEvent(kind, game_id, self._versions[game_id], game,
+                         previous, current, person_id, team_id)
+
+    def _forget(self, game_id):
+        for d in (self._games, self._versions, self._on_court, self._fouls):
+            d.pop(game_id, None)
+
+    def _notify(self, events):
+        if not events:
+            return
+        for listener in list(self._listeners):
+            listener(events)
@@ -0,0 +1,278 @@
+###
+# Local SQLite store of the box scores of completed NBA games.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import datetime
+import logging
+import math
+import sqlite3
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+# Players with fewer games than this fraction of the most played by
+# anyone are left out of the leaders:
+MIN_GAMES_FRACTION = 0.5
+
+# Stored column -> field of a player entry in the box score JSON.
+STAT_COLUMNS = (('minutes', 'min'),
+                ('points', 'points'),
+                ('fgm', 'fgm'),
+                ('fga', 'fga'),
+                ('ftm', 'ftm'),
+                ('fta', 'fta'),
+                ('tpm', 'tpm'),
+                ('tpa', 'tpa'),
+                ('off_rebounds', 'offReb'),
+                ('def_rebounds', 'defReb'),
+                ('rebounds', 'totReb'),
+                ('assists', 'assists'),
+                ('steals', 'steals'),
+                ('blocks', 'blocks'),
+                ('turnovers', 'turnovers'),
+                ('fouls', 'pFouls'),
+                ('plus_minus', 'plusMinus'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id      TEXT PRIMARY KEY,
+    date         TEXT NOT NULL,
+    home_team_id TEXT NOT NULL,
+    away_team_id TEXT NOT NULL,
+    home_score   INTEGER NOT NULL,
+    away_score   INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS player_games (
+    game_id   TEXT NOT NULL REFERENCES games(game_id),
+    person_id TEXT NOT NULL,
+    team_id   TEXT NOT NULL,
+    {columns},
+    PRIMARY KEY (game_id, person_id)
+);
+
+CREATE INDEX IF NOT EXISTS player_games_person
+    ON player_games(person_id);
+
+-- Days whose games have all been ingested.
+CREATE TABLE IF NOT EXISTS ingested_days (
+    date TEXT PRIMARY KEY
+);
+""".format(columns=',\n    '.join('{} REAL NOT NULL'.format(c)
+                                   for (c, _) in STAT_COLUMNS))
+
+
+class SeasonStore():
+    """Keeps the box scores of completed games in a SQLite database
+    so that season aggregates can be computed locally.
+    """
+
+    def __init__(self, stats_getter, path, log=None):
+        self._stats_getter = stats_getter
+        self._log = log or logging.getLogger(__name__)
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def columns(self):
+        return tuple(c for (c, _) in STAT_COLUMNS)
+
+############################
+# Ingestion
+############################
+    def ingest(self, start_date=None, end_date='yesterday', max_workers=4):
+        """Store the box scores of the completed games played between
+        two dates (inclusive) that are not in the store yet, and
+        return a tuple (games added, games whose box scores could not
+        be fetched). By default starts at the beginning of the season.
+
+        Each game is committed on its own, so an interrupted run (or
+        one with failures) can simply be started again.
+        """
+        if start_date is None:
+            start_date = self._seasonStartDate()
+
+        dates = [d for d in self._stats_getter.dateRange(start_date, end_date)
+                 if not self._isDayIngested(d)]
+
+        (ingested, failed) = (0, 0)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            scoreboards = list(zip(dates,
+                                   pool.map(self._stats_getter.scoreboard,
+                                            dates)))
+
+            pending = dict() # game_id -> (date, game)
+            for (date, games) in scoreboards:
+                for game in games:
+                    if game['ended'] \
+                       and not self._isGameIngested(game['game_id']):
+                        pending[game['game_id']] = (date, game)
+
+            futures = {pool.submit(self._stats_getter.boxScore,
+                                   date, game['game_id']): game_id
+                       for (game_id, (date, game)) in pending.items()}
+
+            for future in as_completed(futures):
+                (date, game) = pending[futures[future]]
+                try:
+                    box_score = future.result()
+                except Exception as e:
+                    self._log.warning('Could not ingest game %s: %s',
+                                      game['game_id'], e)
+                    failed += 1
+                    continue
+
+                self._storeGame(date, game, box_score)
+                ingested += 1
+
+        for (date, games) in scoreboards:
+            self._markDayIfComplete(date, games)
+
+        return (ingested, failed)
+
+    def _seasonStartDate(self):
+        """October 1st of the current season's year."""
+        return datetime.date(self._stats_getter.seasonYear(), 10, 1)
+
+    def _storeGame(self, date, game, box_score):
+        rows = []
+        for player in box_score['stats']['activePlayers']:
+            values = [self._parseStat(field, player[field])
+                      for (_, field) in STAT_COLUMNS]
+
+            if values[0] == 0: # Did not play
+                continue
+
+            rows.append([game['game_id'], player['personId'],
+                         player['teamId']] + values)
+
+        placeholders = ', '.join('?' * (len(STAT_COLUMNS) + 3))
+
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO games '
+                                     'VALUES (?, ?, ?, ?, ?, ?)',
+                                     (game['game_id'], date,
+                                      game['home_team_id'],
+                                      game['away_team_id'],
+                                      game['home_score'],
+                                      game['away_score']))
+            self._connection.executemany('INSERT OR REPLACE INTO player_games '
+                                         'VALUES ({})'.format(placeholders),
+                                         rows)
+
+    def _parseStat(self, field, value):
+        """Box score values are strings; minutes come as 'MM:SS'."""
+        if not value:
+            return 0.0
+
+        if field == 'min':
+            (minutes, _, seconds) = value.partition(':')
+            return int(minutes) + int(seconds or 0) / 60
+
+        return float(value)
+
+    def _markDayIfComplete(self, date, games):
+        if not all(g['ended'] and self._isGameIngested(g['game_id'])
+                   for g in games):
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR IGNORE INTO ingested_days '
+                                     'VALUES (?)', (date,))
+
+    def _isDayIngested(self, date):
+        return self._exists('SELECT 1 FROM ingested_days WHERE date = ?',
+                            date)
+
+    def _isGameIngested(self, game_id):
+        return self._exists('SELECT 1 FROM games WHERE game_id = ?', game_id)
+
+    def _exists(self, query, *args):
+        with self._lock:
+            return self._connection.execute(query, args).fetchone() is not None
+
+############################
+# Queries
+############################
+    def lastIngestedDate(self):
+        """Return the date of the most recent game in the store."""
+        return self._query('SELECT MAX(date) FROM games')[0][0]
+
+    def playerAverages(self, person_id):
+        """Return a dictionary with the per-game averages of a player
+        (plus the number of games played).
+        """
+        averages = ', '.join('AVG({})'.format(c) for c in self.columns())
+        row = self._query('SELECT COUNT(*), {} FROM player_games '
+                          'WHERE person_id = ?'.format(averages),
+                          person_id)[0]
+
+        result = dict(zip(self.columns(), row[1:]))
+        result['games'] = row[0]
+        return result
+
+    def leaders(self, column, count=5, min_games=None):
+        """Return a list of (person_id, per-game average, games played)
+        with the top players in a stat column, among those with at
+        least <min_games> games (by default, MIN_GAMES_FRACTION of the
+        most played by anyone).
+        """
+        if column not in self.columns():
+            raise ValueError('Invalid stat category')
+
+        if min_games is None:
+            most = self._query('SELECT MAX(games) FROM (SELECT COUNT(*) AS '
+                               'games FROM player_games GROUP BY '
+                               'person_id)')[0][0] or 0
+            min_games = max(math.ceil(MIN_GAMES_FRACTION * most), 1)
+
+        return self._query('SELECT person_id, AVG({0}), COUNT(*) '
+                           'FROM player_games GROUP BY person_id '
+                           'HAVING COUNT(*) >= ? '
+                           'ORDER BY AVG({0}) DESC LIMIT ?'.format(column),
+                           min_games, count)
+
+    def gameCount(self):
+        """Number of stored games. It only grows, so it can be used as
+        a version number for data derived from the store.
+        """
+        return self._query('SELECT COUNT(*) FROM games')[0][0]
+
+    def playerGameRows(self):
+        """Return every stored player line as a tuple
+        (person_id, team_id, game_id, date, *columns()), sorted by
+        player and then chronologically.
+        """
+        return self._query('SELECT p.person_id, p.team_id, p.game_id, '
+                           'g.date, {} FROM player_games p '
+                           'JOIN games g ON g.game_id = p.game_id '
+                           'ORDER BY p.person_id, g.date, '
+                           'p.game_id'.format(', '.join('p.' + c for c
+                                                        in self.columns())))
+
+    def _query(self, query, *args):
+        with self._lock:
+            return self._connection.execute(query, args).fetchall()
+
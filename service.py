@@ -0,0 +1,334 @@
+###
+# Local HTTP service exposing an NBAStatsGetter to other programs.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import asyncio
+import datetime
+import inspect
+import json
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+
+try:
+    from . import nbastats
+    from . import scorediff
+except ImportError: # Running as a script
+    import nbastats
+    import scorediff
+
+# Methods of NBAStatsGetter that are not served: warmUp() has side
+# effects, the next two return objects that keep per-client state or
+# are too big to send, and the rest return constants, which clients
+# look up locally without a request.
+_UNSERVED_METHODS = frozenset(('warmUp', 'gamePlayByPlay', 'seasonSchedule',
+                               'teams', 'statCategories', 'divisions',
+                               'conferences'))
+
+# Clients cannot make the service start bigger thread pools than this:
+MAX_CLIENT_WORKERS = 4
+
+SERVED_METHODS = frozenset(
+    name for (name, _) in inspect.getmembers(nbastats.NBAStatsGetter,
+                                             inspect.isfunction)
+    if not name.startswith('_') and name not in _UNSERVED_METHODS)
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class StatsService():
+    """Serves every public method of an NBAStatsGetter as
+    GET /<method>?<argument>=<value>&..., returning its result encoded
+    with nbastats.encodeResult() as JSON. GET / lists the methods.
+
+    The scoreboard is polled every poll_interval seconds; whenever it
+    changes, the snapshot version is incremented. Responses are
+    serialized once and reused for the same request until the version
+    changes or they are max_age seconds old.
+    """
+
+    def __init__(self, stats_getter, poll_interval=30, max_age=60,
+                 max_workers=8, log=None):
+        self._stats_getter = stats_getter
+        self._log = log or logging.getLogger(__name__)
+        self._poll_interval = poll_interval
+        self._max_age = max_age
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self.version = 0
+        self._differ = scorediff.ScoreboardDiffer()
+        self._polled_game_ids = None
+
+        # (method, sorted arguments) -> (version, time, status, body)
+        self._responses = dict()
+
+    _MAX_RESPONSES = 4096
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self._handleConnection,
+                                            host, port)
+        poller = asyncio.ensure_future(self._poll())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            poller.cancel()
+
+############################
+# Snapshots
+############################
+    async def _poll(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                games = await loop.run_in_executor(
+                    self._executor, self._stats_getter.scoreboard)
+                self._updateVersion(games)
+            except Exception as e:
+                self._log.warning('Error while polling the scoreboard: %s',
+                                  e)
+            await asyncio.sleep(self._poll_interval)
+
+    def _updateVersion(self, games):
+        events = self._differ.updateScoreboard(games)
+        game_ids = frozenset(g['game_id'] for g in games)
+
+        # New games (a new day) produce no events, but change the data:
+        if events or game_ids != self._polled_game_ids:
+            self.version += 1
+            self._responses.clear()
+        self._polled_game_ids = game_ids
+
+############################
+# Requests
+############################
+    async def _handleConnection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = await self._readHeaders(reader)
+                (method, target, version) = \
+                    request_line.decode('latin-1').split()
+
+                if method != 'GET':
+                    (status, body) = (405, self._errorBody('Only GET'))
+                else:
+                    (status, body) = await self._response(target)
+
+                keep_alive = version == 'HTTP/1.1' \
+                             and headers.get('connection') != 'close'
+                self._writeResponse(writer, status, body, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _readHeaders(self, reader):
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                return headers
+            (name, _, value) = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _response(self, target):
+        """Return (status, body) for a request target, from the
+        precomputed responses if possible.
+        """
+        parts = urlsplit(target)
+        name = parts.path.strip('/')
+        arguments = tuple(sorted(parse_qsl(parts.query)))
+
+        if not name:
+            return (200, self._dump(sorted(SERVED_METHODS)))
+        if name not in SERVED_METHODS:
+            return (404, self._errorBody('Unknown method: {}'.format(name)))
+
+        key = (name, arguments)
+        cached = self._responses.get(key)
+        if cached is not None:
+            (version, created, status, body) = cached
+            if version == self.version \
+               and time.monotonic() - created < self._max_age:
+                return (status, body)
+
+        version = self.version
+        (status, body) = await asyncio.get_event_loop().run_in_executor(
+            self._executor, self._call, name, dict(arguments))
+
+        if status != 500:
+            if len(self._responses) >= self._MAX_RESPONSES:
+                self._responses.clear()
+            self._responses[key] = (version, time.monotonic(), status, body)
+        return (status, body)
+
+    def _call(self, name, arguments):
+        method = getattr(self._stats_getter, name)
+        try:
+            kwargs = self._convertArguments(method, arguments)
+            result = method(**kwargs)
+        except (TypeError, ValueError) as e:
+            return (400, self._errorBody(str(e)))
+        except Exception as e:
+            return (500, self._errorBody(str(e)))
+
+        return (200, self._dump(nbastats.encodeResult(result)))
+
+    def _convertArguments(self, method, arguments):
+        """Query values are strings, converted with
+        nbastats.convertArgument(). Pool sizes (max_workers) are capped
+        at MAX_CLIENT_WORKERS.
+        """
+        parameters = inspect.signature(method).parameters
+        kwargs = dict()
+        for (name, value) in arguments.items():
+            if name not in parameters:
+                raise TypeError('Unexpected argument: {}'.format(name))
+            value = nbastats.convertArgument(parameters[name], value)
+            if name == 'max_workers':
+                value = min(max(value, 1), MAX_CLIENT_WORKERS)
+            kwargs[name] = value
+        return kwargs
+
+    def _dump(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def _errorBody(self, message):
+        return self._dump({'error': message})
+
+    def _writeResponse(self, writer, status, body, keep_alive):
+        head = ('HTTP/1.1 {} {}\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: {}\r\n'
+                'X-Snapshot-Version: {}\r\n'
+                'Connection: {}\r\n\r\n').format(status, _REASONS[status],
+                                                 len(body), self.version,
+                                                 'keep-alive' if keep_alive
+                                                 else 'close')
+        writer.write(head.encode('latin-1') + body)
+
+
+class StatsServiceClient():
+    """Drop-in replacement for NBAStatsGetter that calls a
+    StatsService. The methods that are not served run on a local
+    getter, created when first needed with the given NBAStatsGetter
+    arguments.
+    """
+
+    def __init__(self, url, timeout=10, shared_cache=None,
+                 api_server=nbastats.API_SERVER, hedge_percentile=0.95,
+                 log=None):
+        self._url = url.rstrip('/')
+        self._timeout = timeout
+        self._getter_arguments = (shared_cache, api_server, hedge_percentile,
+                                  log)
+
+        self._requests_session = None
+        self._local_getter = None
+        self._lock = threading.Lock()
+
+    def warmUp(self):
+        pass # The service keeps its own cache warm.
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name not in SERVED_METHODS:
+            return getattr(self._localGetter(), name)
+
+        signature = inspect.signature(getattr(nbastats.NBAStatsGetter, name))
+
+        def call(*args, **kwargs):
+            arguments = signature.bind(None, *args, **kwargs).arguments
+            del arguments['self']
+            return self._call(name, arguments)
+
+        return call
+
+    def _call(self, name, arguments):
+        params = {k: self._formatArgument(v) for (k, v) in arguments.items()
+                  if v is not None}
+
+        r = self._session().get('{}/{}'.format(self._url, name),
+                                params=params, timeout=self._timeout)
+        content = r.json()
+
+        if r.status_code == 400:
+            raise ValueError(content['error'])
+        if r.status_code != 200:
+            raise RuntimeError(content.get('error', r.reason))
+
+        return nbastats.decodeResult(content)
+
+    def _formatArgument(self, value):
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        if isinstance(value, (list, tuple)):
+            return ','.join(map(str, value))
+        return str(value)
+
+    def _session(self):
+        with self._lock:
+            if self._requests_session is None:
+                import requests
+                self._requests_session = requests.Session()
+            return self._requests_session
+
+    def _localGetter(self):
+        with self._lock:
+            if self._local_getter is None:
+                self._local_getter = nbastats.NBAStatsGetter(
+                    *self._getter_arguments)
+            return self._local_getter
+
+
+def serve(host='127.0.0.1', port=8080, poll_interval=30, max_age=60,
+          shared_cache=None, api_servers=None):
+    """Run a StatsService until interrupted. api_servers is a list of
+    mirrors of the documents (see NBAStatsGetter).
+    """
+    cache = None
+    if shared_cache is not None:
+        try:
+            from . import sharedcache
+        except ImportError: # Running as a script
+            import sharedcache
+        cache = sharedcache.fromURL(shared_cache)
+
+    getter = nbastats.NBAStatsGetter(cache,
+                                     api_servers or nbastats.API_SERVER)
+    service = StatsService(getter, poll_interval, max_age)
+    print('Serving on http://{}:{}/'.format(host, port))
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,381 @@
+###
+# Cache shared by the NBAStatsGetters of several processes on a host.
+# Copyright (c) 2017, Santiago Gil
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import contextlib
+import datetime
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from urllib.parse import urlsplit
+
+from cachecontrol import CacheControlAdapter
+
+# Seconds a process may hold the refresh lock of a resource before the
+# others consider it dead, and seconds they wait for it at most.
+LOCK_TTL = 30
+LOCK_TIMEOUT = 10
+
+# Seconds the entries stored without an expiration time and the
+# (immutable) documents are kept. Nothing is stored forever.
+DEFAULT_TTL = 24 * 60 * 60
+DOCUMENT_TTL = 7 * 24 * 60 * 60
+
+# Seconds between deletions of the expired rows of a SQLite cache.
+PURGE_INTERVAL = 60
+
+_LOCK_POLL_INTERVAL = 0.05
+
+
+def fromURL(url, directory=None):
+    """Create a cache from its URL:
+        sqlite:///<absolute path>  or  sqlite:<path relative to directory>
+        redis://<host>[:<port>][/<db>]
+    """
+    parts = urlsplit(url)
+
+    if parts.scheme == 'sqlite':
+        path = parts.path
+        if directory is not None and not os.path.isabs(path):
+            path = os.path.join(directory, path)
+        return SQLiteCache(path)
+    if parts.scheme == 'redis':
+        db = int(parts.path.strip('/') or 0)
+        return RedisCache(parts.hostname or 'localhost', parts.port or 6379,
+                          db)
+
+    raise ValueError('Unsupported shared cache: {}'.format(url))
+
+
+class SharedCache():
+    """Key -> bytes store with expiration and per-key locks that work
+    across processes.
+
+    It implements CacheControl's cache interface (get/set/delete/close)
+    for the HTTP responses, plus getDocument()/setDocument() for parsed
+    JSON documents.
+    """
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value, expires=None):
+        """expires is either a number of seconds or a datetime
+        (DEFAULT_TTL seconds if None).
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def getDocument(self, key):
+        value = self.get('document:' + key)
+        return None if value is None else json.loads(value.decode('utf-8'))
+
+    def setDocument(self, key, document, expires=DOCUMENT_TTL):
+        self.set('document:' + key, json.dumps(document).encode('utf-8'),
+                 expires)
+
+    @contextlib.contextmanager
+    def lock(self, key, timeout=LOCK_TIMEOUT, ttl=LOCK_TTL):
+        """Hold the lock of a key (across processes) for the duration
+        of the block. Gives up waiting after timeout seconds; the block
+        is run anyway, and what is yielded tells whether the lock was
+        acquired.
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+
+        acquired = self._acquire(key, token, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(_LOCK_POLL_INTERVAL)
+            acquired = self._acquire(key, token, ttl)
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._release(key, token)
+
+    def _acquire(self, key, token, ttl):
+        raise NotImplementedError()
+
+    def _release(self, key, token):
+        raise NotImplementedError()
+
+    def _expirationTime(self, expires):
+        """Absolute (epoch) expiration time."""
+        if expires is None:
+            expires = DEFAULT_TTL
+        if isinstance(expires, datetime.datetime):
+            if expires.tzinfo is None:
+                expires = expires.replace(tzinfo=datetime.timezone.utc)
+            return expires.timestamp()
+        return time.time() + expires
+
+
+class SQLiteCache(SharedCache):
+    """Shared cache in a SQLite database in WAL mode, so readers in
+    other processes are not blocked by a writer. Expired rows are
+    deleted on writes, once every PURGE_INTERVAL seconds at most.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key     TEXT PRIMARY KEY,
+        value   BLOB NOT NULL,
+        expires REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS locks (
+        key     TEXT PRIMARY KEY,
+        token   TEXT NOT NULL,
+        expires REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._next_purge = 0 # time.time()
+
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(self._SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT value, expires '
+                                           'FROM entries WHERE key = ?',
+                                           (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return bytes(row[0])
+
+    def set(self, key, value, expires=None):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO entries '
+                                     'VALUES (?, ?, ?)',
+                                     (key, value,
+                                      self._expirationTime(expires)))
+            self._purge()
+
+    def delete(self, key):
+        with self._lock:
+            self._connection.execute('DELETE FROM entries WHERE key = ?',
+                                     (key,))
+
+    def _purge(self):
+        """Delete the expired entries and locks, if they were not
+        deleted recently. Called with the lock held.
+        """
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_INTERVAL
+
+        # (Rows without an expiration time were stored by older versions.)
+        self._connection.execute('DELETE FROM entries '
+                                 'WHERE expires IS NULL OR expires < ?',
+                                 (now,))
+        self._connection.execute('DELETE FROM locks WHERE expires < ?',
+                                 (now,))
+
+    def _acquire(self, key, token, ttl):
+        now = time.time()
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                self._connection.execute('DELETE FROM locks '
+                                         'WHERE key = ? AND expires < ?',
+                                         (key, now))
+                cursor = self._connection.execute('INSERT OR IGNORE INTO locks '
+                                                  'VALUES (?, ?, ?)',
+                                                  (key, token, now + ttl))
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+        return cursor.rowcount == 1
+
+    def _release(self, key, token):
+        with self._lock:
+            self._connection.execute('DELETE FROM locks '
+                                     'WHERE key = ? AND token = ?',
+                                     (key, token))
+
+
+class RedisCache(SharedCache):
+    """Shared cache in a server that speaks the Redis protocol (RESP).
+    Only GET, SET, DEL, EVAL and SELECT are used.
+    """
+
+    # Deletes a lock only if it is still held with the given token:
+    _RELEASE_SCRIPT = ("if redis.call('GET', KEYS[1]) == ARGV[1] then "
+                       "return redis.call('DEL', KEYS[1]) end return 0")
+
+    def __init__(self, host='localhost', port=6379, db=0, prefix='nbastats:'):
+        self._address = (host, port)
+        self._db = db
+        self._prefix = prefix
+
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def get(self, key):
+        return self._command('GET', self._prefix + key)
+
+    def set(self, key, value, expires=None):
+        expiration_time = self._expirationTime(expires)
+        milliseconds = int((expiration_time - time.time()) * 1000)
+        if milliseconds > 0:
+            self._command('SET', self._prefix + key, value,
+                          'PX', milliseconds)
+
+    def delete(self, key):
+        self._command('DEL', self._prefix + key)
+
+    def _acquire(self, key, token, ttl):
+        return self._command('SET', self._lockKey(key), token,
+                             'NX', 'PX', int(ttl * 1000)) == b'OK'
+
+    def _release(self, key, token):
+        # Atomic: the lock may have expired and been taken by another
+        # process since it was acquired.
+        self._command('EVAL', self._RELEASE_SCRIPT, 1, self._lockKey(key),
+                      token)
+
+    def _lockKey(self, key):
+        return '{}lock:{}'.format(self._prefix, key)
+
+############################
+# Protocol
+############################
+    def _command(self, *args):
+        """Send a command and return its reply. Reconnects (once) if
+        the connection was lost.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    self._socket.sendall(self._encode(args))
+                    return self._readReply()
+                except (OSError, EOFError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+    def _connect(self):
+        self._socket = socket.create_connection(self._address,
+                                                timeout=LOCK_TIMEOUT)
+        self._reader = self._socket.makefile('rb')
+
+        if self._db:
+            self._socket.sendall(self._encode(('SELECT', self._db)))
+            self._readReply()
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+        (self._socket, self._reader) = (None, None)
+
+    def _encode(self, args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _readReply(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise EOFError('Connection closed by the cache server')
+
+        (kind, payload) = (line[:1], line[1:-2])
+
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RuntimeError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                raise EOFError('Connection closed by the cache server')
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 \
+                   else [self._readReply() for _ in range(length)]
+
+        raise RuntimeError('Unexpected reply from the cache server')
+
+
+class LockingCacheControlAdapter(CacheControlAdapter):
+    """CacheControl adapter over a SharedCache that only lets one
+    process at a time refresh a given URL: the others wait for it and
+    then get its response from the cache.
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(cache=cache, **kwargs)
+        self._shared_cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method not in self.cacheable_methods:
+            return super().send(request, **kwargs)
+
+        cached_response = self.controller.cached_request(request)
+        if cached_response:
+            return self.build_response(request, cached_response,
+                                       from_cache=True)
+
+        with self._shared_cache.lock('refresh:' + request.url):
+            # Fresh from the cache if another process refreshed it while
+            # waiting. Otherwise the body is read here, which stores the
+            # response, so the lock is not released before that.
+            response = super().send(request, **kwargs)
+            if not kwargs.get('stream'):
+                response.content
+            return response
@@ -27,11 +27,1257 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###
 
+import contextlib
+import inspect
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import requests
+
 from supybot.test import *
 
+from . import analytics
+from . import nbastats
+from . import playbyplay
+from . import playersearch
+from . import scorediff
+from . import seasonstore
+from . import service
+from . import sharedcache
+
 
 class NBAStatsTestCase(PluginTestCase):
     plugins = ('NBAStats',)
 
+    def pack(self, segments, max_bytes, separator=' | '):
+        plugin = self.irc.getCallback('NBAStats')
+        return plugin._packSegments(segments, separator, max_bytes)
+
+    def testPackSegments(self):
+        self.assertEqual(self.pack(['aaaa', 'bbbb', 'cccc'], 11),
+                         ['aaaa | bbbb', 'cccc'])
+        self.assertEqual(self.pack(['aaaa', 'bbbb', 'cccc'], 100),
+                         ['aaaa | bbbb | cccc'])
+        self.assertEqual(self.pack([], 10), [])
+
+        # Bytes, not characters:
+        self.assertEqual(self.pack(['\u00f1' * 4, 'b'], 11),
+                         ['\u00f1' * 4, 'b'])
+
+        # Segments longer than a line are wrapped:
+        lines = self.pack(['a', ' '.join(['word'] * 10), 'b'], 20)
+        self.assertTrue(all(len(l.encode('utf-8')) <= 20 for l in lines))
+        self.assertEqual(' '.join(lines).split(),
+                         ['a'] + ['word'] * 10 + ['|', 'b'])
+
+
+class RefreshingGetter(nbastats.NBAStatsGetter):
+    """Getter whose team list and roster change on every request, so
+    that every lookup rebuilds the indexes. Each version has its own
+    team ids and player names.
+    """
+
+    TRICODES = ('ATL', 'BOS', 'CHI', 'DAL', 'DEN', 'GSW')
+
+    def __init__(self):
+        super().__init__()
+        self._version = 0
+        self._version_lock = threading.Lock()
+
+    def _teamListURL(self):
+        return 'teams'
+
+    def _playerListURL(self):
+        return 'players'
+
+    def _getJSON(self, url, return_cache_status=False, immutable=False,
+                 refresh=False):
+        with self._version_lock:
+            self._version += 1
+            version = self._version % 2
+
+        if url == 'teams':
+            teams = [{'tricode': t, 'teamId': '{}{}'.format(version, n),
+                      'isNBAFranchise': True}
+                     for (n, t) in enumerate(self.TRICODES)]
+            json = {'league': {'standard': teams}}
+        else:
+            players = [{'personId': str(n), 'firstName': str(version),
+                        'lastName': str(version)} for n in range(500)]
+            json = {'league': {'standard': players}}
+
+        return (json, False) if return_cache_status else json
+
+
+class ReferenceIndexTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self._switch_interval)
+        SupyTestCase.tearDown(self)
+
+    def testLookupsDuringRefreshes(self):
+        getter = RefreshingGetter()
+        errors = []
+
+        def lookUp():
+            try:
+                for _ in range(300):
+                    index = getter._teamIndex()
+                    for (tricode, team_id) in index.tricodes_to_ids.items():
+                        self.assertEqual(index.ids_to_tricodes[team_id],
+                                         tricode)
+                    self.assertEqual(len(index.ids_to_tricodes),
+                                     len(RefreshingGetter.TRICODES))
+                    self.assertIn(getter._teamID('BOS'), ('01', '11'))
+
+                    name = getter.playerFullName('499')
+                    self.assertEqual(name.first_name, name.last_name)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=lookUp) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def testIndexesAreReadOnly(self):
+        index = nbastats.TeamIndex([('BOS', '1')])
+        with self.assertRaises(TypeError):
+            index.tricodes_to_ids['CHI'] = '2'
+
+
+class RosterGetter(nbastats.NBAStatsGetter):
+    """Getter whose roster is self.players; counts the refetches."""
+
+    def __init__(self, players):
+        super().__init__()
+        self.players = players
+        self.refreshes = 0
+
+    def _playerListURL(self):
+        return 'players'
+
+    def _getJSON(self, url, return_cache_status=False, immutable=False,
+                 refresh=False):
+        if refresh:
+            self.refreshes += 1
+        players = [{'personId': person_id, 'firstName': first,
+                    'lastName': last, 'teamId': '1'}
+                   for (person_id, (first, last)) in self.players.items()]
+        json = {'league': {'standard': players}}
+        return (json, not refresh) if return_cache_status else json
+
+
+class RosterTestCase(SupyTestCase):
+    def testDiffs(self):
+        index = nbastats.PlayerIndex({'1': nbastats.PlayerName('A', 'B'),
+                                      '2': nbastats.PlayerName('C', 'D')},
+                                     {'1': '10', '2': '20'})
+        self.assertIs(index.updated([('1', 'A', 'B', '10'),
+                                     ('2', 'C', 'D', '20')]), index)
+
+        updated = index.updated([('1', 'A', 'B', '10'), ('2', 'C', 'E', '20'),
+                                 ('3', 'F', 'G', '')])
+        self.assertEqual(dict(updated.names),
+                         {'1': ('A', 'B'), '2': ('C', 'E'), '3': ('F', 'G')})
+        self.assertIs(updated.names['1'], index.names['1'])
+        self.assertEqual(index.names['2'], ('C', 'D'))
+
+        traded = index.updated([('2', 'C', 'D', '10')])
+        self.assertEqual(dict(traded.names), {'2': ('C', 'D')})
+        self.assertEqual(dict(traded.teams), {'2': '10'})
+
+    def testUnknownPlayerRefreshesTheRoster(self):
+        getter = RosterGetter({'1': ('A', 'B')})
+        self.assertEqual(getter.playerFullName('1'), ('A', 'B'))
+
+        getter.players['2'] = ('C', 'D')
+        self.assertEqual(getter.playerFullName('2'), ('C', 'D'))
+        self.assertEqual(getter.refreshes, 1)
+
+    def testRefreshesAreRateLimited(self):
+        getter = RosterGetter({'1': ('A', 'B')})
+
+        threads = [threading.Thread(target=getter.playerFullName,
+                                    args=('404',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(getter.playerFullName('404'), ('#404', ''))
+        self.assertEqual(getter.refreshes, 1)
+
+
+class PlayerSearchTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.index = playersearch.PlayerSearchIndex({
+            '1': ('Nenê', ''), '2': ('LeBron', 'James'),
+            '3': ('James', 'Harden'), '4': ('Kevin', 'Love'),
+            '5': ('Jordan', 'Loveridge'), '6': ('Karl-Anthony', 'Towns')})
+
+    def ids(self, query):
+        return [person_id for (person_id, _) in self.index.search(query)]
+
+    def testAccents(self):
+        self.assertEqual(self.index.search('nene'), [('1', 1.0)])
+        self.assertEqual(self.ids('NENÊ'), ['1'])
+
+    def testPrefixes(self):
+        self.assertEqual(self.ids('leb jam'), ['2'])
+        self.assertEqual(self.ids('towns karl'), ['6'])
+        self.assertEqual(self.ids('love'), ['4', '5'])
+
+    def testMisspellings(self):
+        self.assertEqual(self.ids('jmaes hardn'), ['3'])
+        self.assertEqual(self.ids('xyzzy'), [])
+
+
+class DocumentHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.delay)
+
+        body = json.dumps({'server': server.name,
+                           'path': self.path}).encode('utf-8')
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DocumentServer(ThreadingHTTPServer):
+    """Local mirror answering every request with its name, after delay
+    seconds and with the given status.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, name):
+        super().__init__(('127.0.0.1', 0), DocumentHandler)
+        self.name = name
+        self.delay = 0
+        self.status = 200
+        self.requests = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class MirrorsTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.servers = [DocumentServer('primary'), DocumentServer('mirror')]
+        self.getter = nbastats.NBAStatsGetter(
+            api_server=[s.url for s in self.servers])
+        self.getter._session()
+        self.getter._mirror_set.INITIAL_HEDGE_DELAY = 0.1
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.getter._session().close()
+        SupyTestCase.tearDown(self)
+
+    def get(self, path='/doc.json'):
+        return self.getter._getJSON(self.getter._addBaseURL(path))
+
+    def testCanonicalURLs(self):
+        self.assertEqual(self.get(), {'server': 'primary',
+                                      'path': '/doc.json'})
+        self.servers[0].status = 503
+        self.assertEqual(self.get(), {'server': 'mirror',
+                                      'path': '/doc.json'})
+
+    def testSlowPrimaryIsHedged(self):
+        self.servers[0].delay = 1
+        start = time.monotonic()
+        self.assertEqual(self.get()['server'], 'mirror')
+        self.assertLess(time.monotonic() - start, 0.8)
+
+        (primary, mirror) = self.getter.mirrorHealth()
+        self.assertEqual((primary.hedges, mirror.hedges), (0, 1))
+        self.assertEqual(primary.down_for, 0)
+
+    def testHedgeDelayFollowsTheLatencies(self):
+        mirror_set = self.getter._mirror_set
+        primary = mirror_set.mirrors[0]
+        for milliseconds in range(1, 101):
+            primary.recordSuccess(milliseconds / 1000)
+        self.assertAlmostEqual(mirror_set.hedgeDelay(primary), 0.095)
+
+        self.servers[0].delay = 0.5
+        self.assertEqual(self.get()['server'], 'mirror')
+
+    def testFailedMirrorIsSkipped(self):
+        self.servers[0].status = 503
+        self.assertEqual(self.get()['server'], 'mirror')
+        self.assertGreater(self.getter.mirrorHealth()[0].down_for, 0)
+
+        self.servers[0].status = 200
+        self.assertEqual(self.get()['server'], 'mirror')
+        self.assertEqual(self.servers[0].requests, 1)
+
+    def testEveryMirrorFailing(self):
+        for server in self.servers:
+            server.status = 503
+        # Raised by the adapter itself, not by raise_for_status():
+        with self.assertRaises(requests.HTTPError) as raised:
+            self.getter._session().get(self.getter._addBaseURL('/doc.json'))
+        self.assertEqual(raised.exception.response.status_code, 503)
+        self.assertTrue(all(m.down_for for m in self.getter.mirrorHealth()))
+
+        # They are still tried, the one back the soonest first:
+        self.servers[1].status = 200
+        self.assertEqual(self.get()['server'], 'mirror')
+        self.assertEqual([s.requests for s in self.servers], [2, 2])
+
+
+class ImmutableCacheTestCase(SupyTestCase):
+    def testEvictionBySize(self):
+        cache = nbastats.ImmutableJSONCache(max_bytes=100)
+        cache.set('a', {'x': 'a' * 40})
+        cache.set('b', {'x': 'b' * 40})
+        self.assertEqual(len(cache), 2)
+
+        cache.get('a') # Now 'b' is the least recently used
+        cache.set('c', {'x': 'c' * 40})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'x': 'a' * 40})
+
+        cache.set('d', {'x': 'd' * 200}) # Bigger than the whole cache
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(len(cache), 2)
+
+    def testErrorsAreNotCached(self):
+        server = DocumentServer('server')
+        try:
+            getter = nbastats.NBAStatsGetter(api_server=server.url)
+            url = getter._addBaseURL('/20170101/boxscore.json')
+
+            server.status = 404
+            with self.assertRaises(requests.HTTPError):
+                getter._getJSON(url, immutable=True)
+            self.assertEqual(len(getter._immutable_cache), 0)
+
+            server.status = 200
+            self.assertEqual(getter._getJSON(url, immutable=True)['server'],
+                             'server')
+            self.assertEqual(len(getter._immutable_cache), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class SharedCacheTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'NBAStats.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        SupyTestCase.tearDown(self)
+
+    def rows(self, cache):
+        return cache._connection.execute('SELECT key FROM entries') \
+                                .fetchall()
+
+    def testExpiry(self):
+        cache = sharedcache.SQLiteCache(self.path)
+        try:
+            cache.set('old', b'old', expires=-1)
+            cache.set('new', b'new', expires=60)
+            self.assertIsNone(cache.get('old'))
+            self.assertEqual(cache.get('new'), b'new')
+
+            cache._next_purge = 0
+            cache.set('other', b'other')
+            self.assertEqual(sorted(self.rows(cache)),
+                             [('new',), ('other',)])
+        finally:
+            cache.close()
+
+    def testNothingIsStoredForever(self):
+        cache = sharedcache.SQLiteCache(self.path)
+        try:
+            cache.set('entry', b'entry')
+            cache.setDocument('url', {'a': 1})
+            self.assertEqual(cache.getDocument('url'), {'a': 1})
+
+            expirations = dict(cache._connection.execute(
+                'SELECT key, expires FROM entries'))
+            now = time.time()
+            self.assertAlmostEqual(expirations['entry'] - now,
+                                   sharedcache.DEFAULT_TTL, delta=5)
+            self.assertAlmostEqual(expirations['document:url'] - now,
+                                   sharedcache.DOCUMENT_TTL, delta=5)
+        finally:
+            cache.close()
+
+    def testLockIsExclusive(self):
+        # Two connections, as two processes would have.
+        (first, second) = (sharedcache.SQLiteCache(self.path),
+                           sharedcache.SQLiteCache(self.path))
+        try:
+            with first.lock('url') as acquired:
+                self.assertTrue(acquired)
+                with second.lock('url', timeout=0.1) as acquired:
+                    self.assertFalse(acquired)
+                with second.lock('other', timeout=0.1) as acquired:
+                    self.assertTrue(acquired)
+
+            with second.lock('url', timeout=0.1) as acquired:
+                self.assertTrue(acquired)
+        finally:
+            first.close()
+            second.close()
+
+    def testRedisLockIsReleasedAtomically(self):
+        commands = []
+        cache = sharedcache.RedisCache()
+        cache._command = lambda *args: commands.append(args) or b'OK'
+
+        with cache.lock('url') as acquired:
+            self.assertTrue(acquired)
+        ((_, lock_key, token, *_), release) = commands
+        self.assertEqual(lock_key, 'nbastats:lock:url')
+        self.assertEqual(release, ('EVAL', cache._RELEASE_SCRIPT, 1,
+                                   lock_key, token))
+
+    def testExpiredLockIsTakenOver(self):
+        (first, second) = (sharedcache.SQLiteCache(self.path),
+                           sharedcache.SQLiteCache(self.path))
+        try:
+            with first.lock('url', ttl=0.1) as acquired:
+                self.assertTrue(acquired)
+                with second.lock('url', timeout=1) as acquired:
+                    self.assertTrue(acquired)
+        finally:
+            first.close()
+            second.close()
+
+
+class OddsGetter():
+    def playoffOdds(self, simulations=200000, processes=0, time_budget=1.0):
+        return (simulations, processes, time_budget)
+
+    def scoreboards(self, start_date, end_date, max_workers=4):
+        return max_workers
+
+
+class ServiceTestCase(SupyTestCase):
+    def testResultsRoundTrip(self):
+        bracket = nbastats.PlayoffBracket(
+            {1: {'east': [nbastats.PlayoffMatchUp('BOS', 1, 4, True,
+                                                  'CHI', 8, 2, False, True)]}},
+            2)
+        result = {'standings': [nbastats.Record(50, 32),
+                                nbastats.Streak(3, True)],
+                  'leaders': (nbastats.LeaderStatistic(
+                      'points', frozenset(['James', 'Davis']), 27.5),),
+                  'by_id': {1610612738: 'BOS', (1, 2): {'a', 'b'}},
+                  '__reserved': None}
+        encoded = json.loads(json.dumps(nbastats.encodeResult(result)))
+        decoded = nbastats.decodeResult(encoded)
+
+        self.assertEqual(decoded, result)
+        self.assertIs(type(decoded['standings'][0]), nbastats.Record)
+        self.assertIs(type(decoded['leaders']), tuple)
+
+        encoded = json.loads(json.dumps(nbastats.encodeResult(bracket)))
+        decoded = nbastats.decodeResult(encoded)
+        self.assertEqual(decoded.current_round, 2)
+        self.assertEqual(decoded.conferenceMatchUps(1, 'East'),
+                         bracket.conferenceMatchUps(1, 'East'))
+
+    def testArgumentConversion(self):
+        stats_service = service.StatsService(OddsGetter())
+        def call(**arguments):
+            (status, body) = stats_service._call('playoffOdds', arguments)
+            return (status, json.loads(body.decode('utf-8')))
+
+        self.assertEqual(call(simulations='1000', time_budget='0.5'),
+                         (200, {'__tuple__': None,
+                                'items': [1000, 0, 0.5]}))
+        self.assertEqual(call(time_budget='soon')[0], 400)
+        self.assertEqual(call(simulations='0.5')[0], 400)
+        self.assertEqual(call(seasons='2')[0], 400)
+
+    def testClientLocalGetter(self):
+        client = service.StatsServiceClient('http://localhost:1',
+                                            api_server=['http://mirror',
+                                                        'http://other'],
+                                            hedge_percentile=0.5)
+        getter = client._localGetter()
+        self.assertEqual(getter._api_servers,
+                         ['http://mirror', 'http://other'])
+        self.assertEqual(getter._hedge_percentile, 0.5)
+
+    def testConstantsAreLocal(self):
+        for name in ('teams', 'statCategories', 'divisions', 'conferences'):
+            self.assertNotIn(name, service.SERVED_METHODS)
+
+        # Nothing listens there:
+        client = service.StatsServiceClient('http://localhost:1')
+        self.assertIn('BOS', client.teams())
+        self.assertIn('atlantic', client.divisions('east'))
+
+    def testWorkersAreCapped(self):
+        stats_service = service.StatsService(OddsGetter())
+        for (workers, expected) in (('2', 2), ('1000', 4), ('-1', 1)):
+            (status, body) = stats_service._call(
+                'scoreboards', {'start_date': '20170301',
+                                'end_date': '20170302',
+                                'max_workers': workers})
+            self.assertEqual((status, json.loads(body.decode('utf-8'))),
+                             (200, expected))
+
+    def testConvertArgument(self):
+        def method(name='', count=1, ratio=0.5, flag=False):
+            pass
+        parameters = inspect.signature(method).parameters
+        def convert(name, value):
+            return nbastats.convertArgument(parameters[name], value)
+
+        self.assertEqual(convert('name', '12'), '12')
+        self.assertEqual(convert('count', '12'), 12)
+        self.assertEqual(convert('ratio', '12'), 12.0)
+        self.assertIs(convert('flag', 'true'), True)
+        self.assertIs(convert('flag', '0'), False)
+        for (name, value) in (('count', '0.5'), ('ratio', 'half'),
+                              ('flag', '2')):
+            with self.assertRaises(ValueError):
+                convert(name, value)
+
+
+class QueryTestCase(SupyTestCase):
+    def testParseQuery(self):
+        self.assertEqual(nbastats.parseQuery('standings'),
+                         [('standings', 'conferenceStandings', [])])
+        self.assertEqual(nbastats.parseQuery('teamLeaders:GSW'),
+                         [('teamLeaders:GSW', 'teamLeaders', ['GSW'])])
+        self.assertEqual(nbastats.parseQuery('range:2017-03-01:2017-03-07'),
+                         [('range:2017-03-01:2017-03-07',
+                           nbastats.QUERY_ALIASES['range'],
+                           ['2017-03-01', '2017-03-07'])])
+
+    def testParseQueryExpandsTheFirstArgument(self):
+        self.assertEqual(nbastats.parseQuery('record:LAL,BOS:2'),
+                         [('record:LAL:2', 'teamRecord', ['LAL', '2']),
+                          ('record:BOS:2', 'teamRecord', ['BOS', '2'])])
+
+    def testParseQueryRejectsUnknownMethods(self):
+        for query in ('nothing', '_getJSON:url', 'API_SERVER'):
+            with self.assertRaises(ValueError):
+                nbastats.parseQuery(query)
+
+    def testRunQueryConvertsNumbers(self):
+        output = nbastats.runQuery(OddsGetter(), 'playoffOdds',
+                                   ['1000', '0', '0.5'])
+        self.assertEqual(output['result'], [1000, 0, 0.5])
+
+        output = nbastats.runQuery(OddsGetter(), 'playoffOdds', ['0.5'])
+        self.assertTrue(output['error'].startswith('ValueError'))
+
+    def testOutputIsJSONLines(self):
+        server = DocumentServer('server')
+        (stdout, stderr) = (io.StringIO(), io.StringIO())
+        try:
+            with contextlib.redirect_stdout(stdout), \
+                 contextlib.redirect_stderr(stderr):
+                nbastats.main(['query', '--api-server', server.url,
+                               'record:LAL,BOS', 'standings'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertGreater(server.requests, 0)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['query'] for line in lines],
+                         ['record:LAL', 'record:BOS', 'standings'])
+
+
+class IngestGetter():
+    """Two days of two games each; the box scores in self.failing
+    cannot be fetched. Counts the requests.
+    """
+
+    DATES = ('2017-01-01', '2017-01-02')
+
+    def __init__(self):
+        self.failing = set()
+        self.requests = []
+
+    def seasonYear(self):
+        return 2016
+
+    def dateRange(self, start_date, end_date):
+        return list(self.DATES)
+
+    def scoreboard(self, date):
+        self.requests.append(('scoreboard', date))
+        return [{'game_id': '{}-{}'.format(date, n), 'ended': True,
+                 'home_team_id': '1', 'away_team_id': '2',
+                 'home_score': 100, 'away_score': 90} for n in range(2)]
+
+    def boxScore(self, date, game_id):
+        self.requests.append(('boxScore', game_id))
+        if game_id in self.failing:
+            raise RuntimeError('Unavailable')
+
+        player = {field: '1' for (_, field) in seasonstore.STAT_COLUMNS}
+        player.update({'min': '30:00', 'personId': '7', 'teamId': '1'})
+        return {'stats': {'activePlayers': [player]}}
+
+
+class SeasonStoreTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.getter = IngestGetter()
+        self.store = seasonstore.SeasonStore(self.getter, ':memory:')
+
+    def tearDown(self):
+        self.store.close()
+        SupyTestCase.tearDown(self)
+
+    def testIncremental(self):
+        self.assertEqual(self.store.ingest(), (4, 0))
+        self.assertEqual(self.store.gameCount(), 4)
+        self.assertEqual(self.store.playerAverages('7')['minutes'], 30)
+
+        # Complete days are not even looked at again:
+        del self.getter.requests[:]
+        self.assertEqual(self.store.ingest(), (0, 0))
+        self.assertEqual(self.getter.requests, [])
+
+    def testResumesAfterFailures(self):
+        self.getter.failing.add('2017-01-02-1')
+        self.assertEqual(self.store.ingest(), (3, 1))
+        self.assertEqual(self.store.gameCount(), 3)
+
+        # Only the day with the missing game, and only that box score:
+        self.getter.failing.clear()
+        del self.getter.requests[:]
+        self.assertEqual(self.store.ingest(), (1, 0))
+        self.assertEqual(self.getter.requests,
+                         [('scoreboard', '2017-01-02'),
+                          ('boxScore', '2017-01-02-1')])
+
+
+def statMatrix(games):
+    """analytics.StatMatrix of a {person id: [(minutes, points)]}."""
+    numpy = analytics.numpy
+    person_ids = sorted(games)
+    most = max(len(g) for g in games.values())
+
+    values = numpy.full((len(person_ids), most, 2), numpy.nan,
+                        dtype=numpy.float32)
+    game_index = numpy.full((len(person_ids), most), -1, dtype=numpy.int32)
+    for (row, person_id) in enumerate(person_ids):
+        for (slot, line) in enumerate(games[person_id]):
+            values[row, slot] = line
+            game_index[row, slot] = slot
+
+    games_played = numpy.array([len(games[p]) for p in person_ids],
+                               dtype=numpy.int32)
+    return analytics.StatMatrix(person_ids, ['1'] * len(person_ids),
+                                [str(n) for n in range(most)],
+                                ('minutes', 'points'), values, game_index,
+                                games_played, version=len(person_ids))
+
+
+@unittest.skipUnless(analytics.isAvailable(), 'NumPy is not installed')
+class StatMatrixTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.matrix = statMatrix({
+            'regular': [(30, 20)] * 10,
+            'hot': [(20, 10)] * 7 + [(20, 40)] * 3,
+            'injured': [(5, 10)] * 2,         # Too few games
+            'bench': [(10, 8)] * 10})         # Too few minutes for per-36
+
+    def ranking(self, **kwargs):
+        return [p for (p, _, _) in self.matrix.leaders('points', **kwargs)]
+
+    def testLeaders(self):
+        self.assertEqual(self.ranking(), ['regular', 'hot', 'bench'])
+        self.assertEqual(self.ranking(per_36=True), ['hot', 'regular'])
+        self.assertEqual(self.ranking(last_games=3),
+                         ['hot', 'regular', 'injured', 'bench'])
+        self.assertEqual(self.ranking(last_games=3, per_36=True),
+                         ['hot', 'regular'])
+        self.assertEqual(self.ranking(min_games=1)[-1], 'bench')
+
+    def testArchiveRoundTrip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'stats')
+            self.matrix.save(path)
+            self.matrix.save(path) # Replaces it
+            self.assertEqual(os.listdir(directory), ['stats'])
+
+            opened = analytics.StatMatrix.open(path)
+            self.assertEqual(opened.version, self.matrix.version)
+            self.assertEqual(opened.person_ids, self.matrix.person_ids)
+            self.assertEqual(opened.game_ids, self.matrix.game_ids)
+            self.assertEqual(opened.columns, self.matrix.columns)
+            for name in ('values', 'game_index', 'games_played'):
+                analytics.numpy.testing.assert_array_equal(
+                    getattr(opened, name), getattr(self.matrix, name))
+            self.assertEqual(opened.leaders('points', per_36=True),
+                             self.matrix.leaders('points', per_36=True))
+            del opened
+        finally:
+            shutil.rmtree(directory)
+
+
+def scheduledGame(game_id, date, home_team, away_team, ended=False,
+                  is_regular_season=True):
+    return nbastats.ScheduledGame(game_id, date, home_team, away_team,
+                                  0, 0, is_regular_season, ended)
+
+
+class SeasonScheduleTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.games = [scheduledGame('1', '20170101', 'BOS', 'LAL', True),
+                      scheduledGame('2', '20170102', 'NYK', 'BOS', True),
+                      scheduledGame('3', '20170104', 'BOS', 'CHI'),
+                      scheduledGame('4', '20170105', 'LAL', 'BOS'),
+                      scheduledGame('5', '20170106', 'BOS', 'MIA'),
+                      scheduledGame('6', '20170420', 'CLE', 'BOS',
+                                    is_regular_season=False)]
+        self.schedule = nbastats.SeasonSchedule(reversed(self.games))
+
+    def ids(self, games):
+        return [g.game_id for g in games]
+
+    def testRemainingGames(self):
+        # (home, away, back-to-backs), regular season only:
+        self.assertEqual(self.schedule.remainingGames('BOS', '20170101'),
+                         (3, 2, 3))
+        self.assertEqual(self.schedule.remainingGames('BOS', '20170102'),
+                         (2, 2, 2))
+        self.assertEqual(self.schedule.remainingGames('BOS', '20170103'),
+                         (2, 1, 2))
+        self.assertEqual(self.schedule.remainingGames('BOS', '20170106'),
+                         (1, 0, 0))
+        self.assertEqual(self.schedule.remainingGames('BOS', '20170501'),
+                         (0, 0, 0))
+        self.assertEqual(self.schedule.remainingGames('LAL', '20170101'),
+                         (1, 1, 0))
+
+    def testBackToBacks(self):
+        self.assertEqual([self.ids(pair) for pair
+                          in self.schedule.backToBacks('BOS', '20170102')],
+                         [['3', '4'], ['4', '5']])
+        self.assertEqual(self.schedule.backToBacks('BOS', '20170106'), [])
+
+    def testNextAndLastGames(self):
+        self.assertEqual(self.ids(self.schedule.nextGames('BOS', '20170103',
+                                                          2)), ['3', '4'])
+        self.assertEqual(self.ids(self.schedule.lastGames('BOS', '20170105')),
+                         ['1', '2'])
+        self.assertEqual(self.ids(self.schedule.regularSeasonGamesFrom(
+            '20170105')), ['4', '5'])
+
+
+def pbpPlay(home_score, away_score, team_id='', person_id='',
+            event_type='1', description='Jump Shot', score_change=True):
+    return {'hTeamScore': str(home_score), 'vTeamScore': str(away_score),
+            'clock': '10:00', 'teamId': team_id, 'personId': person_id,
+            'description': description, 'isScoreChange': score_change,
+            'eventMsgType': event_type}
+
+
+class GameTrackerTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.periods = {1: [], 2: []}
+        self.fetches = []
+        self.tracker = playbyplay.GameTracker('1', 'H', 'A')
+
+    def update(self, current_period):
+        def fetch(period):
+            self.fetches.append(period)
+            return {'plays': list(self.periods[period])}
+
+        return [(e.kind, e.team_id, e.value)
+                for e in self.tracker.update(current_period, fetch)]
+
+    def testRunsAndLeadChanges(self):
+        self.periods[1] = [pbpPlay(2, 0, 'H'), pbpPlay(2, 3, 'A'),
+                           pbpPlay(2, 5, 'A')]
+        self.assertEqual(self.update(1), [('lead_change', 'A', 1)])
+
+        # Only the new plays are processed:
+        self.periods[1] += [pbpPlay(2, 8, 'A'), pbpPlay(4, 8, 'H')]
+        self.assertEqual(self.update(1), [('run', 'A', 8)])
+        self.assertEqual(self.tracker.currentRun(), ('H', 2))
+
+        self.periods[2] = [pbpPlay(7, 8, 'H'), pbpPlay(9, 8, 'H')]
+        self.assertEqual(self.update(2), [('lead_change', 'H', 2)])
+        self.assertEqual(self.tracker.lead_changes, 2)
+        self.assertEqual(self.tracker.currentRun(), ('H', 7))
+        self.assertEqual(len(self.tracker.lastPlays(10)), 7)
+
+        # Finished periods are not fetched again:
+        self.assertEqual(self.update(2), [])
+        self.assertEqual(self.fetches, [1, 1, 1, 2, 2])
+
+    def testFoulOuts(self):
+        foul = pbpPlay('', '', 'H', '7', event_type='6',
+                       description='Personal Foul', score_change=False)
+        technical = dict(foul, description='Technical Foul')
+        self.periods[1] = [foul] * 5 + [technical]
+        self.assertEqual(self.update(1), [])
+
+        self.periods[1] += [foul, foul]
+        self.assertEqual(self.update(1), [('fouled_out', 'H', '7')])
+
+
+def scoreboardGame(game_id, away_score=0, home_score=0, period=1,
+                   end_of_period=False, status_num=2):
+    return {'game_id': game_id, 'away_score': away_score,
+            'home_score': home_score, 'status_num': status_num,
+            'period': {'current': period, 'isEndOfPeriod': end_of_period}}
+
+
+def boxScorePlayers(*players):
+    """Box score of (person id, team id, on court, fouls) players."""
+    return {'stats': {'activePlayers': [
+        {'personId': p, 'teamId': t, 'isOnCourt': c, 'pFouls': str(f)}
+        for (p, t, c, f) in players]}}
+
+
+class ScoreboardDifferTestCase(SupyTestCase):
+    def setUp(self):
+        SupyTestCase.setUp(self)
+        self.differ = scorediff.ScoreboardDiffer()
+        self.notified = []
+        self.differ.addListener(self.notified.append)
+
+    def kinds(self, events):
+        return [(e.kind, e.previous, e.current, e.version) for e in events]
+
+    def testScoreboardEvents(self):
+        self.assertEqual(self.differ.updateScoreboard(
+            [scoreboardGame('1'), scoreboardGame('2')]), [])
+        self.assertEqual(self.differ.version('1'), 0)
+
+        events = self.differ.updateScoreboard(
+            [scoreboardGame('1', 2, 0, 1, True), scoreboardGame('2')])
+        self.assertEqual(self.kinds(events),
+                         [('score', (0, 0), (2, 0), 1),
+                          ('period', (1, False), (1, True), 2)])
+        self.assertEqual(self.differ.version('1'), 2)
+        self.assertEqual(self.differ.version('2'), 0)
+
+        events = self.differ.updateScoreboard(
+            [scoreboardGame('1', 2, 0, 1, True, status_num=3)])
+        self.assertEqual(self.kinds(events), [('status', 2, 3, 3)])
+        self.assertEqual(len(self.notified), 2)
+
+        # Game 2 left the scoreboard and is new again:
+        self.assertIsNone(self.differ.game('2'))
+        self.assertEqual(self.differ.updateScoreboard(
+            [scoreboardGame('2', 5, 5)]), [])
+
+    def testBoxScoreEvents(self):
+        self.differ.updateScoreboard([scoreboardGame('1')])
+        self.assertEqual(self.differ.updateBoxScore(
+            '1', boxScorePlayers(('a', 'H', True, 0), ('b', 'H', False, 2))),
+            [])
+
+        events = self.differ.updateBoxScore(
+            '1', boxScorePlayers(('a', 'H', False, 1), ('b', 'H', True, 2),
+                                 ('c', 'A', True, 1)))
+        self.assertEqual(self.kinds(events),
+                         [('substitution', frozenset('a'), frozenset('bc'),
+                           1),
+                          ('fouls', 0, 1, 2), ('fouls', 0, 1, 3)])
+        self.assertEqual([(e.person_id, e.team_id) for e in events[1:]],
+                         [('a', 'H'), ('c', 'A')])
+
+        # Unknown games are ignored, reset() forgets the rest:
+        self.assertEqual(self.differ.updateBoxScore('2', boxScorePlayers()),
+                         [])
+        self.differ.reset()
+        self.assertEqual(self.differ.version('1'), 0)
+        self.assertEqual(self.differ.updateScoreboard(
+            [scoreboardGame('1', 9, 9)]), [])
+
+
+def bracketSeries(round_number, top_team, bottom_team, top_wins=0,
+                  bottom_wins=0):
+    completed = 4 in (top_wins, bottom_wins)
+    return {'roundNum': str(round_number), 'confName': 'East',
+            'isScheduleAvailable': True, 'isSeriesCompleted': completed,
+            'topRow': {'teamId': top_team, 'seedNum': '1',
+                       'wins': str(top_wins),
+                       'isSeriesWinner': top_wins == 4},
+            'bottomRow': {'teamId': bottom_team, 'seedNum': '8',
+                          'wins': str(bottom_wins),
+                          'isSeriesWinner': bottom_wins == 4}}
+
+
+class BracketGetter(nbastats.NBAStatsGetter):
+    """Getter whose bracket document is self.series; it comes from the
+    HTTP cache unless self.changed is set. Counts the parses.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.series = [bracketSeries(1, '1', '2')]
+        self.changed = True
+        self.parses = 0
+
+    def _playoffBracketEndPointExists(self):
+        return True
+
+    def _playoffBracketURL(self):
+        return 'bracket'
+
+    def _teamIDtoTricodeDict(self):
+        return {'1': 'BOS', '2': 'CHI'}
+
+    def _getJSON(self, url, return_cache_status=False, immutable=False,
+                 refresh=False):
+        (json, from_cache) = ({'series': self.series}, not self.changed)
+        self.changed = False
+        return (json, from_cache) if return_cache_status else json
+
+    def _extractPlayoffBracket(self, json):
+        self.parses += 1
+        return super()._extractPlayoffBracket(json)
+
+
+class PlayoffBracketTestCase(SupyTestCase):
+    def testParsedOnlyWhenTheDocumentChanges(self):
+        getter = BracketGetter()
+        bracket = getter.playoffBracket()
+        self.assertEqual(bracket.conferenceMatchUps(1, 'east')[0].top_team,
+                         'BOS')
+        self.assertIs(getter.playoffBracket(), bracket)
+        self.assertIs(getter.playoffBracket(), bracket)
+        self.assertEqual(getter.parses, 1)
+
+        getter.series = [bracketSeries(1, '1', '2', 4, 1)]
+        getter.changed = True
+        bracket = getter.playoffBracket()
+        self.assertEqual(getter.parses, 2)
+        self.assertTrue(bracket.conferenceMatchUps(1, 'east')[0]
+                        .top_is_winner)
+        self.assertIs(getter.playoffBracket(), bracket)
+        self.assertEqual(getter.parses, 2)
+
+
+class OddsStandingsGetter(nbastats.NBAStatsGetter):
+    """Getter with four teams, whose standings are self.standings
+    ({team id: (wins, losses)}) and with one game left for each.
+    Counts the simulations.
+    """
+
+    CONFERENCES = {'1': 'east', '2': 'east', '3': 'west', '4': 'west'}
+
+    def __init__(self):
+        super().__init__()
+        self.standings = {'1': (40, 30), '2': (35, 35), '3': (50, 20),
+                          '4': (20, 50)}
+        self.simulations = 0
+
+    def _conferenceStandingsURL(self):
+        return 'standings'
+
+    def _getJSON(self, url, return_cache_status=False, immutable=False,
+                 refresh=False):
+        conferences = {'east': [], 'west': []}
+        for (team_id, (wins, losses)) in sorted(self.standings.items()):
+            conferences[self.CONFERENCES[team_id]].append(
+                {'teamId': team_id, 'win': str(wins), 'loss': str(losses)})
+        json = {'league': {'standard': {'conference': conferences}}}
+        return (json, False) if return_cache_status else json
+
+    def _remainingRegularSeasonGames(self):
+        self.simulations += 1
+        return [('1', '2'), ('3', '4')]
+
+    def _teamIDtoTricodeDict(self):
+        return {'1': 'BOS', '2': 'CHI', '3': 'GSW', '4': 'LAL'}
+
+
+@unittest.skipUnless(analytics.isAvailable(), 'NumPy is not installed')
+class PlayoffOddsTestCase(SupyTestCase):
+    def testReusedWhileTheStandingsAreTheSame(self):
+        getter = OddsStandingsGetter()
+        odds = getter.playoffOdds(simulations=100)
+        self.assertEqual([o.team for o in odds['east']], ['BOS', 'CHI'])
+        self.assertIs(getter.playoffOdds(simulations=100), odds)
+        self.assertEqual(getter.simulations, 1)
+
+        getter.standings['2'] = (36, 35)
+        self.assertIsNot(getter.playoffOdds(simulations=100), odds)
+        self.assertEqual(getter.simulations, 2)
+
+        # Different numbers of simulations are different estimates:
+        getter.playoffOdds(simulations=200)
+        self.assertEqual(getter.simulations, 3)
+
+
+def todayGame(game_id, away_team, home_team, away_score=0, home_score=0,
+              period=0, end_of_period=False, clock='', ended=False):
+    """Game of the scoreboard, as NBAStatsGetter.scoreboard() returns
+    them.
+    """
+    return {'game_id': game_id, 'away_team': away_team,
+            'away_team_id': away_team + '_ID', 'home_team': home_team,
+            'home_team_id': home_team + '_ID', 'start_date': '20170301',
+            'start_time': '7:30 PM ET', 'clock': clock,
+            'status_num': 3 if ended else (2 if period else 1),
+            'away_score': away_score, 'home_score': home_score,
+            'ended': ended, 'text_nugget': '',
+            'period': {'current': period, 'isEndOfPeriod': end_of_period,
+                       'isHalftime': False}}
+
+
+class ScoreboardGetter():
+    """Stand-in for NBAStatsGetter with the scoreboard self.games."""
+
+    def __init__(self, games):
+        self.games = games
+
+    def scoreboard(self):
+        return self.games
+
+    def boxScore(self, date, game_id):
+        return boxScorePlayers()
+
+
+class SubscriptionsTestCase(PluginTestCase):
+    plugins = ('NBAStats',)
+
+    SUBSCRIPTIONS = {'#celtics': ['BOS'], '#nba': ['all'],
+                     '#lakers': ['LAL'], '#other': []}
+
+    def setUp(self):
+        PluginTestCase.setUp(self)
+        self.plugin = self.irc.getCallback('NBAStats')
+        self.getter = ScoreboardGetter([todayGame('1', 'BOS', 'CHI'),
+                                        todayGame('2', 'GSW', 'SAS')])
+        self.plugin._stats_getter = self.getter
+
+        for (channel, teams) in self.SUBSCRIPTIONS.items():
+            self.irc.state.channels[channel] = irclib.ChannelState()
+            self.plugin.setRegistryValue('subscriptions', teams, channel,
+                                         self.irc.network)
+
+    def tearDown(self):
+        for channel in self.SUBSCRIPTIONS:
+            self.plugin.setRegistryValue('subscriptions', [], channel,
+                                         self.irc.network)
+        PluginTestCase.tearDown(self)
+
+    def poll(self):
+        """Poll the scoreboard, and return the announcements sent as a
+        dictionary (channel -> list of unformatted messages).
+        """
+        self.plugin._poll_lock.acquire()
+        self.plugin._pollSubscriptions()
+
+        announcements = dict()
+        msg = self.irc.takeMsg()
+        while msg is not None:
+            if msg.command == 'PRIVMSG':
+                announcements.setdefault(msg.args[0], []).append(
+                    ircutils.stripFormatting(msg.args[1]))
+            msg = self.irc.takeMsg()
+        return announcements
+
+    def testAnnouncedOnceToEachSubscribedChannel(self):
+        self.assertEqual(self.poll(), {}) # Games seen for the first time
+
+        self.getter.games = [todayGame('1', 'BOS', 'CHI', 2, 0, 1),
+                             todayGame('2', 'GSW', 'SAS')]
+        tip_off = 'Tip-off: BOS 2 - 0 CHI'
+        self.assertEqual(self.poll(), {'#celtics': [tip_off],
+                                       '#nba': [tip_off]})
+        self.assertEqual(self.poll(), {}) # Nothing changed
+
+        self.getter.games = [todayGame('1', 'BOS', 'CHI', 2, 0, 1),
+                             todayGame('2', 'GSW', 'SAS', 0, 3, 1)]
+        self.assertEqual(self.poll(), {'#nba': ['Tip-off: GSW 0 - 3 SAS']})
+
+    def testFinalScores(self):
+        self.getter.games = [todayGame('1', 'BOS', 'CHI', 98, 97, 4,
+                                       clock='0:01')]
+        self.poll()
+
+        self.getter.games = [todayGame('1', 'BOS', 'CHI', 101, 97, 4,
+                                       end_of_period=True, ended=True)]
+        final = 'Final: BOS 101 - 97 CHI'
+        self.assertEqual(self.poll(), {'#celtics': [final], '#nba': [final]})
+
+
+class ScoresTestCase(PluginTestCase):
+    plugins = ('NBAStats',)
+
+    def setUp(self):
+        PluginTestCase.setUp(self)
+        self.getter = ScoreboardGetter([])
+        self.irc.getCallback('NBAStats')._stats_getter = self.getter
+
+    def testNoGames(self):
+        self.assertResponse('scores', 'There are no games today.')
+
+    def testScores(self):
+        self.getter.games = [
+            todayGame('1', 'BOS', 'CHI', 101, 97, 4, ended=True),
+            todayGame('2', 'GSW', 'SAS', 110, 112, 5, ended=True),
+            todayGame('3', 'LAL', 'DEN', 50, 48, 2, end_of_period=True),
+            todayGame('4', 'NYK', 'MIA', 20, 18, 1, clock='3:12'),
+            todayGame('5', 'POR', 'UTA')]
+
+        reply = self.getMsg('scores').args[1]
+        self.assertEqual(ircutils.stripFormatting(reply),
+                         'BOS 101 @ CHI 97 Final | '
+                         'GSW 110 @ SAS 112 Final/OT1 | '
+                         'LAL 50 @ DEN 48 End Q2 | '
+                         'NYK 20 @ MIA 18 Q1 3:12 | '
+                         'POR @ UTA 7:30 PM ET')
+        # The winners of the games that are over are in bold:
+        self.assertIn(ircutils.bold('BOS 101'), reply)
+        self.assertIn(ircutils.bold('SAS 112'), reply)
+
+
+class ProfilingTestCase(PluginTestCase):
+    plugins = ('NBAStats',)
+
+    def setUp(self):
+        PluginTestCase.setUp(self)
+        self.irc.getCallback('NBAStats')._stats_getter = ScoreboardGetter(
+            [todayGame('1', 'BOS', 'CHI', 2, 0, 1, clock='11:40')])
+
+    def testProfileCommand(self):
+        self.assertNotError('profile scores 2')
+        self.assertResponse('profiling', 'scores (0/2 runs)')
+        self.assertError('profiling scores')
+
+        for _ in range(3):
+            self.assertNotError('scores')
+        reply = ircutils.stripFormatting(
+            self.getMsg('profiling scores').args[1])
+        self.assertRegex(reply, r'^scores \(2/2 runs\): [0-9.]+ ms mean')
+        self.assertGreater(len(reply.split(' | ')), 1) # Top functions
+
+        path = conf.supybot.directories.data.dirize(
+            'NBAStats-profile-scores.prof')
+        self.assertTrue(os.path.exists(path))
+        os.remove(path)
+
+    def testOverlappingRuns(self):
+        from . import profiling
+        profile = profiling.CommandProfile('scores', 2)
+        (started, finish) = (threading.Event(), threading.Event())
+
+        def slow():
+            started.set()
+            finish.wait(5)
+            return 'slow'
+
+        self.assertTrue(profile.claim())
+        thread = threading.Thread(target=profile.run, args=(slow,))
+        thread.start()
+        started.wait(5)
+
+        # Not profiled, and the run is given back:
+        self.assertTrue(profile.claim())
+        self.assertEqual(profile.run(lambda: 'fast'), 'fast')
+        finish.set()
+        thread.join()
+
+        self.assertEqual(len(profile.wall_times), 1)
+        self.assertTrue(profile.claim())
+        profile.run(lambda: None)
+        self.assertTrue(profile.done())
+
+
+class ProfileGetter(nbastats.NBAStatsGetter):
+    """Getter whose player profiles take self.delays[person_id]
+    seconds to fetch, and fail for the players in self.failing.
+    """
+
+    def __init__(self, delays, failing=()):
+        super().__init__()
+        self.delays = delays
+        self.failing = failing
+
+    def _fetchPlayerProfile(self, person_id):
+        time.sleep(self.delays[person_id])
+        if person_id in self.failing:
+            raise requests.ConnectionError(person_id)
+        return person_id
+
+    def _extractPlayerSeasonStats(self, person_id, json):
+        return json
+
+
+class PlayerSeasonStatsTestCase(SupyTestCase):
+    def testSlowProfilesAreLeftOut(self):
+        getter = ProfileGetter({'1': 0, '2': 1, '3': 0, '4': 0},
+                               failing=('4',))
+        start = time.monotonic()
+        stats = getter.playerSeasonStats(['1', '2', '3', '4'], 0.3)
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(list(stats.items()), [('1', '1'), ('3', '3')])
+
+    def testWithoutTimeout(self):
+        getter = ProfileGetter({'1': 0.2, '2': 0})
+        self.assertEqual(list(getter.playerSeasonStats(['1', '2'])),
+                         ['1', '2'])
+
+    def testStringArguments(self):
+        getter = ProfileGetter({'1': 0, '2': 1})
+        output = nbastats.runQuery(getter, 'playerSeasonStats',
+                                   ['1,2', '0.3'])
+        self.assertEqual(output['result'], {'1': '1'})
+
+        stats_service = service.StatsService(getter)
+        (status, body) = stats_service._call(
+            'playerSeasonStats', {'person_ids': '1,2', 'timeout': 'soon'})
+        self.assertEqual(status, 400)
+        (status, body) = stats_service._call(
+            'playerSeasonStats', {'person_ids': '1,2', 'timeout': '0.3'})
+        self.assertEqual((status, json.loads(body.decode('utf-8'))),
+                         (200, {'1': '1'}))
+
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79: